@@ -1,9 +1,12 @@
-import pygame
 import math
 import random
+import numpy as np
+from Gene import Gene, ACCELERATE, DECELERATE, TURN_LEFT, TURN_RIGHT
+from Sensors import RaySensor, FRONT, LEFT, RIGHT
+from Physics import PhysicsConfig
 
 class Car:
-    def __init__(self, x, y, angle=0, color=(255, 0, 0), gene=None):
+    def __init__(self, x, y, angle=0, color=(255, 0, 0), gene=None, sensor=None, policy=None, physics=None):
         self.x = float(x)
         self.y = float(y)
         self.angle = angle
@@ -15,20 +18,30 @@ class Car:
         self.width = 40
         self.height = 20
 
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        pygame.draw.rect(self.image, color, (0, 0, self.width, self.height))
-        self.rect = self.image.get_rect(center=(self.x, self.y))
+        self.color = color
+        self.image = None # Sprite, made on the first draw so cars that are never drawn need no pygame
         self.has_collided_with_wall = False
         self.passed_gates = set() # Store indices of passed gates
         self.score = 0 # Number of gates passed
         self.next_gate_index = 0
         self.time_taken = 0 # Time taken to reach current score
         self.distance_traveled = 0.0 # New attribute for tracking distance
-        self.gene = gene if gene is not None else []
+        self.physics = physics if physics is not None else PhysicsConfig() # Time step, substeps, action repeat and continuous collision
+        self.step_acceleration, self.step_deceleration, self.step_turn, self.step_friction = self.physics.constants(
+            self.acceleration, self.deceleration, self.turn_speed, self.friction)
+        self.impact_time = None # Time (in steps, with the fraction of the step) the car hit a wall
+        self.policy = policy # Optional Policy.MLPPolicy; gene is then the network's genome
+        if policy is None:
+            self.gene = Gene.from_actions(gene if gene is not None else [])
+        else:
+            self.layers = policy.layers(np.asarray(gene)[None])
         self.current_gene_index = 0
         self.is_active = True
         self.old_x = float(x)
         self.old_y = float(y)
+        self.sensor = sensor if sensor is not None else RaySensor()
+        self.observation = None # Wall distances from the sensor, one per ray
+        self.observed_pose = None # Pose the observation was cast from
 
     def reset(self, x, y, angle):
         self.x = float(x)
@@ -36,6 +49,7 @@ class Car:
         self.angle = angle
         self.speed = 0
         self.has_collided_with_wall = False
+        self.impact_time = None
         self.passed_gates = set()
         self.score = 0
         self.next_gate_index = 0
@@ -43,6 +57,8 @@ class Car:
         self.is_active = True
         self.old_x = float(x)
         self.old_y = float(y)
+        self.observation = None
+        self.observed_pose = None
 
     def get_corners(self):
         corners = []
@@ -77,45 +93,77 @@ class Car:
         intersection_point = track.get_ray_intersection_with_track_boundary((self.x, self.y), absolute_ray_angle, ray_length)
         
         if intersection_point:
-            distance = math.sqrt((self.x - intersection_point[0])**2 + (self.y - intersection_point[1])**2)
+            dx = self.x - intersection_point[0]
+            dy = self.y - intersection_point[1]
+            distance = math.sqrt(dx * dx + dy * dy)
             return distance
         return ray_length # No wall detected within ray_length
 
-    def update(self, screen_width, screen_height, track, accelerate, decelerate, turn_left, turn_right):
-        # Store position before update for gate collision check
-        self.old_x, self.old_y = self.x, self.y
+    def observe(self, track):
+        # The sensor's wall distances for the current pose, cast again only when the pose has changed
+        pose = self.sensor.pose(self.x, self.y, self.angle)
+        if pose != self.observed_pose:
+            self.observation = self.sensor.cast(track, *pose)
+            self.observed_pose = pose
+        return self.observation
 
-        if accelerate:
-            self.speed += self.acceleration
-        if decelerate:
-            self.speed -= self.deceleration
-        if turn_left:
-            self.angle += self.turn_speed
-        if turn_right:
-            self.angle -= self.turn_speed
-
-        # Apply friction
-        self.speed *= self.friction
-
-        # Calculate velocity components
-        velocity_x = self.speed * math.cos(math.radians(self.angle))
-        velocity_y = self.speed * -math.sin(math.radians(self.angle)) # Negative because y is inverted
-
-        # Update car's float position
-        self.x += velocity_x
-        self.y += velocity_y
+    def update(self, screen_width, screen_height, track, accelerate, decelerate, turn_left, turn_right):
+        # The actions are held for physics.action_repeat ticks, or until the car crashes
         self.time_taken += 1 # Increment time taken
-        self.distance_traveled += math.sqrt((self.x - self.old_x)**2 + (self.y - self.old_y)**2) # Update distance traveled
+        for tick in range(self.physics.action_repeat):
+            self.tick(track, accelerate, decelerate, turn_left, turn_right, tick)
+            if self.has_collided_with_wall:
+                break
 
-        # Update the car's rect for drawing
-        self.rect.center = (int(self.x), int(self.y))
+    def tick(self, track, accelerate, decelerate, turn_left, turn_right, tick=0):
+        # Store position before update for gate collision check
+        self.old_x, self.old_y = self.x, self.y
+        old_corners = self.get_corners() if self.physics.continuous else None
+
+        h = self.physics.substep_time
+        for _ in range(self.physics.substeps):
+            if accelerate:
+                self.speed += self.step_acceleration
+            if decelerate:
+                self.speed -= self.step_deceleration
+            if turn_left:
+                self.angle += self.step_turn
+            if turn_right:
+                self.angle -= self.step_turn
+
+            # Apply friction
+            self.speed *= self.step_friction
+
+            # Calculate velocity components
+            velocity_x = self.speed * h * math.cos(math.radians(self.angle))
+            velocity_y = self.speed * h * -math.sin(math.radians(self.angle)) # Negative because y is inverted
+
+            # Update car's float position
+            self.x += velocity_x
+            self.y += velocity_y
+
+        # Continuous collision: every corner moves in a straight line, and the car stops where the first one touches a wall
+        start_time = self.time_taken - 1 + tick / self.physics.action_repeat # Time of the tick's start, in steps
+        hit = False
+        if self.physics.continuous:
+            impact = min(track.get_time_of_impact(old, new) for old, new in zip(old_corners, self.get_corners()))
+            hit = impact <= 1
+            if hit:
+                self.x = self.old_x + impact * (self.x - self.old_x)
+                self.y = self.old_y + impact * (self.y - self.old_y)
+                self.impact_time = start_time + impact / self.physics.action_repeat
+        dx = self.x - self.old_x
+        dy = self.y - self.old_y
+        self.distance_traveled += math.sqrt(dx * dx + dy * dy) # Update distance traveled
 
         # Check for collisions with track boundaries
         corners = self.get_corners()
         for corner in corners:
-            if not track.is_on_track(corner):
+            if hit or not track.is_on_track(corner):
                 self.has_collided_with_wall = True # Set flag on collision with track boundary
                 self.is_active = False # Car becomes inactive on collision
+                if self.impact_time is None:
+                    self.impact_time = start_time + 1 / self.physics.action_repeat
                 break
 
         self.check_gate_collision(track)
@@ -131,7 +179,10 @@ class Car:
         return ccw(p1, p3, p4) != ccw(p2, p3, p4) and ccw(p1, p2, p3) != ccw(p1, p2, p4)
 
     def check_gate_collision(self, track):
-        if self.next_gate_index < len(track.gates):
+        # A tick longer than a frame can cross several gates, so after passing one the next is checked too
+        for _ in range(len(track.gates) if self.physics.dt > 1 else 1):
+            if self.next_gate_index >= len(track.gates):
+                break
             gate = track.gates[self.next_gate_index]
             gate_p1, gate_p2 = gate
 
@@ -143,16 +194,46 @@ class Car:
             if self.line_segment_intersect(car_prev_pos, car_current_pos, gate_p1, gate_p2):
                 self.score += 1
                 self.next_gate_index = (self.next_gate_index + 1) % len(track.gates) # Loop gates
-        
+            else:
+                break
+
         # Update old_x and old_y for the next frame
         self.old_x = self.x
         self.old_y = self.y
 
+    def get_relative_gate_angle(self, track):
+        next_gate = track.gates[self.next_gate_index]
+        gate_center_x = (next_gate[0][0] + next_gate[1][0]) / 2
+        gate_center_y = (next_gate[0][1] + next_gate[1][1]) / 2
+
+        # Calculate angle to the next gate
+        angle_to_gate = math.degrees(math.atan2(self.y - gate_center_y, gate_center_x - self.x))
+
+        # Normalize angles to be within -180 to 180
+        relative_angle = (angle_to_gate - self.angle + 360) % 360
+        if relative_angle > 180:
+            relative_angle -= 360
+        return relative_angle
+
+    def decide_policy_actions(self, track):
+        # The network picks every action; the episode ends after policy.episode_steps steps
+        if self.current_gene_index >= self.policy.episode_steps:
+            return False, False, False, False
+        inputs = self.policy.observation(self.observe(track)[None], self.sensor.ray_length,
+                                         np.array([self.get_relative_gate_angle(track)]))
+        code = int(self.policy.act(self.layers, [0], inputs)[0])
+        self.current_gene_index += 1
+        return bool(code & ACCELERATE), bool(code & DECELERATE), bool(code & TURN_LEFT), bool(code & TURN_RIGHT)
+
     def decide_actions(self, track):
+        if self.policy is not None:
+            return self.decide_policy_actions(track)
+
         # Get distances to walls in different directions
-        distance_front = self.get_distance_to_wall(track, 0) # Directly in front
-        distance_left = self.get_distance_to_wall(track, 45) # 45 degrees to the left
-        distance_right = self.get_distance_to_wall(track, -45) # 45 degrees to the right
+        observation = self.observe(track)
+        distance_front = observation[self.sensor.column(FRONT)] # Directly in front
+        distance_left = observation[self.sensor.column(LEFT)] # 45 degrees to the left
+        distance_right = observation[self.sensor.column(RIGHT)] # 45 degrees to the right
 
         accelerate = True
         decelerate = False
@@ -175,17 +256,7 @@ class Car:
         
         # Gate optimization: try to steer towards the next gate, but don't override wall avoidance
         if not (turn_left or turn_right) and self.next_gate_index < len(track.gates):
-            next_gate = track.gates[self.next_gate_index]
-            gate_center_x = (next_gate[0][0] + next_gate[1][0]) / 2
-            gate_center_y = (next_gate[0][1] + next_gate[1][1]) / 2
-
-            # Calculate angle to the next gate
-            angle_to_gate = math.degrees(math.atan2(self.y - gate_center_y, gate_center_x - self.x))
-            
-            # Normalize angles to be within -180 to 180
-            relative_angle = (angle_to_gate - self.angle + 360) % 360
-            if relative_angle > 180:
-                relative_angle -= 360
+            relative_angle = self.get_relative_gate_angle(track)
 
             # Adjust turning based on angle to gate
             if relative_angle > 10: # Gate is to the left
@@ -199,7 +270,11 @@ class Car:
 
         # For now, still use the gene for actions, but allow the above logic to override
         # In a full GA, the gene would evolve to incorporate these behaviors.
-        gene_accelerate, gene_decelerate, gene_turn_left, gene_turn_right = self.gene[self.current_gene_index]
+        code = int(self.gene.codes[self.current_gene_index])
+        gene_accelerate = bool(code & ACCELERATE)
+        gene_decelerate = bool(code & DECELERATE)
+        gene_turn_left = bool(code & TURN_LEFT)
+        gene_turn_right = bool(code & TURN_RIGHT)
         self.current_gene_index += 1
 
         # Combine gene actions with AI actions (AI overrides if necessary)
@@ -217,6 +292,10 @@ class Car:
         return final_accelerate, final_decelerate, final_turn_left, final_turn_right
 
     def draw(self, screen):
+        import pygame
+        if self.image is None:
+            self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+            pygame.draw.rect(self.image, self.color, (0, 0, self.width, self.height))
         rotated_car = pygame.transform.rotate(self.image, self.angle)
-        rotated_rect = rotated_car.get_rect(center=self.rect.center)
+        rotated_rect = rotated_car.get_rect(center=(int(self.x), int(self.y)))
         screen.blit(rotated_car, rotated_rect.topleft)
\ No newline at end of file
@@ -0,0 +1,173 @@
+import json
+import os
+import struct
+import tempfile
+import threading
+import numpy as np
+from Gene import Gene
+from Policy import MLPPolicy, GENOME_DTYPE
+from Sensors import RaySensor
+
+# File layout: magic, format version, header length, JSON header, zero padding up to a
+# DATA_ALIGNMENT boundary, then every gene back to back: uint8 action codes, or float32 weights when the
+# evolution state names a network policy.
+MAGIC = b"RLRACER\0"
+VERSION = 1
+PREAMBLE = struct.Struct("<8sII")
+DATA_ALIGNMENT = 64
+
+def _data_offset(header_length):
+    return -(-(PREAMBLE.size + header_length) // DATA_ALIGNMENT) * DATA_ALIGNMENT
+
+def evolution_state(evolution):
+    # Everything the genetic algorithm needs to carry on where it left off
+    return {
+        "num_cars": evolution.num_cars,
+        "initial_gene_length": evolution.initial_gene_length,
+        "gene_length": evolution.gene_length,
+        "generation_number": evolution.generation_number,
+        "last_best_score": evolution.last_best_score,
+        "generations_since_last_improvement": evolution.generations_since_last_improvement,
+        "dynamic_mutation_rate": evolution.dynamic_mutation_rate,
+        "mutation_rate_preserved": evolution.mutation_rate_preserved,
+        "rng_state": evolution.rng.bit_generator.state,
+        "policy": evolution.policy.config() if evolution.policy is not None else None,
+    }
+
+def restore_evolution(evolution, state):
+    evolution.num_cars = state["num_cars"]
+    evolution.initial_gene_length = state["initial_gene_length"]
+    evolution.gene_length = state["gene_length"]
+    evolution.generation_number = state["generation_number"]
+    evolution.last_best_score = state["last_best_score"]
+    evolution.generations_since_last_improvement = state["generations_since_last_improvement"]
+    evolution.dynamic_mutation_rate = state["dynamic_mutation_rate"]
+    evolution.mutation_rate_preserved = state["mutation_rate_preserved"]
+    evolution.rng.bit_generator.state = state["rng_state"]
+    policy = state.get("policy") # Absent from checkpoints written before network policies existed
+    evolution.policy = MLPPolicy.from_config(policy) if policy else None
+
+def track_params(track):
+    params = {"width": track.width, "height": track.height, "car_width": track.car_width, "grid_cell_size": track.grid_cell_size}
+    if track.definition is not None:
+        params["definition"] = track.definition
+    return params
+
+def run_settings(physics=None, sensor=None, pruning=None):
+    # (physics, sensor, pruning) configs for save_checkpoint. A network genome only means the same with the
+    # sensor it was trained with, and pruning decides which rollouts the best score came from.
+    return (physics.config() if physics is not None else None, (sensor if sensor is not None else RaySensor()).config(),
+            pruning.config() if pruning is not None else None)
+
+def save_checkpoint(path, state, genes, params, physics=None, sensor=None, pruning=None):
+    # state and params come from evolution_state and track_params; physics, sensor and pruning from run_settings,
+    # where pruning None means none was used. Writes to a temporary file in the same directory and renames it
+    # over path, so readers only ever see a complete checkpoint.
+    lengths = [len(gene) for gene in genes]
+    header = {
+        "evolution": state,
+        "track": params,
+        "gene_lengths": lengths,
+    }
+    if physics is not None:
+        header["physics"] = physics
+    if sensor is not None:
+        header["sensor"] = sensor
+    header["pruning"] = pruning
+    header_bytes = json.dumps(header).encode("utf-8")
+    data_offset = _data_offset(len(header_bytes))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            f.write(b"\0" * (data_offset - PREAMBLE.size - len(header_bytes)))
+            for gene in genes:
+                f.write(np.ascontiguousarray(gene.codes if isinstance(gene, Gene) else gene).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def load_checkpoint(path):
+    # Returns (header, genes). Gene codes (or network genomes) are copy-on-write memory maps of the file,
+    # so nothing is read until a step is actually used.
+    with open(path, "rb") as f:
+        magic, version, header_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a checkpoint file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported checkpoint version {version} (expected {VERSION})")
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    data_offset = _data_offset(header_length)
+
+    lengths = header["gene_lengths"]
+    networks = bool(header["evolution"].get("policy"))
+    if sum(lengths):
+        dtype = GENOME_DTYPE if networks else np.uint8
+        codes = np.memmap(path, dtype=dtype, mode="c", offset=data_offset, shape=(sum(lengths),))
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        genes = [codes[start:end] if networks else Gene(codes[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
+    else:
+        genes = [Gene() for _ in lengths]
+    return header, genes
+
+class Checkpointer:
+    # Simulator observer that checkpoints every `every` generations from a background thread.
+    # Submitting never blocks: if a write is still in progress, the newest pending state replaces any
+    # older one that has not been written yet.
+    def __init__(self, path, every=10):
+        self.path = path
+        self.every = every
+        self.pending = None
+        self.condition = threading.Condition()
+        self.write_lock = threading.Lock() # Keeps a synchronous save from racing an older background one
+        self.closed = False
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+
+    def on_generation(self, simulator, genes):
+        if self.every and simulator.generation_number % self.every == 0:
+            self.submit(simulator.evolution, genes, simulator.track, simulator.physics, simulator.sensor, simulator.pruning)
+
+    def submit(self, evolution, genes, track, physics=None, sensor=None, pruning=None):
+        # Evolution state is captured now; genes are never modified once created, so they are shared as is
+        with self.condition:
+            self.pending = (evolution_state(evolution), list(genes), track_params(track), run_settings(physics, sensor, pruning))
+            self.condition.notify()
+
+    def save_now(self, evolution, genes, track, physics=None, sensor=None, pruning=None):
+        # Synchronous save, e.g. when the simulation is shutting down
+        with self.condition:
+            self.pending = None
+        with self.write_lock:
+            save_checkpoint(self.path, evolution_state(evolution), genes, track_params(track), *run_settings(physics, sensor, pruning))
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+                if self.pending is None:
+                    return
+                state, genes, params, settings = self.pending
+                self.pending = None
+            try:
+                with self.write_lock:
+                    save_checkpoint(self.path, state, genes, params, *settings)
+            except Exception as e:
+                self.error = e
+                print(f"Checkpoint failed: {e}")
+
+    def close(self):
+        # Finishes any pending write
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.thread.join()
@@ -0,0 +1,67 @@
+import math
+import numpy as np
+
+class EdgeBands:
+    # Horizontal bands over a polygon's edges for the crossing-number test in Track.point_in_polygon.
+    # An edge only counts for points with min_y < y <= max_y, so a point only needs the edges whose
+    # y range overlaps its band; the result is the same as testing every edge, at a cost that depends
+    # on how busy the band is rather than on the polygon's vertex count.
+    def __init__(self, edges, band_height):
+        self.p1x, self.p1y, self.p2x, self.p2y = (np.asarray(values, dtype=float) for values in edges)
+        self.band_height = float(band_height)
+        self.min_y = np.minimum(self.p1y, self.p2y)
+        self.max_y = np.maximum(self.p1y, self.p2y)
+        self.max_x = np.maximum(self.p1x, self.p2x)
+        self.origin_y = self.min_y.min()
+        self.count = int(math.floor((self.max_y.max() - self.origin_y) / self.band_height)) + 1
+
+        first = np.floor((self.min_y - self.origin_y) / self.band_height).astype(np.int64)
+        last = np.floor((self.max_y - self.origin_y) / self.band_height).astype(np.int64)
+        bands = [[] for _ in range(self.count)]
+        for index in range(len(first)):
+            for band in range(first[index], last[index] + 1):
+                bands[band].append(index)
+
+        # Per-band edge tuples for the scalar test, and a padded (bands, max_per_band) table where -1 marks empty slots
+        p1x, p1y, p2x, p2y = self.p1x.tolist(), self.p1y.tolist(), self.p2x.tolist(), self.p2y.tolist()
+        self.band_edges = [tuple((p1x[i], p1y[i], p2x[i], p2y[i]) for i in band) for band in bands]
+        self.band_counts = np.array([len(band) for band in bands], dtype=np.int64)
+        self.table = np.full((self.count, max(self.band_counts.max(), 1)), -1, dtype=np.int64)
+        for band, indices in enumerate(bands):
+            self.table[band, :len(indices)] = indices
+
+    def contains(self, point):
+        # Same crossing rule as Track.point_in_polygon
+        x, y = point
+        band = math.floor((y - self.origin_y) / self.band_height)
+        if not 0 <= band < self.count:
+            return False
+        inside = False
+        for p1x, p1y, p2x, p2y in self.band_edges[band]:
+            if y > min(p1y, p2y) and y <= max(p1y, p2y) and x <= max(p1x, p2x):
+                if p1x == p2x or x <= (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x:
+                    inside = not inside
+        return inside
+
+    def contains_batch(self, xs, ys, chunk_size=4096):
+        # Batched contains for arrays of x and y coordinates
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        inside = np.zeros(len(xs), dtype=bool)
+        bands = np.floor((ys - self.origin_y) / self.band_height)
+        in_range = (bands >= 0) & (bands < self.count)
+        bands = np.where(in_range, bands, 0).astype(np.int64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for start in range(0, len(xs), chunk_size):
+                band = bands[start:start + chunk_size]
+                width = max(self.band_counts[band].max(initial=0), 1)
+                candidates = self.table[band, :width]
+                edge = np.maximum(candidates, 0)
+                p1x, p1y, p2x, p2y = self.p1x[edge], self.p1y[edge], self.p2x[edge], self.p2y[edge]
+                x = xs[start:start + chunk_size, None]
+                y = ys[start:start + chunk_size, None]
+                xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+                crossings = ((candidates >= 0) & (y > self.min_y[edge]) & (y <= self.max_y[edge]) & (x <= self.max_x[edge]) &
+                             ((p1x == p2x) | (x <= xinters)))
+                inside[start:start + chunk_size] = np.count_nonzero(crossings, axis=1) % 2 == 1
+        return inside & in_range
@@ -0,0 +1,196 @@
+import math
+import multiprocessing
+import numpy as np
+from Population import Population
+from Track import Track
+
+REDUCERS = ("mean", "min", "max", "median") # Or pN for the Nth percentile
+
+# Per-process state, set once by _init_worker and reused by every task the worker runs
+_worker_track = None
+_worker_start_pose = None
+_worker_car_size = None
+_worker_sensor = None
+_worker_tracks = None # Multi-track workers only
+_worker_track_params = None
+_worker_occupancy = None
+_worker_cache_dir = None
+
+def _init_worker(track, car_size, sensor):
+    global _worker_track, _worker_start_pose, _worker_car_size, _worker_sensor
+    _worker_track = track
+    _worker_start_pose = track.get_start_pose()
+    _worker_car_size = car_size
+    _worker_sensor = sensor # Each worker keeps its own copy, and its own memo in quantized mode
+
+def _init_multi_track_worker(track_params, occupancy_resolution, cache_dir, car_size, sensor):
+    global _worker_tracks, _worker_track_params, _worker_occupancy, _worker_cache_dir, _worker_car_size, _worker_sensor
+    _worker_tracks = {} # Track index -> (track, start pose), built the first time a task needs it
+    _worker_track_params = track_params
+    _worker_occupancy = occupancy_resolution
+    _worker_cache_dir = cache_dir
+    _worker_car_size = car_size
+    _worker_sensor = sensor
+
+def _worker_track_for(index):
+    entry = _worker_tracks.get(index)
+    if entry is None:
+        # Geometry and occupancy come from the disk cache when the main process built them already
+        track = Track(**_worker_track_params[index], cache_dir=_worker_cache_dir)
+        if _worker_occupancy:
+            track.build_occupancy(_worker_occupancy, cache_dir=_worker_cache_dir)
+        entry = _worker_tracks[index] = (track, track.get_start_pose())
+    return entry
+
+def _evaluate_track_chunk(task):
+    index, start, genes, max_steps, pruning, policy, physics = task
+    track, (x, y, angle) = _worker_track_for(index)
+    population = Population(track, genes, x, y, angle, *_worker_car_size, pruning, None, _worker_sensor, policy, physics)
+    return index, start, population.run(max_steps)
+
+def _evaluate_chunk(task):
+    genes, max_steps, pruning, best_score, policy, physics = task
+    x, y, angle = _worker_start_pose
+    population = Population(_worker_track, genes, x, y, angle, *_worker_car_size, pruning, best_score, _worker_sensor,
+                            policy, physics)
+    return population.run(max_steps)
+
+class ProcessPoolEvaluator:
+    # Evaluates a generation's rollouts across worker processes.
+    # Cars never interact, so splitting the genes into contiguous chunks and stepping each chunk as its
+    # own Population gives exactly the same fitness tuples as stepping them all together.
+    def __init__(self, track, workers=None, chunks_per_worker=2, car_width=40, car_height=20, sensor=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunks_per_worker = chunks_per_worker
+        # The track is handed to each worker once, when the pool starts, rather than with every task
+        self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(track, (car_width, car_height), sensor))
+
+    def evaluate(self, genes, max_steps=None, pruning=None, best_score=None, policy=None, physics=None):
+        # Returns one (score, distance_traveled, time_taken, current_gene_index, collided, pruned) tuple per gene, in order
+        num_chunks = max(1, min(len(genes), self.workers * self.chunks_per_worker))
+        bounds = [len(genes) * i // num_chunks for i in range(num_chunks + 1)]
+        tasks = [(genes[start:end], max_steps, pruning, best_score, policy, physics) for start, end in zip(bounds, bounds[1:])]
+        fitness = []
+        for chunk in self.pool.map(_evaluate_chunk, tasks):
+            fitness.extend(chunk)
+        return fitness
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def make_reducer(name):
+    # Combines a genome's values across tracks: mean, min (its worst track), max, median, or pN for the
+    # Nth percentile, e.g. p25 for the value it reaches on three tracks out of four
+    if name == "mean":
+        return lambda values: float(np.mean(values))
+    if name == "min":
+        return min
+    if name == "max":
+        return max
+    if name == "median":
+        return lambda values: float(np.median(values))
+    if name.startswith("p"):
+        try:
+            q = float(name[1:])
+        except ValueError:
+            q = None
+        if q is not None and 0 <= q <= 100:
+            return lambda values: float(np.percentile(values, q))
+    raise ValueError(f"Unknown track reducer {name!r} (expected one of {', '.join(REDUCERS)} or pN with 0 <= N <= 100)")
+
+def combine_fitness(results, reduce):
+    # One fitness tuple from a genome's per-track tuples. Score and distance go through the reducer and
+    # time is averaged; it only breaks ties. The genome counts as collided or pruned if it was on any track,
+    # and its gene index is the earliest point where a track stopped it, so the elite's protected prefix is
+    # the part of its gene that drove every track.
+    stopped = [result[3] for result in results if result[4] or result[5]]
+    gene_index = min(stopped) if stopped else max(result[3] for result in results)
+    return (reduce([result[0] for result in results]), reduce([result[1] for result in results]),
+            float(np.mean([result[2] for result in results])), gene_index,
+            any(result[4] for result in results), any(result[5] for result in results))
+
+def lap_length(track):
+    points = np.array(track.center_points)
+    return float(np.hypot(*(np.roll(points, -1, axis=0) - points).T).sum())
+
+class MultiTrackEvaluator:
+    # Scores every genome on a set of tracks and combines its per-track fitness with a reducer (see
+    # make_reducer), so genes are selected for driving all of them rather than one.
+    # Every (track, chunk of genes) rollout is a task of its own. Tasks are handed out one at a time,
+    # largest first, to whichever worker is free: the long rollouts start right away and the short ones fill
+    # in around them, so no worker sits idle while one long track holds up the generation. A task's size is
+    # estimated from the car-steps its track took in the previous generation, or from the track's lap length
+    # in the first one. Workers get only the track parameters and build each track the first time one of its
+    # tasks arrives, then keep it. With workers=0 the tasks run in this process instead, one per track.
+    # Elite-bound pruning is not applied: the best combined score says nothing about a single track.
+    def __init__(self, tracks, reducer="mean", workers=None, chunks_per_worker=2, car_width=40, car_height=20, sensor=None,
+                 occupancy_resolution=0, cache_dir=None):
+        self.tracks = tracks
+        self.reducer = reducer
+        self.reduce = make_reducer(reducer)
+        self.workers = multiprocessing.cpu_count() if workers is None else workers
+        self.chunks_per_worker = chunks_per_worker
+        self.car_size = (car_width, car_height)
+        self.sensor = sensor
+        self.costs = [lap_length(track) for track in tracks] # Estimated work of scoring the whole generation per track
+        self.pool = None
+        if self.workers:
+            track_params = [{"width": track.width, "height": track.height, "car_width": track.car_width,
+                             "grid_cell_size": track.grid_cell_size, "definition": track.definition} for track in tracks]
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_multi_track_worker,
+                                             initargs=(track_params, occupancy_resolution, cache_dir, self.car_size, sensor))
+
+    def tasks(self, genes, max_steps, pruning, policy, physics):
+        # (track index, first gene, genes, ...) tasks, largest estimated cost first
+        if self.pool is None:
+            chunks = 1 # One Population per track steps the most cars per batched call
+        else:
+            chunks = max(1, min(len(genes), math.ceil(self.workers * self.chunks_per_worker / len(self.tracks))))
+        bounds = [len(genes) * i // chunks for i in range(chunks + 1)]
+        tasks = []
+        for index in range(len(self.tracks)):
+            for start, end in zip(bounds, bounds[1:]):
+                if end > start:
+                    tasks.append((self.costs[index] * (end - start), (index, start, genes[start:end], max_steps, pruning, policy, physics)))
+        tasks.sort(key=lambda task: task[0], reverse=True)
+        return [task for _, task in tasks]
+
+    def evaluate(self, genes, max_steps=None, pruning=None, best_score=None, policy=None, physics=None):
+        # Returns one combined (score, distance_traveled, time_taken, current_gene_index, collided, pruned) tuple per gene, in order
+        tasks = self.tasks(genes, max_steps, pruning, policy, physics)
+        per_track = [[None] * len(genes) for _ in self.tracks]
+        if self.pool is None:
+            results = (self._evaluate_here(task) for task in tasks)
+        else:
+            results = self.pool.imap_unordered(_evaluate_track_chunk, tasks, chunksize=1)
+        for index, start, fitness in results:
+            per_track[index][start:start + len(fitness)] = fitness
+        for index, fitness in enumerate(per_track):
+            self.costs[index] = max(1, sum(car[2] for car in fitness))
+        return [combine_fitness([fitness[i] for fitness in per_track], self.reduce) for i in range(len(genes))]
+
+    def _evaluate_here(self, task):
+        index, start, genes, max_steps, pruning, policy, physics = task
+        track = self.tracks[index]
+        x, y, angle = track.get_start_pose()
+        population = Population(track, genes, x, y, angle, *self.car_size, pruning, None, self.sensor, policy, physics)
+        return index, start, population.run(max_steps)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
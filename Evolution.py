@@ -0,0 +1,102 @@
+import math
+import numpy as np
+from Gene import Gene, ACCELERATE
+from offspring import mutation_schedule, make_offspring, make_policy_offspring
+
+class Evolution:
+    def __init__(self, num_cars=10, initial_gene_length=1000, gene_length=5000, seed=None, policy=None):
+        self.num_cars = num_cars
+        self.policy = policy # Optional Policy.MLPPolicy; genes are then network genomes instead of action tapes
+        self.initial_gene_length = initial_gene_length
+        self.gene_length = gene_length # Length used once the first generation has been evaluated
+        self.gene_length_step = 1000 # Growth when the elite runs out of gene
+        self.max_gene_length = 100000
+        self.generation_number = 1
+        self.last_best_score = -1 # Track the best score from previous generations
+        self.generations_since_last_improvement = 0 # Track generations without score improvement
+        self.rng = np.random.default_rng(seed)
+
+        # Mutation schedule
+        self.base_mutation_rate = 0.05
+        self.max_mutation_rate = 0.7 # Increased max mutation rate
+        self.mutation_increase_factor = 0.05 # Increased how much mutation increases per stuck generation
+        self.dynamic_mutation_rate = self.base_mutation_rate
+        self.mutation_rate_preserved = 0.02
+        self.parent_fraction = 0.25 # Share of the ranked cars that network genomes are crossed with
+
+    def scale_gene_lengths(self, frames_per_step):
+        # Genes hold one action per step. When a step covers several frames (see PhysicsConfig.step_time),
+        # the same driving time takes proportionally fewer steps.
+        for name in ("initial_gene_length", "gene_length", "gene_length_step", "max_gene_length"):
+            setattr(self, name, max(1, math.ceil(getattr(self, name) / frames_per_step)))
+
+    def initial_genes(self):
+        # Initial generation: create cars with random genes
+        if self.policy is not None:
+            return [self.policy.random_genome(self.rng) for _ in range(self.num_cars)]
+        genes = []
+        for _ in range(self.num_cars):
+            gene = Gene.random(self.initial_gene_length, self.rng)
+
+            # Ensure initial forward movement for the first action
+            gene.codes[0] = ACCELERATE
+            genes.append(gene)
+        return genes
+
+    def next_generation(self, genes, fitness):
+        # fitness holds one (score, distance_traveled, time_taken, current_gene_index, collided, pruned) tuple per car
+        # Sort cars by score to select the best
+        order = sorted(range(len(genes)), key=lambda i: (fitness[i][0], fitness[i][1]), reverse=True)
+        best = order[0]
+        best_gene = genes[best]
+        score, distance_traveled, time_taken, current_gene_index, collided, pruned = fitness[best]
+        print(f"Best car score: {score} gates, {distance_traveled:.2f} distance")
+
+        # Adjust score to heavily penalize not passing gates and reward faster completion
+        adjusted_score = score * 1000000 - time_taken # Gates are worth much more, time taken is subtracted
+
+        if adjusted_score > self.last_best_score:
+            self.last_best_score = adjusted_score
+            self.generations_since_last_improvement = 0
+        else:
+            self.generations_since_last_improvement += 1
+
+        # Adjust mutation rate based on improvement
+        dynamic_mutation_rate = self.base_mutation_rate + (self.generations_since_last_improvement * self.mutation_increase_factor)
+        if self.generations_since_last_improvement >= 1: # Trigger earlier
+            dynamic_mutation_rate += 0.1 # Additional jump for sustained lack of improvement
+        if dynamic_mutation_rate > self.max_mutation_rate:
+            dynamic_mutation_rate = self.max_mutation_rate
+        self.dynamic_mutation_rate = dynamic_mutation_rate
+
+        # If stuck for too long, increase preserved mutation rate slightly
+        mutation_rate_preserved = 0.02 # Increased preserved mutation rate
+        if self.generations_since_last_improvement > 1: # Trigger earlier
+            mutation_rate_preserved = 0.05 # Increase preserved mutation slightly
+        self.mutation_rate_preserved = mutation_rate_preserved
+
+        rates = mutation_schedule(self.num_cars, dynamic_mutation_rate, self.max_mutation_rate)
+        if self.policy is not None:
+            # Networks have no collision point to protect: the elite is crossed with the best ranked cars
+            num_parents = max(2, int(round(self.num_cars * self.parent_fraction)))
+            new_genes = make_policy_offspring(self.policy, [genes[i] for i in order[:num_parents]], rates, self.rng)
+            self.generation_number += 1
+            return new_genes
+
+        # Determine the point up to which the best car successfully navigated
+        # This is the length of its gene that was actually executed before it became inactive
+        # If the best car completed its gene, then the collision_point is the full gene length
+        collision_point = current_gene_index
+        if not collided and not pruned: # A pruned car stopped making progress here, like a collision
+            if current_gene_index >= len(best_gene): # If car became inactive due to gene running out
+                # If the best car ran out of gene, increase gene_length for next generation
+                self.gene_length = min(self.gene_length + self.gene_length_step, self.max_gene_length) # Increase gene length, with a cap
+            collision_point = len(best_gene) # Car ran out of gene or the generation was skipped
+
+        # Elitism: Carry over the best car without mutation
+        # Truncate the best car's gene to its effective length
+        effective_gene = best_gene[:collision_point]
+        new_genes = make_offspring(effective_gene, collision_point, self.gene_length, rates, mutation_rate_preserved, self.rng)
+
+        self.generation_number += 1
+        return new_genes
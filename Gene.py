@@ -0,0 +1,66 @@
+import numpy as np
+
+# Bit assigned to each action in an encoded gene step
+ACCELERATE = 1
+DECELERATE = 2
+TURN_LEFT = 4
+TURN_RIGHT = 8
+NUM_CODES = 16 # Every combination of the four action bits
+
+class Gene:
+    # Action tape stored as one uint8 per step, holding the four action bits.
+    # Indexing a single step returns the (accelerate, decelerate, turn_left, turn_right) tuple the
+    # list-of-tuples genes used; slices return independent Gene copies, like list slices.
+    def __init__(self, codes=None):
+        if codes is None:
+            codes = np.zeros(0, dtype=np.uint8)
+        self.codes = np.asarray(codes, dtype=np.uint8)
+
+    @classmethod
+    def from_actions(cls, actions):
+        # Builds a gene from a sequence of 4-tuples of bools
+        if isinstance(actions, Gene):
+            return actions
+        if len(actions) == 0:
+            return cls()
+        bits = np.asarray(actions, dtype=bool)
+        if bits.ndim != 2 or bits.shape[1] != 4:
+            # A flat sequence would otherwise be regrouped into quads of bools; action codes go through Gene(codes)
+            raise ValueError(f"Expected a sequence of 4-tuples of actions, got shape {bits.shape}")
+        return cls(bits @ np.array([ACCELERATE, DECELERATE, TURN_LEFT, TURN_RIGHT], dtype=np.uint8))
+
+    @classmethod
+    def random(cls, length, rng):
+        # Each action bit is an independent coin flip, so every code is equally likely
+        return cls(rng.integers(0, NUM_CODES, length, dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Gene(self.codes[index].copy())
+        code = int(self.codes[index])
+        return (bool(code & ACCELERATE), bool(code & DECELERATE), bool(code & TURN_LEFT), bool(code & TURN_RIGHT))
+
+    def __setitem__(self, index, action):
+        accelerate, decelerate, turn_left, turn_right = action
+        self.codes[index] = accelerate * ACCELERATE + decelerate * DECELERATE + turn_left * TURN_LEFT + turn_right * TURN_RIGHT
+
+    def __eq__(self, other):
+        return isinstance(other, Gene) and np.array_equal(self.codes, other.codes)
+
+    def __repr__(self):
+        return f"Gene(length={len(self)})"
+
+    def copy(self):
+        return Gene(self.codes.copy())
+
+def stack_genes(genes):
+    # Packs genes into a (num_genes, max_length) uint8 matrix plus each gene's length; short genes are zero padded
+    genes = [Gene.from_actions(gene) for gene in genes]
+    lengths = np.array([len(gene) for gene in genes], dtype=np.int64)
+    codes = np.zeros((len(genes), max(lengths.max(initial=0), 1)), dtype=np.uint8)
+    for i, gene in enumerate(genes):
+        codes[i, :len(gene)] = gene.codes
+    return codes, lengths
@@ -0,0 +1,156 @@
+import contextlib
+import copy
+import io
+import multiprocessing
+import time
+import traceback
+import numpy as np
+from Simulator import Simulator
+
+TOPOLOGIES = ("ring", "full")
+
+def migration_targets(topology, islands):
+    # For every island, the islands its migrants are sent to
+    if topology == "ring":
+        return [[(i + 1) % islands] if islands > 1 else [] for i in range(islands)]
+    if topology == "full":
+        return [[j for j in range(islands) if j != i] for i in range(islands)]
+    raise ValueError(f"Unknown migration topology {topology!r} (expected one of {', '.join(TOPOLOGIES)})")
+
+def _island_main(conn, index, track, evolution, pruning, sensor, physics, prefix_cache):
+    # Runs one island: its own simulator and its own copy of the evolution state, stepped a batch of
+    # generations at a time on the coordinator's request
+    try:
+        simulator = Simulator(track, evolution=evolution, pruning=pruning, sensor=sensor)
+        simulator.physics = physics
+        simulator.prefix_cache = prefix_cache # Every island fills its own
+        genes = evolution.initial_genes()
+        first_lap = None
+        best = None
+        while True:
+            message = conn.recv()
+            if message[0] == "stop":
+                conn.send(("stopped", best))
+                return
+            _, generations, migrants, incoming = message
+            # Migrants take the places of the most heavily mutated children; the elite stays first
+            incoming = incoming[:len(genes) - 1]
+            if incoming:
+                genes = genes[:len(genes) - len(incoming)] + list(incoming)
+            history = []
+            for _ in range(generations):
+                generation = evolution.generation_number
+                fitness = simulator.run_generation(genes)
+                order = sorted(range(len(genes)), key=lambda i: (fitness[i][0], fitness[i][1]), reverse=True)
+                history.append(fitness[order[0]])
+                if first_lap is None and fitness[order[0]][0] >= len(track.gates):
+                    first_lap = (generation, time.monotonic())
+                if best is None or (fitness[order[0]][0], fitness[order[0]][1]) > (best[1][0], best[1][1]):
+                    best = (genes[order[0]], fitness[order[0]])
+                top = [genes[i] for i in order[:migrants]]
+                with contextlib.redirect_stdout(io.StringIO()): # The coordinator reports for every island
+                    genes = evolution.next_generation(genes, fitness)
+            conn.send(("done", {"island": index, "history": history, "migrants": top, "first_lap": first_lap,
+                                "dynamic_mutation_rate": evolution.dynamic_mutation_rate}))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+
+class IslandModel:
+    # Runs several populations side by side, one process per island, and lets their best genomes migrate.
+    # Every island evolves its own copy of the given Evolution (gene lengths, mutation schedule, best score)
+    # with its own random generator. All islands run migrate_every generations, then each sends its top
+    # `migrants` genomes to the islands the topology connects it to, where they replace the most mutated
+    # children of the next generation:
+    #   ring:   island i sends to island i+1, and the last island to the first
+    #   full:   every island sends to every other island
+    # Islands exchange genomes over pipes and only at these points, so a run is the same for a fixed seed
+    # however the processes are scheduled. Island 0 uses the seed itself, so a single island evolves
+    # exactly like a plain Simulator run.
+    def __init__(self, track, evolution, islands=4, topology="ring", migrate_every=5, migrants=1, pruning=None,
+                 sensor=None, physics=None, seed=None, prefix_cache=None):
+        if islands < 1 or migrate_every < 1 or migrants < 0:
+            raise ValueError("islands and migrate_every must be at least 1, and migrants at least 0")
+        self.track = track
+        self.islands = islands
+        self.topology = topology
+        self.targets = migration_targets(topology, islands)
+        self.migrate_every = migrate_every
+        self.migrants = migrants
+        self.generation_number = evolution.generation_number
+        self.start_time = None
+        self.first_lap = None # (generation, island, seconds since the start) of the first full lap
+        self.best = None # (gene, fitness) of the best car any island has driven
+
+        seeds = [seed] + np.random.SeedSequence(seed).spawn(islands - 1)
+        self.connections = []
+        self.processes = []
+        for index in range(islands):
+            island_evolution = copy.deepcopy(evolution)
+            island_evolution.rng = np.random.default_rng(seeds[index])
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_island_main, daemon=True,
+                                              args=(child_conn, index, track, island_evolution, pruning, sensor, physics, prefix_cache))
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+    def _receive(self, conn):
+        kind, payload = conn.recv()
+        if kind == "error":
+            raise RuntimeError(f"Island process failed:\n{payload}")
+        return payload
+
+    def run(self, generations=None):
+        # Runs generations on every island until the requested count is reached, printing the best car of
+        # each generation across islands
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+        incoming = [[] for _ in range(self.islands)]
+        completed = 0
+        while generations is None or completed < generations:
+            batch = self.migrate_every if generations is None else min(self.migrate_every, generations - completed)
+            for conn, genes in zip(self.connections, incoming):
+                conn.send(("run", batch, self.migrants, genes))
+            reports = [self._receive(conn) for conn in self.connections]
+
+            for offset in range(batch):
+                results = [(report["history"][offset], report["island"]) for report in reports]
+                fitness, island = max(results, key=lambda result: (result[0][0], result[0][1]))
+                print(f"Generation {self.generation_number + offset}: best car score {fitness[0]} gates, "
+                      f"{fitness[1]:.2f} distance (island {island})")
+            for report in reports:
+                if report["first_lap"] is not None:
+                    generation, timestamp = report["first_lap"]
+                    lap = (generation, report["island"], timestamp - self.start_time)
+                    if self.first_lap is None or lap < self.first_lap:
+                        self.first_lap = lap
+            self.generation_number += batch
+            completed += batch
+
+            incoming = [[] for _ in range(self.islands)]
+            for report in reports:
+                for target in self.targets[report["island"]]:
+                    incoming[target].extend(report["migrants"])
+        return self.first_lap
+
+    def close(self):
+        # Stops the islands and keeps the best car any of them has driven
+        for conn in self.connections:
+            conn.send(("stop",))
+        for conn in self.connections:
+            best = self._receive(conn)
+            if best is not None and (self.best is None or (best[1][0], best[1][1]) > (self.best[1][0], self.best[1][1])):
+                self.best = best
+        for process in self.processes:
+            process.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            for process in self.processes:
+                process.terminate()
@@ -0,0 +1,135 @@
+import contextlib
+import csv
+import json
+import time
+
+# Timed sections, in the order they appear in the summary table
+SECTIONS = ["ray_casting", "decide_actions", "is_on_track", "gate_checks", "offspring", "rendering"]
+
+class _Section:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.add(self.name, time.perf_counter() - self.start)
+
+class Profiler:
+    # Per-generation timings and statistics, written as one record per generation to a JSON Lines
+    # (.jsonl) or CSV (.csv) file. Instrumented code calls time(section) in a with block and
+    # record_active once per step.
+    enabled = True
+
+    def __init__(self, path=None):
+        self.path = path
+        self.totals = {} # Section -> seconds over the whole run
+        self.records = []
+        self.file = None
+        self.csv_writer = None
+        if path is not None:
+            self.file = open(path, "w", newline="")
+        self.start = time.perf_counter()
+        self.generation_number = None
+        self.generation_start = self.start
+        self.sections = {} # Section -> seconds since the previous record, so offspring creation counts towards the generation it creates
+        self.active_counts = []
+
+    def time(self, name):
+        return _Section(self, name)
+
+    def add(self, name, seconds):
+        self.sections[name] = self.sections.get(name, 0.0) + seconds
+        self.totals[name] = self.totals.get(name, 0.0) + seconds
+
+    def begin_generation(self, generation_number):
+        self.generation_number = generation_number
+        self.generation_start = time.perf_counter()
+
+    def record_active(self, count):
+        self.active_counts.append(count)
+
+    def end_generation(self, fitness, steps):
+        elapsed = time.perf_counter() - self.generation_start
+        scores = [car[0] for car in fitness]
+        car_steps = sum(car[2] for car in fitness) # Every car's time_taken is the number of steps it moved
+        record = {
+            "generation": self.generation_number,
+            "seconds": elapsed,
+            "steps": steps,
+            "steps_per_sec": steps / elapsed if elapsed else 0.0,
+            "cars_per_sec": len(fitness) / elapsed if elapsed else 0.0,
+            "car_steps_per_sec": car_steps / elapsed if elapsed else 0.0,
+            "best_score": max(scores, default=0),
+            "mean_score": sum(scores) / len(scores) if scores else 0.0,
+            "min_score": min(scores, default=0),
+            "best_distance": max((car[1] for car in fitness), default=0.0),
+            "collided": sum(1 for car in fitness if car[4]),
+            "pruned": sum(1 for car in fitness if len(car) > 5 and car[5]),
+        }
+        for name in SECTIONS:
+            record[f"{name}_sec"] = self.sections.get(name, 0.0)
+        self.records.append(record)
+        self._write(record)
+        self.sections = {}
+        self.active_counts = []
+        return record
+
+    def _write(self, record):
+        if self.file is None:
+            return
+        if self.path.endswith(".csv"):
+            if self.csv_writer is None:
+                self.csv_writer = csv.DictWriter(self.file, fieldnames=list(record))
+                self.csv_writer.writeheader()
+            self.csv_writer.writerow(record)
+        else:
+            # JSON Lines records also carry the active car count after every step
+            self.file.write(json.dumps(dict(record, active_counts=self.active_counts)) + "\n")
+        self.file.flush()
+
+    def summary_table(self):
+        # Total time per section over the run and its share of the wall-clock time so far
+        total = time.perf_counter() - self.start
+        lines = [f"{'section':<16}{'seconds':>12}{'share':>9}"]
+        for name in SECTIONS:
+            seconds = self.totals.get(name, 0.0)
+            share = seconds / total if total else 0.0
+            lines.append(f"{name:<16}{seconds:>12.3f}{share:>8.1%}")
+        steps = sum(record["steps"] for record in self.records)
+        generation_seconds = sum(record["seconds"] for record in self.records)
+        lines.append(f"{'generations':<16}{len(self.records):>12}")
+        lines.append(f"{'steps/sec':<16}{(steps / generation_seconds if generation_seconds else 0.0):>12.1f}")
+        return "\n".join(lines)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class NullProfiler:
+    # Stand-in used when profiling is off; every call is a no-op
+    enabled = False
+    _section = contextlib.nullcontext()
+
+    def time(self, name):
+        return self._section
+
+    def add(self, name, seconds):
+        pass
+
+    def begin_generation(self, generation_number):
+        pass
+
+    def record_active(self, count):
+        pass
+
+    def end_generation(self, fitness, steps):
+        return None
+
+    def close(self):
+        pass
+
+NULL_PROFILER = NullProfiler()
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import tempfile
+import numpy as np
+
+OFF_TRACK = 0
+ON_TRACK = 1
+
+class OccupancyRaster:
+    # Precomputed on-track bitmap for constant time Track.is_on_track lookups.
+    # Every cell stores whether its center is on the track. Cells that any boundary segment passes
+    # through (plus a one cell margin) are flagged as boundary cells; in exact mode points that land
+    # in them fall back to the polygon test, so results match Track.is_on_track everywhere.
+    def __init__(self, track, resolution=1.0, exact=True, cache_dir=None):
+        self.track = track
+        self.resolution = float(resolution) # Cell size in pixels
+        self.exact = exact
+        self.cache_dir = cache_dir
+
+        # Cover the bounding box of the outer boundary with a one cell margin; everything outside is off track
+        points = track.geometry.outer_points
+        self.origin_x = points[:, 0].min() - self.resolution
+        self.origin_y = points[:, 1].min() - self.resolution
+        self.columns = int(np.ceil((points[:, 0].max() + self.resolution - self.origin_x) / self.resolution)) + 1
+        self.rows = int(np.ceil((points[:, 1].max() + self.resolution - self.origin_y) / self.resolution)) + 1
+
+        cache_path = None
+        if cache_dir is not None:
+            cache_path = os.path.join(cache_dir, f"occupancy_{self.cache_key()}.npz")
+        if cache_path is not None and os.path.exists(cache_path):
+            with np.load(cache_path) as data:
+                self.cells = data["cells"]
+                self.boundary = data["boundary"]
+        else:
+            self.cells = self._rasterize()
+            self.boundary = self._boundary_cells()
+            if cache_path is not None:
+                self.save(cache_path)
+
+    def cache_key(self):
+        # Content hash of everything the raster depends on
+        digest = hashlib.sha1()
+        digest.update(self.track.geometry.outer_points.tobytes())
+        digest.update(self.track.geometry.inner_points.tobytes())
+        digest.update(np.array([self.resolution]).tobytes())
+        return digest.hexdigest()[:16]
+
+    def save(self, path):
+        # Written to a temporary file of its own first, so a half-written cache is never picked up, even
+        # when several processes build the same track at once
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, cells=self.cells, boundary=self.boundary)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _cell_centers(self):
+        xs = self.origin_x + (np.arange(self.columns) + 0.5) * self.resolution
+        ys = self.origin_y + (np.arange(self.rows) + 0.5) * self.resolution
+        return xs, ys
+
+    def _row_parity(self, xs, ys, edges):
+        # Scanline version of Track.point_in_polygon: for each row, count the edges crossed to the right of every center
+        p1x, p1y, p2x, p2y = edges
+        y = ys[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
+        xinters = np.where(p1x == p2x, p1x, xinters) # Vertical edges are crossed up to their x
+        xinters = np.where((y > np.minimum(p1y, p2y)) & (y <= np.maximum(p1y, p2y)), xinters, -np.inf)
+        xinters.sort(axis=1)
+
+        inside = np.empty((len(ys), len(xs)), dtype=bool)
+        for row in range(len(ys)):
+            crossings = len(p1x) - np.searchsorted(xinters[row], xs, side='left')
+            inside[row] = crossings % 2 == 1
+        return inside
+
+    def _rasterize(self):
+        xs, ys = self._cell_centers()
+        inside_outer = self._row_parity(xs, ys, self.track.outer_edges)
+        inside_inner = self._row_parity(xs, ys, self.track.inner_edges)
+        return np.where(inside_outer & ~inside_inner, ON_TRACK, OFF_TRACK).astype(np.uint8)
+
+    def _boundary_cells(self):
+        # Mark every cell a boundary segment passes through, sampled at a quarter cell, then grow by one cell
+        boundary = np.zeros((self.rows, self.columns), dtype=bool)
+        geometry = self.track.geometry
+        lengths = np.hypot(*geometry.segment_directions.T)
+        samples = np.maximum(np.ceil(lengths / (self.resolution / 4)).astype(int), 1)
+        for start, direction, count in zip(geometry.segment_starts, geometry.segment_directions, samples):
+            t = np.linspace(0, 1, count + 1)[:, None]
+            sampled = start + t * direction
+            columns, rows = self._cell_index(sampled[:, 0], sampled[:, 1])
+            boundary[rows, columns] = True
+
+        grown = boundary.copy()
+        grown[1:, :] |= boundary[:-1, :]
+        grown[:-1, :] |= boundary[1:, :]
+        vertical = grown.copy()
+        grown[:, 1:] |= vertical[:, :-1]
+        grown[:, :-1] |= vertical[:, 1:]
+        return grown
+
+    def _cell_index(self, xs, ys):
+        columns = np.floor((xs - self.origin_x) / self.resolution).astype(np.int64)
+        rows = np.floor((ys - self.origin_y) / self.resolution).astype(np.int64)
+        return np.clip(columns, 0, self.columns - 1), np.clip(rows, 0, self.rows - 1)
+
+    def contains(self, point):
+        # Single point lookup
+        x, y = point
+        column = int((x - self.origin_x) // self.resolution)
+        row = int((y - self.origin_y) // self.resolution)
+        if not (0 <= column < self.columns and 0 <= row < self.rows):
+            return False
+        if self.exact and self.boundary[row, column]:
+            return self.track.polygon_is_on_track(point)
+        return bool(self.cells[row, column])
+
+    def contains_batch(self, xs, ys):
+        # Batched lookup for arrays of x and y coordinates
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        columns = np.floor((xs - self.origin_x) / self.resolution)
+        rows = np.floor((ys - self.origin_y) / self.resolution)
+        inside = (columns >= 0) & (columns < self.columns) & (rows >= 0) & (rows < self.rows)
+        columns = np.where(inside, columns, 0).astype(np.int64)
+        rows = np.where(inside, rows, 0).astype(np.int64)
+
+        on_track = inside & (self.cells[rows, columns] == ON_TRACK)
+        if self.exact:
+            near_boundary = np.flatnonzero(inside & self.boundary[rows, columns])
+            if len(near_boundary):
+                on_track[near_boundary] = self.track.polygon_is_on_track_batch(xs[near_boundary], ys[near_boundary])
+        return on_track
@@ -0,0 +1,42 @@
+class PhysicsConfig:
+    # How much simulated time a step covers and how finely it is integrated. Time is measured in frames of
+    # the original one-update-per-frame physics: a car's acceleration, deceleration and turn_speed are per
+    # frame and its friction is the share of speed kept per frame, so every setting drives the same car.
+    #   dt:             frames per physics tick; collisions and gates are checked once per tick
+    #   substeps:       integration substeps per tick, for accuracy at a large dt
+    #   action_repeat:  ticks each decision (gene step or network output) is held for, so a step of the
+    #                   simulation covers dt * action_repeat frames and genes can be that much shorter
+    #   continuous:     sweep the car's corners along every tick, so a large dt cannot jump through a wall
+    # dt=1, substeps=1 and action_repeat=1 reproduce the original physics bit for bit.
+    def __init__(self, dt=1.0, substeps=1, action_repeat=1, continuous=False):
+        if dt <= 0 or substeps < 1 or action_repeat < 1:
+            raise ValueError("dt must be positive, and substeps and action_repeat at least 1")
+        self.dt = float(dt)
+        self.substeps = int(substeps)
+        self.action_repeat = int(action_repeat)
+        self.continuous = bool(continuous)
+
+    @property
+    def substep_time(self):
+        # Frames integrated per substep
+        return self.dt / self.substeps
+
+    @property
+    def step_time(self):
+        # Frames covered by one simulation step, i.e. one decision
+        return self.dt * self.action_repeat
+
+    def constants(self, acceleration, deceleration, turn_speed, friction):
+        # Per-substep speed and angle changes and the share of speed kept, for a car's per-frame constants
+        h = self.substep_time
+        return acceleration * h, deceleration * h, turn_speed * h, friction ** h
+
+    def config(self):
+        return {"dt": self.dt, "substeps": self.substeps, "action_repeat": self.action_repeat, "continuous": self.continuous}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**config)
+
+    def __repr__(self):
+        return f"PhysicsConfig(dt={self.dt:g}, substeps={self.substeps}, action_repeat={self.action_repeat}, continuous={self.continuous})"
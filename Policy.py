@@ -0,0 +1,81 @@
+import numpy as np
+from Gene import ACCELERATE, DECELERATE, TURN_LEFT, TURN_RIGHT
+
+# Network outputs in order, one per action bit
+ACTION_BITS = np.array([ACCELERATE, DECELERATE, TURN_LEFT, TURN_RIGHT], dtype=np.uint8)
+GENOME_DTYPE = np.float32
+
+class MLPPolicy:
+    # A small fully connected network that maps a car's observation to its actions. The network's weights
+    # are the car's genome: a flat float32 vector of genome_size values, laid out layer by layer as the
+    # (fan_in, fan_out) weight matrix followed by the bias vector. The genome stays the same size however
+    # long the episodes get.
+    # Inputs are the sensor's ray distances as fractions of the ray length, then the angle to the next gate
+    # relative to the heading divided by 180. Hidden layers use tanh, and an action is taken when its
+    # output is positive.
+    #   episode_steps:  steps a car may drive before its rollout ends, the counterpart of a gene's length
+    #   mutation_scale: standard deviation of the noise added to a mutated weight
+    def __init__(self, inputs, hidden=(16,), episode_steps=5000, mutation_scale=0.3):
+        self.inputs = int(inputs)
+        self.hidden = tuple(int(units) for units in hidden)
+        self.outputs = len(ACTION_BITS)
+        self.episode_steps = int(episode_steps)
+        self.mutation_scale = float(mutation_scale)
+        sizes = (self.inputs,) + self.hidden + (self.outputs,)
+        self.shapes = list(zip(sizes[:-1], sizes[1:]))
+        self.genome_size = sum(fan_in * fan_out + fan_out for fan_in, fan_out in self.shapes)
+
+        # The neuron every genome entry feeds, numbered across layers, so crossover can swap whole neurons
+        unit_ids = []
+        first_unit = 0
+        for fan_in, fan_out in self.shapes:
+            neurons = np.arange(first_unit, first_unit + fan_out)
+            unit_ids += [np.tile(neurons, fan_in), neurons]
+            first_unit += fan_out
+        self.unit_ids = np.concatenate(unit_ids)
+        self.num_units = first_unit
+
+    def config(self):
+        # JSON-compatible description, for checkpoints
+        return {"inputs": self.inputs, "hidden": list(self.hidden), "episode_steps": self.episode_steps,
+                "mutation_scale": self.mutation_scale}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**config)
+
+    def random_genome(self, rng):
+        # Weights scaled by 1/sqrt(fan_in) so every layer starts with outputs of about unit size, biases zero
+        parts = []
+        for fan_in, fan_out in self.shapes:
+            parts += [rng.normal(0, 1 / np.sqrt(fan_in), fan_in * fan_out), np.zeros(fan_out)]
+        return np.concatenate(parts).astype(GENOME_DTYPE)
+
+    def layers(self, genomes):
+        # Unpacks a (cars, genome_size) matrix into one (weights, biases) pair of arrays per layer,
+        # shaped (cars, fan_in, fan_out) and (cars, 1, fan_out)
+        genomes = np.asarray(genomes, dtype=GENOME_DTYPE)
+        if genomes.shape[1] != self.genome_size:
+            raise ValueError(f"Genome has {genomes.shape[1]} weights, the network needs {self.genome_size}")
+        layers = []
+        start = 0
+        for fan_in, fan_out in self.shapes:
+            weights = genomes[:, start:start + fan_in * fan_out].reshape(len(genomes), fan_in, fan_out)
+            start += fan_in * fan_out
+            biases = genomes[:, start:start + fan_out].reshape(len(genomes), 1, fan_out)
+            start += fan_out
+            layers.append((np.ascontiguousarray(weights), np.ascontiguousarray(biases)))
+        return layers
+
+    def observation(self, distances, ray_length, relative_angle):
+        # Network inputs for the cars whose (cars, rays) wall distances and relative gate angles are given
+        return np.column_stack([distances / ray_length, relative_angle / 180]).astype(GENOME_DTYPE)
+
+    def act(self, layers, idx, inputs):
+        # Forward pass for the cars in idx, one batched matmul per layer; returns their action codes
+        values = inputs[:, None, :]
+        for depth, (weights, biases) in enumerate(layers):
+            values = np.matmul(values, weights[idx]) + biases[idx]
+            if depth < len(layers) - 1:
+                values = np.tanh(values)
+        return ((values[:, 0] > 0) * ACTION_BITS).sum(axis=1, dtype=np.uint8)
@@ -0,0 +1,352 @@
+import numpy as np
+from Gene import ACCELERATE, DECELERATE, TURN_LEFT, TURN_RIGHT, stack_genes
+from Metrics import NULL_PROFILER
+from Sensors import RaySensor, FRONT, LEFT, RIGHT
+from Physics import PhysicsConfig
+from PrefixCache import SNAPSHOT_FIELDS
+from TrackGeometry import geometry_key
+
+class Population:
+    # Structure-of-arrays state for a whole generation of cars, stepped in one batched call per tick.
+    # Mirrors Car.decide_actions, Car.update and Car.check_gate_collision operation for operation,
+    # so trajectories match the Car class exactly.
+    # Without a policy, genes are action tapes. With a Policy.MLPPolicy they are network genomes, every
+    # car is driven by its own network, and gene_index counts the steps of its episode.
+    def __init__(self, track, genes, x, y, angle=0, width=40, height=20, pruning=None, best_score=None, sensor=None,
+                 policy=None, physics=None, prefix_cache=None):
+        self.track = track
+        self.physics = physics if physics is not None else PhysicsConfig()
+        self.sensor = sensor if sensor is not None else RaySensor()
+        self.pruning = pruning # Optional PruningPolicy applied after every step
+        self.best_score = best_score # Elite's adjusted score, for the pruning policy's elite bound
+        self.profiler = NULL_PROFILER
+        self.size = len(genes)
+        self.width = width
+        self.height = height
+        self.acceleration = 0.5
+        self.deceleration = 0.2
+        self.turn_speed = 5
+        self.friction = 0.95
+        self.step_acceleration, self.step_deceleration, self.step_turn, self.step_friction = self.physics.constants(
+            self.acceleration, self.deceleration, self.turn_speed, self.friction)
+
+        self.policy = policy
+        if policy is None:
+            self.genes, self.gene_lengths = stack_genes(genes)
+        else:
+            if policy.inputs != len(self.sensor) + 1:
+                raise ValueError(f"The network takes {policy.inputs - 1} rays but the sensor casts {len(self.sensor)}")
+            self.layers = policy.layers(np.stack(genes))
+            self.gene_lengths = np.full(self.size, policy.episode_steps, dtype=np.int64)
+
+        self.x = np.full(self.size, float(x))
+        self.y = np.full(self.size, float(y))
+        self.angle = np.full(self.size, float(angle))
+        self.speed = np.zeros(self.size)
+        self.active = np.ones(self.size, dtype=bool)
+        self.collided = np.zeros(self.size, dtype=bool)
+        self.score = np.zeros(self.size, dtype=np.int64)
+        self.next_gate = np.zeros(self.size, dtype=np.int64)
+        self.time_taken = np.zeros(self.size, dtype=np.int64)
+        self.distance_traveled = np.zeros(self.size)
+        self.gene_index = np.zeros(self.size, dtype=np.int64)
+        self.pruned = np.zeros(self.size, dtype=bool) # Deactivated by the pruning policy rather than a wall
+        self.last_gate_time = np.zeros(self.size, dtype=np.int64) # time_taken when the next gate last advanced
+        self.stall_anchor_time = np.zeros(self.size, dtype=np.int64)
+        self.stall_anchor_distance = np.zeros(self.size)
+        self.actions = np.zeros(self.size, dtype=np.uint8) # Action codes of the last step, 0 for cars that did not move
+        self.impact_time = np.full(self.size, np.nan) # Time (in steps, with the fraction of the step) a car hit a wall
+
+        # Sensor readings, one row per car and one column per ray, and the pose each row was cast from.
+        # Rows are cast again only for cars whose (sensor-snapped) pose has changed since.
+        self.observations = np.zeros((self.size, len(self.sensor)))
+        self.observed_x = np.full(self.size, np.nan)
+        self.observed_y = np.full(self.size, np.nan)
+        self.observed_angle = np.full(self.size, np.nan)
+        if policy is None:
+            self.steering_columns = [self.sensor.column(angle) for angle in (FRONT, LEFT, RIGHT)]
+
+        self.gate_p1 = track.geometry.gate_p1
+        self.gate_p2 = track.geometry.gate_p2
+        self.gate_centers = track.geometry.gate_centers
+
+        self.prefix_cache = prefix_cache # Optional PrefixCache; cars resume from the deepest cached prefix of their gene
+        if prefix_cache is not None:
+            if policy is not None or (pruning is not None and pruning.elite_bound):
+                raise ValueError("The prefix cache needs tape genes and cannot be combined with the elite bound")
+            self.resume_prefixes(self.prefix_context(x, y, angle))
+
+    def prefix_context(self, x, y, angle):
+        # Everything besides the gene that a car's trajectory depends on, for the prefix cache's root key
+        occupancy = self.track.occupancy
+        pruning = self.pruning
+        return {
+            "track": geometry_key(self.track.geometry_params()),
+            "occupancy": None if occupancy is None or occupancy.exact else occupancy.resolution,
+            "start": [float(x), float(y), float(angle)],
+            "car": [self.width, self.height, self.step_acceleration, self.step_deceleration, self.step_turn, self.step_friction],
+            "physics": self.physics.config(),
+            "sensor": [self.sensor.angles, self.sensor.ray_length, self.sensor.quantum, self.sensor.angle_quantum],
+            "pruning": None if pruning is None else [pruning.gate_patience, pruning.stall_window, pruning.stall_distance],
+        }
+
+    def resume_prefixes(self, context):
+        # Restores every car to the deepest snapshot matching the start of its gene. prefix_keys and
+        # prefix_steps hold the key and length of each car's last snapshotted prefix, which later keys chain from.
+        cache = self.prefix_cache
+        root = cache.root(context)
+        self.prefix_keys = [root] * self.size
+        self.prefix_steps = np.zeros(self.size, dtype=np.int64)
+        rows, snapshots = [], []
+        for i in range(self.size):
+            key, steps, snapshot = root, 0, None
+            while steps + cache.interval <= self.gene_lengths[i]:
+                next_key = cache.extend(key, self.genes[i, steps:steps + cache.interval])
+                found = cache.get(next_key)
+                if found is None:
+                    break
+                key, steps, snapshot = next_key, steps + cache.interval, found
+            if snapshot is not None:
+                self.prefix_keys[i] = key
+                self.prefix_steps[i] = steps
+                rows.append(i)
+                snapshots.append(snapshot)
+        if rows:
+            values = np.stack(snapshots)
+            for column, name in enumerate(SNAPSHOT_FIELDS):
+                getattr(self, name)[rows] = values[:, column]
+            cache.hits += len(rows)
+            cache.steps_skipped += int(self.prefix_steps.sum())
+
+    def take_snapshots(self):
+        # Stores the state of every active car that has just driven another interval of its gene
+        cache = self.prefix_cache
+        due = np.flatnonzero(self.active & (self.gene_index == self.prefix_steps + cache.interval))
+        if not len(due):
+            return
+        values = np.column_stack([getattr(self, name)[due] for name in SNAPSHOT_FIELDS]).astype(float)
+        for row, i in enumerate(due.tolist()):
+            start = int(self.prefix_steps[i])
+            key = cache.extend(self.prefix_keys[i], self.genes[i, start:start + cache.interval])
+            cache.put(key, values[row].copy())
+            self.prefix_keys[i] = key
+        self.prefix_steps[due] += cache.interval
+
+    def get_distances_to_walls(self, idx, angle_offsets):
+        # Batched Car.get_distance_to_wall: one row per car in idx, one column per angle offset
+        origins = np.column_stack([self.x[idx], self.y[idx]])
+        angles = self.angle[idx][:, None] + np.asarray(angle_offsets, dtype=float)
+        distances = self.track.cast_rays(np.repeat(origins, len(angle_offsets), axis=0), angles.ravel(), self.sensor.ray_length)
+        return distances.reshape(len(idx), len(angle_offsets))
+
+    def observe(self, idx):
+        # Batched Car.observe: (len(idx), rays) sensor readings for the cars in idx, refreshing only stale rows
+        x, y, angle = self.sensor.pose_batch(self.x[idx], self.y[idx], self.angle[idx])
+        stale = (x != self.observed_x[idx]) | (y != self.observed_y[idx]) | (angle != self.observed_angle[idx])
+        if stale.any():
+            refresh = idx[stale]
+            self.observations[refresh] = self.sensor.cast_batch(self.track, x[stale], y[stale], angle[stale])
+            self.observed_x[refresh] = x[stale]
+            self.observed_y[refresh] = y[stale]
+            self.observed_angle[refresh] = angle[stale]
+        return self.observations[idx]
+
+    def relative_gate_angle(self, idx):
+        # Angle from each car's heading to the center of its next gate, in (-180, 180] degrees
+        gate_center = self.gate_centers[self.next_gate[idx]]
+        angle_to_gate = np.degrees(np.arctan2(self.y[idx] - gate_center[:, 1], gate_center[:, 0] - self.x[idx]))
+        relative_angle = (angle_to_gate - self.angle[idx] + 360) % 360
+        return np.where(relative_angle > 180, relative_angle - 360, relative_angle)
+
+    def decide_actions(self, idx, observations=None):
+        # Batched Car.decide_actions; returns boolean action arrays for the cars in idx
+        # observations holds the sensor readings of the cars in idx
+        if observations is None:
+            observations = self.observe(idx)
+        if self.policy is not None:
+            inputs = self.policy.observation(observations, self.sensor.ray_length, self.relative_gate_angle(idx))
+            codes = self.policy.act(self.layers, idx, inputs)
+            self.gene_index[idx] += 1
+            return ((codes & ACCELERATE) != 0, (codes & DECELERATE) != 0, (codes & TURN_LEFT) != 0,
+                    (codes & TURN_RIGHT) != 0)
+        distance_front, distance_left, distance_right = observations[:, self.steering_columns].T
+
+        # Simple wall avoidance: turn towards the more open side when close to the front wall
+        near_wall = distance_front < 150
+        accelerate = ~(distance_front < 80)
+        decelerate = np.zeros(len(idx), dtype=bool)
+        turn_left = near_wall & (distance_left > distance_right)
+        turn_right = near_wall & ~(distance_left > distance_right)
+
+        # Gate optimization: steer towards the next gate unless already avoiding a wall
+        steer = ~(turn_left | turn_right)
+        relative_angle = self.relative_gate_angle(idx)
+        turn_left |= steer & (relative_angle > 10)
+        turn_right |= steer & (relative_angle < -10)
+
+        codes = self.genes[idx, self.gene_index[idx]]
+        self.gene_index[idx] += 1
+        gene_accelerate = (codes & ACCELERATE) != 0
+        gene_decelerate = (codes & DECELERATE) != 0
+        gene_turn_left = (codes & TURN_LEFT) != 0
+        gene_turn_right = (codes & TURN_RIGHT) != 0
+
+        # Combine gene actions with AI actions; on opposing turns the gene decides acceleration
+        conflict = (turn_left & gene_turn_right) | (turn_right & gene_turn_left)
+        final_accelerate = np.where(conflict, gene_accelerate, accelerate | gene_accelerate)
+        final_decelerate = np.where(conflict, gene_decelerate, decelerate | gene_decelerate)
+        return final_accelerate, final_decelerate, turn_left | gene_turn_left, turn_right | gene_turn_right
+
+    def get_corners(self, x, y, angle):
+        # Batched Car.get_corners; returns (n, 4) arrays of rotated corner coordinates
+        half_width = self.width / 2
+        half_height = self.height / 2
+        x, y = x[:, None], y[:, None]
+        corners_x = np.hstack([x - half_width, x + half_width, x + half_width, x - half_width])
+        corners_y = np.hstack([y - half_height, y - half_height, y + half_height, y + half_height])
+
+        rad_angle = np.radians(angle)[:, None]
+        cos, sin = np.cos(rad_angle), np.sin(rad_angle)
+        rotated_x = x + (corners_x - x) * cos - (corners_y - y) * sin
+        rotated_y = y + (corners_x - x) * sin + (corners_y - y) * cos
+        return rotated_x, rotated_y
+
+    def sweep(self, old_x, old_y, old_angle, x, y, angle):
+        # Fraction of the step at which each car first touches a boundary (inf if it does not), following
+        # every corner in a straight line from its old position to its new one
+        old_corners_x, old_corners_y = self.get_corners(old_x, old_y, old_angle)
+        corners_x, corners_y = self.get_corners(x, y, angle)
+        impact = self.track.times_of_impact(old_corners_x.ravel(), old_corners_y.ravel(), corners_x.ravel(), corners_y.ravel())
+        return impact.reshape(-1, 4).min(axis=1)
+
+    def update(self, idx, accelerate, decelerate, turn_left, turn_right):
+        # Batched Car.update for the cars in idx: their actions are held for physics.action_repeat ticks,
+        # or until the car crashes
+        self.time_taken[idx] += 1
+        if self.physics.action_repeat == 1:
+            self.tick(idx, accelerate, decelerate, turn_left, turn_right)
+            return
+        moving = np.ones(len(idx), dtype=bool)
+        for tick in range(self.physics.action_repeat):
+            crashed = self.tick(idx[moving], accelerate[moving], decelerate[moving], turn_left[moving], turn_right[moving], tick)
+            moving[np.flatnonzero(moving)[crashed]] = False
+            if not moving.any():
+                break
+
+    def tick(self, idx, accelerate, decelerate, turn_left, turn_right, tick=0):
+        # Moves the cars in idx through one physics tick and checks walls and gates; returns which crashed
+        old_x, old_y = self.x[idx], self.y[idx]
+        old_angle = self.angle[idx]
+
+        speed = self.speed[idx]
+        angle = old_angle
+        x, y = old_x, old_y
+        h = self.physics.substep_time
+        for _ in range(self.physics.substeps):
+            speed = np.where(accelerate, speed + self.step_acceleration, speed)
+            speed = np.where(decelerate, speed - self.step_deceleration, speed)
+            angle = np.where(turn_left, angle + self.step_turn, angle)
+            angle = np.where(turn_right, angle - self.step_turn, angle)
+
+            # Apply friction
+            speed = speed * self.step_friction
+
+            rad_angle = np.radians(angle)
+            x = x + speed * h * np.cos(rad_angle)
+            y = y + speed * h * -np.sin(rad_angle) # Negative because y is inverted
+
+        if self.physics.continuous:
+            # Cars that hit a wall on the way stop where they touched it, so nothing beyond counts
+            with self.profiler.time("is_on_track"):
+                impact = self.sweep(old_x, old_y, old_angle, x, y, angle)
+            hit = impact <= 1
+            # Only rows that hit are interpolated; the others have an infinite impact time, which times a
+            # car that did not move would give NaN
+            x[hit] = old_x[hit] + impact[hit] * (x[hit] - old_x[hit])
+            y[hit] = old_y[hit] + impact[hit] * (y[hit] - old_y[hit])
+            self.impact_time[idx[hit]] = self.tick_start(idx[hit], tick) + impact[hit] / self.physics.action_repeat
+
+        self.speed[idx] = speed
+        self.angle[idx] = angle
+        self.x[idx] = x
+        self.y[idx] = y
+        self.distance_traveled[idx] += np.sqrt((x - old_x)**2 + (y - old_y)**2)
+
+        # Check for collisions with track boundaries
+        corners_x, corners_y = self.get_corners(x, y, angle)
+        with self.profiler.time("is_on_track"):
+            on_track = self.track.is_on_track_batch(corners_x.ravel(), corners_y.ravel()).reshape(-1, 4)
+        off_track = ~on_track.all(axis=1)
+        if self.physics.continuous:
+            off_track |= hit
+        if off_track.any():
+            crashed = idx[off_track]
+            self.impact_time[crashed] = np.where(np.isnan(self.impact_time[crashed]),
+                                                 self.tick_start(crashed, tick) + 1 / self.physics.action_repeat, self.impact_time[crashed])
+            self.collided[crashed] = True
+            self.active[crashed] = False
+
+        with self.profiler.time("gate_checks"):
+            self.check_gate_collision(idx, old_x, old_y, x, y)
+        return off_track
+
+    def tick_start(self, idx, tick):
+        # Time the given tick of the current step started, in steps
+        return self.time_taken[idx] - 1 + tick / self.physics.action_repeat
+
+    def check_gate_collision(self, idx, old_x, old_y, x, y):
+        # Batched Car.check_gate_collision: the move from the old to the new position must cross the next gate.
+        # A tick longer than a frame can cross several gates, so cars that passed one are checked against the next.
+        def ccw(a_x, a_y, b_x, b_y, c_x, c_y):
+            return (c_y - a_y) * (b_x - a_x) > (b_y - a_y) * (c_x - a_x)
+
+        for _ in range(len(self.gate_centers) if self.physics.dt > 1 else 1):
+            gate = self.next_gate[idx]
+            gate_p1 = self.gate_p1[gate]
+            gate_p2 = self.gate_p2[gate]
+            crossed = ((ccw(old_x, old_y, gate_p1[:, 0], gate_p1[:, 1], gate_p2[:, 0], gate_p2[:, 1]) !=
+                        ccw(x, y, gate_p1[:, 0], gate_p1[:, 1], gate_p2[:, 0], gate_p2[:, 1])) &
+                       (ccw(old_x, old_y, x, y, gate_p1[:, 0], gate_p1[:, 1]) !=
+                        ccw(old_x, old_y, x, y, gate_p2[:, 0], gate_p2[:, 1])))
+            passed = idx[crossed]
+            self.score[passed] += 1
+            self.last_gate_time[passed] = self.time_taken[passed]
+            self.next_gate[passed] = (self.next_gate[passed] + 1) % len(self.gate_centers) # Loop gates
+            if not len(passed):
+                break
+            idx, old_x, old_y, x, y = passed, old_x[crossed], old_y[crossed], x[crossed], y[crossed]
+
+    def step(self):
+        # One simulation tick for every active car
+        # Cars that have run out of gene become inactive instead of moving
+        exhausted = self.active & (self.gene_index >= self.gene_lengths)
+        self.active[exhausted] = False
+        idx = np.flatnonzero(self.active)
+        if len(idx):
+            with self.profiler.time("ray_casting"):
+                observations = self.observe(idx)
+            with self.profiler.time("decide_actions"):
+                actions = self.decide_actions(idx, observations)
+            accelerate, decelerate, turn_left, turn_right = actions
+            self.actions.fill(0)
+            self.actions[idx] = accelerate * ACCELERATE | decelerate * DECELERATE | turn_left * TURN_LEFT | turn_right * TURN_RIGHT
+            self.update(idx, *actions) # Times its own is_on_track and gate_checks sections
+            if self.pruning is not None:
+                self.pruning.apply(self, self.best_score)
+            if self.prefix_cache is not None:
+                self.take_snapshots()
+
+    def is_done(self):
+        return not self.active.any()
+
+    def run(self, max_steps=None):
+        # Steps until every car is inactive or max_steps ticks have passed
+        steps = 0
+        while not self.is_done() and (max_steps is None or steps < max_steps):
+            self.step()
+            steps += 1
+        return self.fitness()
+
+    def fitness(self):
+        return [(int(self.score[i]), float(self.distance_traveled[i]), int(self.time_taken[i]),
+                 int(self.gene_index[i]), bool(self.collided[i]), bool(self.pruned[i])) for i in range(self.size)]
@@ -0,0 +1,68 @@
+import collections
+import hashlib
+import json
+import numpy as np
+
+# Per-car Population arrays a snapshot holds: everything a tape-driven car's next steps depend on.
+# Sensor readings are left out; they are cast again from the restored pose.
+SNAPSHOT_FIELDS = ("x", "y", "angle", "speed", "score", "next_gate", "time_taken", "distance_traveled", "gene_index",
+                   "last_gate_time", "stall_anchor_time", "stall_anchor_distance")
+
+# Rough bookkeeping cost of one entry (dict slot, key bytes and array header), counted against the budget
+ENTRY_OVERHEAD = 256
+
+class PrefixCache:
+    # Car states after the first k * interval steps of a gene, keyed by a hash of those gene steps.
+    # Physics is deterministic, so a car whose gene starts with a cached prefix can resume from the
+    # snapshot instead of driving that part again. Keys chain one interval of gene at a time from a root
+    # that hashes everything else the trajectory depends on (track, start pose, physics, sensor, pruning),
+    # so a key matches only the same gene prefix in the same setting.
+    # Snapshots are kept in least recently used order and evicted once they take more than budget bytes.
+    def __init__(self, interval=10, budget=256 << 20):
+        if interval < 1:
+            raise ValueError("The snapshot interval must be at least 1 step")
+        self.interval = interval
+        self.budget = budget
+        self.size = 0 # Bytes taken by the stored snapshots
+        self.hits = 0 # Cars resumed from a snapshot
+        self.steps_skipped = 0 # Steps those cars did not have to drive
+        self._entries = collections.OrderedDict()
+
+    def __getstate__(self):
+        # Snapshots stay in the process that took them
+        state = self.__dict__.copy()
+        state["_entries"] = collections.OrderedDict()
+        state["size"] = 0
+        return state
+
+    def __len__(self):
+        return len(self._entries)
+
+    def root(self, context):
+        # Key of the empty prefix for a JSON-compatible description of the setting
+        text = json.dumps(context, sort_keys=True)
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def extend(self, key, codes):
+        # Key of the prefix `key` stands for followed by the gene steps in codes
+        return hashlib.blake2b(key + np.ascontiguousarray(codes).tobytes(), digest_size=16).digest()
+
+    def get(self, key):
+        snapshot = self._entries.get(key)
+        if snapshot is not None:
+            self._entries.move_to_end(key)
+        return snapshot
+
+    def put(self, key, snapshot):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        self._entries[key] = snapshot
+        self.size += snapshot.nbytes + ENTRY_OVERHEAD
+        while self.size > self.budget and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= evicted.nbytes + ENTRY_OVERHEAD
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
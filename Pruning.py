@@ -0,0 +1,84 @@
+import math
+import weakref
+import numpy as np
+
+class PruningPolicy:
+    # Deactivates cars that are no longer worth simulating. Pruned cars are recorded separately from wall
+    # collisions. Every rule looks at one car at a time, so pruning gives the same result whether a
+    # generation is stepped as one Population or split across worker processes.
+    #   gate_patience:  prune a car whose next gate index has not advanced within this many steps
+    #   stall_window:   every this many steps, prune a car that covered less than stall_distance pixels
+    #   elite_bound:    prune a car that can no longer reach the elite's adjusted score, even if it passed
+    #                   a gate at top speed every time it could; the generation ends when none are left
+    def __init__(self, gate_patience=None, stall_window=None, stall_distance=1.0, elite_bound=False):
+        self.gate_patience = gate_patience
+        self.stall_window = stall_window
+        self.stall_distance = stall_distance
+        self.elite_bound = elite_bound
+        self._gate_gaps = weakref.WeakKeyDictionary()
+
+    def __getstate__(self):
+        # The per-track cache is rebuilt in worker processes
+        state = self.__dict__.copy()
+        del state["_gate_gaps"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._gate_gaps = weakref.WeakKeyDictionary()
+
+    def config(self):
+        # JSON-compatible description, for checkpoints
+        return {"gate_patience": self.gate_patience, "stall_window": self.stall_window, "stall_distance": self.stall_distance,
+                "elite_bound": self.elite_bound}
+
+    def min_gate_gap(self, track):
+        # Shortest distance between consecutive gates; a car needs at least this far to pass another one
+        if track not in self._gate_gaps:
+            p1, p2 = track.geometry.gate_p1, track.geometry.gate_p2
+            next_p1, next_p2 = np.roll(p1, -1, axis=0), np.roll(p2, -1, axis=0)
+            gaps = [_segment_distance(*gate) for gate in zip(p1, p2, next_p1, next_p2)]
+            self._gate_gaps[track] = max(min(gaps), 1e-9)
+        return self._gate_gaps[track]
+
+    def apply(self, population, best_score=None):
+        # Called after every step; marks the cars to prune as inactive and pruned
+        active = population.active
+        hopeless = np.zeros(population.size, dtype=bool)
+        if self.gate_patience is not None:
+            hopeless |= population.time_taken - population.last_gate_time >= self.gate_patience
+        if self.stall_window is not None:
+            due = population.time_taken - population.stall_anchor_time >= self.stall_window
+            hopeless |= due & (population.distance_traveled - population.stall_anchor_distance < self.stall_distance)
+            due &= active & ~hopeless
+            population.stall_anchor_time[due] = population.time_taken[due]
+            population.stall_anchor_distance[due] = population.distance_traveled[due]
+        if self.elite_bound and best_score is not None:
+            hopeless |= self.upper_bound(population) < best_score
+
+        pruned = np.flatnonzero(active & hopeless)
+        population.pruned[pruned] = True
+        population.active[pruned] = False
+
+    def upper_bound(self, population):
+        # Best adjusted score (gates * 1000000 - time) each car could still finish with
+        physics = population.physics
+        remaining_steps = population.gene_lengths - population.gene_index
+        terminal_speed = population.step_acceleration * population.step_friction / (1 - population.step_friction)
+        top_speed = np.maximum(terminal_speed, np.abs(population.speed))
+        reachable = remaining_steps * top_speed * physics.step_time / self.min_gate_gap(population.track)
+        possible_gates = np.floor(reachable) + 1
+        if physics.dt <= 1: # Ticks of up to a frame pass at most one gate each
+            possible_gates = np.minimum(remaining_steps * physics.action_repeat, possible_gates)
+        return (population.score + possible_gates) * 1000000 - population.time_taken
+
+def _point_segment_distance(p, a, b):
+    ab = b - a
+    length_sq = ab @ ab
+    t = 0.0 if length_sq == 0 else min(max((p - a) @ ab / length_sq, 0.0), 1.0)
+    return math.dist(p, a + t * ab)
+
+def _segment_distance(a1, a2, b1, b2):
+    # Distance between two non-crossing segments is reached at one of the four endpoints
+    return min(_point_segment_distance(a1, b1, b2), _point_segment_distance(a2, b1, b2),
+               _point_segment_distance(b1, a1, a2), _point_segment_distance(b2, a1, a2))
@@ -0,0 +1,390 @@
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+import numpy as np
+from Checkpoint import track_params
+from Metrics import NULL_PROFILER
+
+# A replay file is a sequence of records, each a preamble (magic, header length, payload length), a JSON
+# header and a payload of arrays back to back, zlib compressed when the header says so. The first record
+# describes the run (track parameters, car size, quantization); each recorded generation follows as
+# "block" records of up to BLOCK_FRAMES frames and a closing "summary" record with the final fitness.
+# Frame 0 is the start pose and frame k the pose after step k; the actions of frame k are the ones that
+# led to it. An index of every record's offset is kept next to the file as JSON lines, appended as each
+# record lands, so readers can seek to any generation; without it the file is scanned once instead.
+MAGIC = b"RLREPLAY"
+VERSION = 1
+PREAMBLE = struct.Struct("<8sIQ")
+INDEX_SUFFIX = ".idx"
+
+# Positions are stored in 1/64 pixel and angles in 1/64 degree steps
+POSITION_SCALE = 64
+ANGLE_SCALE = 64
+
+BLOCK_FRAMES = 4096 # Frames buffered per block; bounds the recorder's memory whatever the episode length
+MAX_PENDING = 4 # Blocks waiting to be written before the simulation waits for the writer
+
+def _smallest_int(values):
+    # Narrowest signed integer type that holds every value; deltas between frames are mostly tiny
+    low, high = (int(values.min()), int(values.max())) if values.size else (0, 0)
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+def _delta_encode(values, scale):
+    # (frames, cars) floats -> quantized first frame and integer steps between consecutive frames.
+    # Deltas are taken after quantizing, so decoding never drifts.
+    quantized = np.round(values * scale).astype(np.int64)
+    deltas = np.diff(quantized, axis=0)
+    return quantized[0], deltas.astype(_smallest_int(deltas))
+
+def _delta_decode(base, deltas, scale):
+    quantized = np.concatenate([base[None], np.cumsum(deltas, axis=0, dtype=np.int64) + base])
+    return quantized / scale
+
+def encode_record(header, arrays, compress=True):
+    # Returns the bytes of one record
+    layout = {}
+    parts = []
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        layout[name] = [array.dtype.str, list(array.shape), offset]
+        parts.append(array.tobytes())
+        offset += array.nbytes
+    payload = b"".join(parts)
+    if compress:
+        payload = zlib.compress(payload, 6)
+    header = dict(header, arrays=layout, compression="zlib" if compress else None)
+    header_bytes = json.dumps(header).encode("utf-8")
+    return PREAMBLE.pack(MAGIC, len(header_bytes), len(payload)) + header_bytes + payload
+
+def decode_record(data):
+    # Returns (header, arrays) for the bytes of one record
+    magic, header_length, payload_length = PREAMBLE.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a replay record")
+    header = json.loads(data[PREAMBLE.size:PREAMBLE.size + header_length].decode("utf-8"))
+    payload = data[PREAMBLE.size + header_length:PREAMBLE.size + header_length + payload_length]
+    if header["compression"] == "zlib":
+        payload = zlib.decompress(payload)
+    arrays = {}
+    for name, (dtype, shape, offset) in header.pop("arrays").items():
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(payload, dtype=dtype, count=count, offset=offset).reshape(shape)
+    return header, arrays
+
+class ReplayWriter:
+    # Appends records to a replay file from a background thread. Quantizing, delta encoding and compression
+    # all happen on that thread; submitting only hands over arrays the caller will not touch again. At most
+    # max_pending records wait in memory, and submit only waits when the disk falls that far behind.
+    def __init__(self, path, run_header, compress=True, max_pending=MAX_PENDING):
+        self.path = path
+        self.compress = compress
+        self.file = open(path, "wb")
+        self.index = open(path + INDEX_SUFFIX, "w")
+        self.queue = queue.Queue(max_pending)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name="replay-writer", daemon=True)
+        self.thread.start()
+        self.submit(dict(run_header, type="run", version=VERSION), {})
+
+    def submit(self, header, arrays):
+        self.queue.put((header, arrays))
+
+    def _encode(self, header, arrays):
+        if header["type"] != "block":
+            return header, arrays
+        base_x, delta_x = _delta_encode(arrays.pop("x"), POSITION_SCALE)
+        base_y, delta_y = _delta_encode(arrays.pop("y"), POSITION_SCALE)
+        base_angle, delta_angle = _delta_encode(arrays.pop("angle"), ANGLE_SCALE)
+        arrays.update(base_x=base_x, base_y=base_y, base_angle=base_angle, delta_x=delta_x, delta_y=delta_y,
+                      delta_angle=delta_angle)
+        return header, arrays
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue # Keep draining so the simulation never waits on a broken writer
+            try:
+                header, arrays = self._encode(*item)
+                record = encode_record(header, arrays, self.compress)
+                offset = self.file.tell()
+                self.file.write(record)
+                self.file.flush()
+                entry = {key: header[key] for key in ("type", "generation", "first_frame", "frames") if key in header}
+                self.index.write(json.dumps(dict(entry, offset=offset, length=len(record))) + "\n")
+                self.index.flush()
+            except Exception as e:
+                self.error = e
+                print(f"Replay recording failed: {e}")
+
+    def close(self):
+        # Finishes every pending record
+        self.queue.put(None)
+        self.thread.join()
+        self.file.close()
+        self.index.close()
+
+class ReplayRecorder:
+    # Simulator observer that records every `every`th generation's trajectories to a replay file. Needs
+    # the cars stepped in this process, so it cannot be combined with a ProcessPoolEvaluator.
+    def __init__(self, path, track, car_size=(40, 20), every=1, compress=True, block_frames=BLOCK_FRAMES):
+        self.every = max(int(every), 1)
+        self.block_frames = block_frames
+        self.writer = ReplayWriter(path, {"track": track_params(track), "car_size": list(car_size),
+                                          "position_scale": POSITION_SCALE, "angle_scale": ANGLE_SCALE}, compress)
+        self.generation = None # Generation being recorded
+        self.frame = 0 # Frame number of the next buffered row
+        self.buffer = None
+        self.rows = 0
+        self.events = []
+        self.last_score = None
+
+    def on_step(self, simulator):
+        population = simulator.population
+        if simulator.simulation_steps == 1: # First step of a new generation
+            self.finish(None)
+            if simulator.generation_number % self.every == 0:
+                self.generation = simulator.generation_number
+                self.frame = 0
+                self.last_score = np.zeros(population.size, dtype=np.int64)
+                self._new_block(population.size)
+                self._append(np.full(population.size, float(simulator.start_x)), np.full(population.size, float(simulator.start_y)),
+                             np.full(population.size, float(simulator.start_angle)), np.zeros(population.size, dtype=np.uint8))
+        if self.generation is None:
+            return
+        if self.rows == self.block_frames:
+            self._flush()
+            self._new_block(population.size)
+        passed = np.flatnonzero(population.score != self.last_score)
+        if len(passed):
+            self.events.append((np.full(len(passed), self.frame), passed, population.next_gate[passed]))
+            self.last_score = population.score.copy()
+        self._append(population.x, population.y, population.angle, population.actions)
+
+    def on_generation(self, simulator, genes):
+        self.finish(simulator.population)
+
+    def _new_block(self, cars):
+        self.buffer = {"x": np.empty((self.block_frames, cars)), "y": np.empty((self.block_frames, cars)),
+                       "angle": np.empty((self.block_frames, cars)), "actions": np.empty((self.block_frames, cars), dtype=np.uint8)}
+        self.rows = 0
+        self.events = []
+
+    def _append(self, x, y, angle, actions):
+        row = self.rows
+        self.buffer["x"][row] = x
+        self.buffer["y"][row] = y
+        self.buffer["angle"][row] = angle
+        self.buffer["actions"][row] = actions
+        self.rows += 1
+        self.frame += 1
+
+    def _flush(self):
+        # Hands the filled part of the buffer to the writer; events hold (frame, car, next gate) per gate passed
+        if self.rows == 0:
+            return
+        arrays = {name: values[:self.rows] for name, values in self.buffer.items()}
+        if self.events:
+            frames, cars, gates = (np.concatenate(column) for column in zip(*self.events))
+        else:
+            frames = cars = gates = np.zeros(0, dtype=np.int64)
+        arrays.update(event_frame=frames.astype(np.int32), event_car=cars.astype(np.int32), event_gate=gates.astype(np.int32))
+        self.writer.submit({"type": "block", "generation": self.generation, "first_frame": self.frame - self.rows,
+                            "frames": self.rows, "cars": len(arrays["x"][0])}, arrays)
+        self.buffer = None
+        self.rows = 0
+
+    def finish(self, population):
+        # Closes the generation being recorded, with its fitness when the population is given
+        if self.generation is None:
+            return
+        self._flush()
+        header = {"type": "summary", "generation": self.generation, "frames": self.frame}
+        arrays = {}
+        if population is not None:
+            fitness = population.fitness()
+            order = sorted(range(len(fitness)), key=lambda i: (fitness[i][0], fitness[i][1]), reverse=True)
+            header["elite"] = order[0] # Ranked as Evolution.next_generation ranks them
+            arrays = {"score": population.score, "distance": population.distance_traveled, "time_taken": population.time_taken,
+                      "collided": population.collided, "pruned": population.pruned}
+            arrays = {name: values.copy() for name, values in arrays.items()}
+        self.writer.submit(header, arrays)
+        self.generation = None
+
+    def close(self):
+        self.finish(None)
+        self.writer.close()
+
+class ReplayGeneration:
+    # Decoded trajectories of one generation: (frames, cars) x, y, angle and action arrays, gate events as
+    # parallel event_frame, event_car and event_gate arrays, and the summary fitness if it was written
+    def __init__(self, generation, blocks, summary):
+        self.generation = generation
+        self.x = np.concatenate([block["x"] for block in blocks])
+        self.y = np.concatenate([block["y"] for block in blocks])
+        self.angle = np.concatenate([block["angle"] for block in blocks])
+        self.actions = np.concatenate([block["actions"] for block in blocks])
+        self.event_frame = np.concatenate([block["event_frame"] for block in blocks])
+        self.event_car = np.concatenate([block["event_car"] for block in blocks])
+        self.event_gate = np.concatenate([block["event_gate"] for block in blocks])
+        self.summary = summary # (header, arrays) or None for a generation cut short
+        self.elite = summary[0].get("elite") if summary is not None else None
+
+    @property
+    def frames(self):
+        return len(self.x)
+
+class ReplayReader:
+    def __init__(self, path):
+        self.path = path
+        self.entries = self._load_index()
+        if not self.entries or self.entries[0]["type"] != "run":
+            raise ValueError(f"{path} is not a replay file")
+        self.run, _ = self.read_record(self.entries[0])
+        if self.run["version"] != VERSION:
+            raise ValueError(f"Unsupported replay version {self.run['version']} (expected {VERSION})")
+        self.position_scale = self.run["position_scale"]
+        self.angle_scale = self.run["angle_scale"]
+
+    def _load_index(self):
+        # Index entries of complete records. A missing index is rebuilt by scanning the file.
+        size = os.path.getsize(self.path)
+        index_path = self.path + INDEX_SUFFIX
+        if os.path.exists(index_path):
+            with open(index_path) as f:
+                entries = []
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break # A line cut short by a crash
+                    if entry["offset"] + entry["length"] > size:
+                        break
+                    entries.append(entry)
+            return entries
+        return self._scan(size)
+
+    def _scan(self, size):
+        entries = []
+        with open(self.path, "rb") as f:
+            offset = 0
+            while offset + PREAMBLE.size <= size:
+                f.seek(offset)
+                magic, header_length, payload_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+                length = PREAMBLE.size + header_length + payload_length
+                if magic != MAGIC or offset + length > size:
+                    break
+                header = json.loads(f.read(header_length).decode("utf-8"))
+                entry = {key: header[key] for key in ("type", "generation", "first_frame", "frames") if key in header}
+                entries.append(dict(entry, offset=offset, length=length))
+                offset += length
+        return entries
+
+    def read_record(self, entry):
+        with open(self.path, "rb") as f:
+            f.seek(entry["offset"])
+            return decode_record(f.read(entry["length"]))
+
+    def generations(self):
+        # Recorded generation numbers, in order
+        return sorted({entry["generation"] for entry in self.entries if entry["type"] == "block"})
+
+    def blocks(self, generation):
+        # Decoded blocks of a generation, one at a time, so playback memory stays bounded
+        for entry in self.entries:
+            if entry["type"] == "block" and entry["generation"] == generation:
+                header, arrays = self.read_record(entry)
+                block = {"first_frame": header["first_frame"], "frames": header["frames"],
+                         "x": _delta_decode(arrays["base_x"], arrays["delta_x"], self.position_scale),
+                         "y": _delta_decode(arrays["base_y"], arrays["delta_y"], self.position_scale),
+                         "angle": _delta_decode(arrays["base_angle"], arrays["delta_angle"], self.angle_scale)}
+                block.update((name, arrays[name]) for name in ("actions", "event_frame", "event_car", "event_gate"))
+                yield block
+
+    def summary(self, generation):
+        # (header, arrays) of a generation's summary record, or None if the generation was cut short
+        for entry in self.entries:
+            if entry["type"] == "summary" and entry["generation"] == generation:
+                return self.read_record(entry)
+        return None
+
+    def read_generation(self, generation):
+        blocks = list(self.blocks(generation))
+        if not blocks:
+            raise KeyError(f"Generation {generation} was not recorded")
+        return ReplayGeneration(generation, blocks, self.summary(generation))
+
+class ReplayFrame:
+    # The slice of a Population the Viewer draws, for one replayed frame
+    def __init__(self, cars, width, height):
+        self.size = cars
+        self.width = width
+        self.height = height
+        self.x = np.zeros(cars)
+        self.y = np.zeros(cars)
+        self.angle = np.zeros(cars)
+        self.score = np.zeros(cars, dtype=np.int64)
+
+class ReplayPlayer:
+    # Plays recorded generations back to Simulator observers such as the Viewer, one on_step per frame,
+    # without simulating anything. SPACE in the viewer skips to the next generation as in training.
+    # With elite_only, only each generation's best car is shown.
+    def __init__(self, reader, generations=None, elite_only=False):
+        self.reader = reader
+        self.generations = list(generations) if generations is not None else reader.generations()
+        self.elite_only = elite_only
+        self.width, self.height = reader.run["car_size"]
+        self.profiler = NULL_PROFILER
+        self.observers = []
+        self.population = None
+        self.generation_number = None
+        self.simulation_steps = 0
+        self.running = True
+        self.skip_requested = False
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def run(self):
+        for generation in self.generations:
+            if not self.running:
+                break
+            self.generation_number = generation
+            self.simulation_steps = 0
+            self.skip_requested = False
+            summary = self.reader.summary(generation)
+            elite = summary[0].get("elite") if summary is not None else None
+            cars = [elite] if self.elite_only and elite is not None else None
+            self.play(generation, cars)
+
+    def play(self, generation, cars=None):
+        # Steps through one generation's frames, showing the cars in `cars` (all of them by default)
+        for block in self.reader.blocks(generation):
+            columns = cars if cars is not None else list(range(block["x"].shape[1]))
+            if self.population is None or self.population.size != len(columns) or self.simulation_steps == 0:
+                self.population = ReplayFrame(len(columns), self.width, self.height)
+            selected = np.isin(block["event_car"], columns)
+            event_frames = block["event_frame"][selected]
+            event_cars = np.searchsorted(columns, block["event_car"][selected])
+            for row in range(block["frames"]):
+                frame = block["first_frame"] + row
+                self.population.x[:] = block["x"][row, columns]
+                self.population.y[:] = block["y"][row, columns]
+                self.population.angle[:] = block["angle"][row, columns]
+                np.add.at(self.population.score, event_cars[event_frames == frame], 1)
+                self.simulation_steps = frame
+                for observer in self.observers:
+                    if hasattr(observer, "on_step"):
+                        observer.on_step(self)
+                if not self.running or self.skip_requested:
+                    return
@@ -0,0 +1,286 @@
+import math
+import numpy as np
+
+class SegmentGrid:
+    # Uniform grid over the track's boundary segments for ray casting.
+    # A ray walks the cells it passes through (Amanatides & Woo traversal) and only tests the segments
+    # stored in those cells, stopping as soon as the closest hit so far lies inside the current cell.
+    # Ties between equally close hits go to the lower segment index, so the scalar and batched paths agree.
+    # Every empty cell also stores its clearance: the radius of the square of empty cells around it. A ray in
+    # such a cell jumps straight to where it leaves that square, so fine grids over dense tracks stay cheap to
+    # cross. Only empty cells are skipped, so the hits found do not change. Coarse grids cross empty space in
+    # a few steps anyway, so skipping is only switched on (skip_empty) where it pays for itself.
+    MAX_CLEARANCE = 64
+    # The batched walk costs the same per iteration however few rays are left, so the last few rays
+    # (typically grazing a wall) finish on the scalar path, which finds the same hits
+    SCALAR_TAIL = 32
+    def __init__(self, starts, ends, cell_size=20.0, directions=None, bounds=None, skip_empty=False):
+        # directions (ends - starts) and bounds (min_x, min_y, max_x, max_y per segment) can be passed in
+        # when the caller has them precomputed, e.g. from a TrackGeometry
+        self.starts = np.asarray(starts, dtype=float)
+        self.ends = np.asarray(ends, dtype=float)
+        self.cell_size = float(cell_size)
+        self.skip_empty = skip_empty
+        self.directions = np.asarray(directions, dtype=float) if directions is not None else self.ends - self.starts
+        if bounds is None:
+            bounds = np.hstack([np.minimum(self.starts, self.ends), np.maximum(self.starts, self.ends)])
+        bounds = np.asarray(bounds, dtype=float)
+
+        self.origin_x = bounds[:, 0].min() - self.cell_size
+        self.origin_y = bounds[:, 1].min() - self.cell_size
+        self.columns = int(math.ceil((bounds[:, 2].max() - self.origin_x) / self.cell_size)) + 1
+        self.rows = int(math.ceil((bounds[:, 3].max() - self.origin_y) / self.cell_size)) + 1
+
+        # Insert every segment into each cell its (slightly grown) bounding box overlaps
+        margin = self.cell_size * 1e-6
+        cells = [[] for _ in range(self.columns * self.rows)]
+        min_columns, min_rows = self._cell_index(bounds[:, :2] - margin)
+        max_columns, max_rows = self._cell_index(bounds[:, 2:] + margin)
+        for index in range(len(self.starts)):
+            for row in range(min_rows[index], max_rows[index] + 1):
+                for column in range(min_columns[index], max_columns[index] + 1):
+                    cells[row * self.columns + column].append(index)
+
+        # Per-cell (index, x3, y3, x4, y4) tuples for the scalar path, and a padded (num_cells, max_per_cell)
+        # index table for batched lookups where -1 marks empty slots
+        self.cell_segments = [tuple((index, *self.starts[index].tolist(), *self.ends[index].tolist()) for index in cell) for cell in cells]
+        self.cell_counts = np.array([len(cell) for cell in cells], dtype=np.int64)
+        width = max(self.cell_counts.max(), 1)
+        self.cell_table = np.full((len(cells), width), -1, dtype=np.int64)
+        for cell_index, cell in enumerate(cells):
+            self.cell_table[cell_index, :len(cell)] = cell
+        self.clearance = self._clearance() if skip_empty else np.full(len(cells), -1)
+        self.clearance_list = self.clearance.tolist() # For the scalar path
+
+    def _clearance(self):
+        # Chebyshev distance in cells to the nearest cell with segments, minus one (-1 for such cells).
+        # Cells outside the grid count as empty.
+        occupied = (self.cell_counts > 0).reshape(self.rows, self.columns)
+        distance = np.where(occupied, 0, self.MAX_CLEARANCE + 1)
+        reached = occupied.copy()
+        for radius in range(1, self.MAX_CLEARANCE + 1):
+            grown = reached.copy()
+            grown[1:, :] |= reached[:-1, :]
+            grown[:-1, :] |= reached[1:, :]
+            vertical = grown.copy()
+            grown[:, 1:] |= vertical[:, :-1]
+            grown[:, :-1] |= vertical[:, 1:]
+            distance[grown & ~reached] = radius
+            reached = grown
+            if reached.all():
+                break
+        return (distance - 1).ravel()
+
+    def _cell_index(self, points):
+        columns = np.floor((points[:, 0] - self.origin_x) / self.cell_size).astype(np.int64)
+        rows = np.floor((points[:, 1] - self.origin_y) / self.cell_size).astype(np.int64)
+        return np.clip(columns, 0, self.columns - 1), np.clip(rows, 0, self.rows - 1)
+
+    def _entry(self, x, y, s1_x, s1_y):
+        # Parameter at which the ray x + t * s1 enters the grid bounds, or None if it never does within [0, 1]
+        t_enter, t_leave = 0.0, 1.0
+        for position, direction, low, high in ((x, s1_x, self.origin_x, self.origin_x + self.columns * self.cell_size),
+                                               (y, s1_y, self.origin_y, self.origin_y + self.rows * self.cell_size)):
+            if direction == 0:
+                if not low <= position <= high:
+                    return None
+                continue
+            t1 = (low - position) / direction
+            t2 = (high - position) / direction
+            t_enter = max(t_enter, min(t1, t2))
+            t_leave = min(t_leave, max(t1, t2))
+        return t_enter if t_enter <= t_leave else None
+
+    def _traversal_start(self, position, direction, t_enter, origin, count):
+        # First cell along one axis plus the parameter of the next cell boundary and the step between boundaries
+        cell = min(max(int(math.floor((position + t_enter * direction - origin) / self.cell_size)), 0), count - 1)
+        if direction > 0:
+            return cell, 1, (origin + (cell + 1) * self.cell_size - position) / direction, self.cell_size / direction
+        if direction < 0:
+            return cell, -1, (origin + cell * self.cell_size - position) / direction, -self.cell_size / direction
+        return cell, 0, math.inf, math.inf
+
+    def ray_intersection(self, p1, p2):
+        # Closest intersection point of segment p1-p2 with any boundary segment, or None
+        x, y = p1
+        return self._closest_hit(x, y, p2[0] - x, p2[1] - y)[0]
+
+    def _closest_hit(self, x, y, s1_x, s1_y):
+        # Closest hit along x + t * s1, t in [0, 1], as (point or None, squared distance or inf)
+        t_enter = self._entry(x, y, s1_x, s1_y)
+        if t_enter is None:
+            return None, math.inf
+
+        column, step_column, t_max_x, t_delta_x = self._traversal_start(x, s1_x, t_enter, self.origin_x, self.columns)
+        row, step_row, t_max_y, t_delta_y = self._traversal_start(y, s1_y, t_enter, self.origin_y, self.rows)
+
+        best = None
+        best_dist_sq = math.inf
+        best_index = -1
+        best_t = math.inf
+        while True:
+            for index, x3, y3, x4, y4 in self.cell_segments[row * self.columns + column]:
+                s2_x, s2_y = x4 - x3, y4 - y3
+
+                denominator = (-s2_x * s1_y + s1_x * s2_y)
+                if denominator == 0: # Parallel lines
+                    continue
+                s = (-s1_y * (x - x3) + s1_x * (y - y3)) / denominator
+                t = ( s2_x * (y - y3) - s2_y * (x - x3)) / denominator
+                if 0 <= s <= 1 and 0 <= t <= 1:
+                    intersection_x = x + (t * s1_x)
+                    intersection_y = y + (t * s1_y)
+                    # Squares are written as products so the result matches the NumPy path bit for bit
+                    dist_sq = (x - intersection_x) * (x - intersection_x) + (y - intersection_y) * (y - intersection_y)
+                    if dist_sq < best_dist_sq or (dist_sq == best_dist_sq and index < best_index):
+                        best = (intersection_x, intersection_y)
+                        best_dist_sq = dist_sq
+                        best_index = index
+                        best_t = t
+
+            t_exit = min(t_max_x, t_max_y)
+            if best_t <= t_exit or t_exit >= 1: # Nothing in a later cell can be closer
+                return best, best_dist_sq
+            if self.skip_empty and self.clearance_list[row * self.columns + column] > 0:
+                clearance = self.clearance_list[row * self.columns + column]
+                # Jump to where the ray leaves the empty square around this cell
+                t_jump = min(self._leave_square(x, s1_x, column, step_column, clearance, self.origin_x),
+                             self._leave_square(y, s1_y, row, step_row, clearance, self.origin_y))
+                if t_jump >= 1:
+                    return best, best_dist_sq
+                column, t_max_x = self._reenter(x, s1_x, t_jump, step_column, self.origin_x)
+                row, t_max_y = self._reenter(y, s1_y, t_jump, step_row, self.origin_y)
+            elif t_max_x < t_max_y:
+                column += step_column
+                t_max_x += t_delta_x
+            else:
+                row += step_row
+                t_max_y += t_delta_y
+            if not (0 <= column < self.columns and 0 <= row < self.rows):
+                return best, best_dist_sq
+
+    def _leave_square(self, position, direction, cell, step, clearance, origin):
+        # Parameter at which a ray leaves the square of clearance cells around cell along one axis
+        if step == 0:
+            return math.inf
+        edge = cell + clearance + 1 if step > 0 else cell - clearance
+        return (origin + edge * self.cell_size - position) / direction
+
+    def _reenter(self, position, direction, t, step, origin):
+        # Cell along one axis at parameter t and the parameter of its next boundary
+        cell = int(math.floor((position + t * direction - origin) / self.cell_size))
+        if step == 0:
+            return cell, math.inf
+        return cell, (origin + (cell + (step > 0)) * self.cell_size - position) / direction
+
+    def cast_rays(self, x, y, s1_x, s1_y):
+        # Batched ray_intersection for rays x + t * s1, t in [0, 1]; returns the squared distance to the
+        # closest hit for every ray (inf if none). All rays walk their cells in lockstep.
+        count = len(x)
+        best_dist_sq = np.full(count, np.inf)
+        best_index = np.full(count, -1, dtype=np.int64)
+        best_t = np.full(count, np.inf)
+
+        extent_x = self.origin_x + self.columns * self.cell_size
+        extent_y = self.origin_y + self.rows * self.cell_size
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Clip the rays against the grid bounds
+            t_enter = np.zeros(count)
+            t_leave = np.ones(count)
+            for position, direction, low, high in ((x, s1_x, self.origin_x, extent_x), (y, s1_y, self.origin_y, extent_y)):
+                t1 = (low - position) / direction
+                t2 = (high - position) / direction
+                parallel = direction == 0
+                outside = parallel & ((position < low) | (position > high))
+                t_enter = np.where(parallel, t_enter, np.maximum(t_enter, np.minimum(t1, t2)))
+                t_leave = np.where(parallel, t_leave, np.minimum(t_leave, np.maximum(t1, t2)))
+                t_leave = np.where(outside, -1.0, t_leave)
+
+            axes = []
+            for position, direction, origin, cells in ((x, s1_x, self.origin_x, self.columns), (y, s1_y, self.origin_y, self.rows)):
+                cell = np.clip(np.floor((position + t_enter * direction - origin) / self.cell_size), 0, cells - 1).astype(np.int64)
+                step = np.sign(direction).astype(np.int64)
+                boundary = origin + (cell + (step > 0)) * self.cell_size
+                t_max = np.where(direction != 0, (boundary - position) / direction, np.inf)
+                t_delta = np.where(direction != 0, self.cell_size / np.abs(direction), np.inf)
+                axes.append((cell, step, t_max, t_delta))
+        (column, step_column, t_max_x, t_delta_x), (row, step_row, t_max_y, t_delta_y) = axes
+
+        live = np.flatnonzero(t_enter <= t_leave)
+        while len(live) > self.SCALAR_TAIL:
+            # Only rays currently in a cell that holds segments need intersection tests
+            cells = row[live] * self.columns + column[live]
+            counts = self.cell_counts[cells]
+            tested = live[counts > 0]
+            if len(tested):
+                cells = cells[counts > 0]
+                candidates = self.cell_table[cells, :counts.max()]
+                valid = candidates >= 0
+                p3_x, p3_y = self.starts[candidates, 0], self.starts[candidates, 1]
+                s2_x, s2_y = self.directions[candidates, 0], self.directions[candidates, 1]
+                lx, ly, ls1_x, ls1_y = x[tested, None], y[tested, None], s1_x[tested, None], s1_y[tested, None]
+
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    denominator = (-s2_x * ls1_y + ls1_x * s2_y)
+                    s = (-ls1_y * (lx - p3_x) + ls1_x * (ly - p3_y)) / denominator
+                    t = ( s2_x * (ly - p3_y) - s2_y * (lx - p3_x)) / denominator
+                    intersection_x = lx + (t * ls1_x)
+                    intersection_y = ly + (t * ls1_y)
+                hit = valid & (denominator != 0) & (0 <= s) & (s <= 1) & (0 <= t) & (t <= 1)
+                dist_sq = np.where(hit, (lx - intersection_x) * (lx - intersection_x) + (ly - intersection_y) * (ly - intersection_y), np.inf)
+
+                # Closest hit in this cell, lowest segment index on ties
+                cell_best = dist_sq.min(axis=1)
+                tied = hit & (dist_sq == cell_best[:, None])
+                cell_index = np.where(tied, candidates, np.iinfo(np.int64).max).min(axis=1)
+                cell_t = np.where(tied & (candidates == cell_index[:, None]), t, np.inf).min(axis=1)
+                better = np.isfinite(cell_best) & ((cell_best < best_dist_sq[tested]) |
+                                                   ((cell_best == best_dist_sq[tested]) & (cell_index < best_index[tested])))
+                improved = tested[better]
+                best_dist_sq[improved] = cell_best[better]
+                best_index[improved] = cell_index[better]
+                best_t[improved] = cell_t[better]
+
+            # Advance to the next cell, or finish when nothing further along can be closer
+            t_exit = np.minimum(t_max_x[live], t_max_y[live])
+            finished = (best_t[live] <= t_exit) | (t_exit >= 1)
+            jumping = np.zeros(len(live), dtype=bool)
+            if self.skip_empty:
+                clearance = self.clearance[row[live] * self.columns + column[live]]
+                jumping = ~finished & (clearance > 0)
+            if jumping.any():
+                # Rays in empty space jump to where they leave the empty square around their cell
+                jumpers = live[jumping]
+                k = clearance[jumping]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    t_jump = np.minimum(self._leave_squares(x[jumpers], s1_x[jumpers], column[jumpers], step_column[jumpers], k, self.origin_x),
+                                        self._leave_squares(y[jumpers], s1_y[jumpers], row[jumpers], step_row[jumpers], k, self.origin_y))
+                    column[jumpers], t_max_x[jumpers] = self._reenter_batch(x[jumpers], s1_x[jumpers], t_jump, step_column[jumpers], self.origin_x)
+                    row[jumpers], t_max_y[jumpers] = self._reenter_batch(y[jumpers], s1_y[jumpers], t_jump, step_row[jumpers], self.origin_y)
+                finished[jumping] = t_jump >= 1
+            stepping = ~finished & ~jumping
+            advance_x = t_max_x[live] < t_max_y[live]
+            moving_x = live[stepping & advance_x]
+            moving_y = live[stepping & ~advance_x]
+            column[moving_x] += step_column[moving_x]
+            t_max_x[moving_x] += t_delta_x[moving_x]
+            row[moving_y] += step_row[moving_y]
+            t_max_y[moving_y] += t_delta_y[moving_y]
+
+            live = live[~finished]
+            live = live[(column[live] >= 0) & (column[live] < self.columns) & (row[live] >= 0) & (row[live] < self.rows)]
+        for ray in live.tolist():
+            best_dist_sq[ray] = self._closest_hit(float(x[ray]), float(y[ray]), float(s1_x[ray]), float(s1_y[ray]))[1]
+        return best_dist_sq
+
+    def _leave_squares(self, position, direction, cell, step, clearance, origin):
+        # Batched _leave_square
+        edge = np.where(step > 0, cell + clearance + 1, cell - clearance)
+        return np.where(step != 0, (origin + edge * self.cell_size - position) / direction, np.inf)
+
+    def _reenter_batch(self, position, direction, t, step, origin):
+        # Batched _reenter; cells past the grid edge are dropped by the caller
+        coordinate = np.floor((position + t * direction - origin) / self.cell_size)
+        cell = np.where(np.isfinite(coordinate), coordinate, -1).astype(np.int64)
+        t_max = np.where(step != 0, (origin + (cell + (step > 0)) * self.cell_size - position) / direction, np.inf)
+        return cell, t_max
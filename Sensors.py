@@ -0,0 +1,117 @@
+import collections
+import math
+import numpy as np
+
+# Rays the rule-based steering in Car.decide_actions and Population.decide_actions reads
+FRONT, LEFT, RIGHT = 0.0, 45.0, -45.0
+
+class RaySensor:
+    # A fan of wall-distance rays at fixed angles (degrees) relative to the car's heading.
+    # Observations are float arrays with one distance per ray, in the order of angles, and ray_length
+    # where no wall is in reach. Cars keep the pose their last observation was cast from and reuse it
+    # while the pose is unchanged, and cars sharing a pose in the same step share one cast.
+    #   quantum:        when set, poses are snapped to this many pixels (and angle_quantum degrees) before
+    #                   casting, so a stationary or creeping car reuses its observation, and casts are
+    #                   memoized across cars and steps in an LRU of memo_size poses. Distances are then
+    #                   measured from the snapped pose, off by at most half a quantum.
+    def __init__(self, angles=(FRONT, LEFT, RIGHT), ray_length=500, quantum=None, angle_quantum=1.0, memo_size=1 << 16):
+        self.angles = tuple(float(angle) for angle in angles)
+        if not self.angles:
+            raise ValueError("A ray sensor needs at least one angle")
+        self.ray_length = ray_length
+        self.quantum = quantum
+        self.angle_quantum = angle_quantum
+        self.memo_size = memo_size
+        self.offsets = np.array(self.angles)
+        self._memo = collections.OrderedDict() # Snapped pose -> observation, quantized mode only
+
+    def __getstate__(self):
+        # The memo stays in the process that built it
+        state = self.__dict__.copy()
+        state["_memo"] = collections.OrderedDict()
+        return state
+
+    def config(self):
+        # JSON-compatible description, for checkpoints; the memo size does not change any reading
+        return {"angles": list(self.angles), "ray_length": self.ray_length, "quantum": self.quantum, "angle_quantum": self.angle_quantum}
+
+    def __len__(self):
+        return len(self.angles)
+
+    def column(self, angle):
+        # Index of the ray at angle in an observation
+        try:
+            return self.angles.index(float(angle))
+        except ValueError:
+            raise ValueError(f"The sensor has no ray at {angle} degrees (rays: {self.angles})") from None
+
+    def pose(self, x, y, angle):
+        # The pose rays are cast from: the car's own, or snapped to the quantum grid
+        if self.quantum is None:
+            return x, y, angle
+        return (math.floor(x / self.quantum + 0.5) * self.quantum, math.floor(y / self.quantum + 0.5) * self.quantum,
+                math.floor(angle / self.angle_quantum + 0.5) * self.angle_quantum)
+
+    def pose_batch(self, x, y, angle):
+        if self.quantum is None:
+            return x, y, angle
+        return (np.floor(x / self.quantum + 0.5) * self.quantum, np.floor(y / self.quantum + 0.5) * self.quantum,
+                np.floor(angle / self.angle_quantum + 0.5) * self.angle_quantum)
+
+    def cast(self, track, x, y, angle):
+        # Scalar observation for one pose, the same distances Car.get_distance_to_wall computes
+        key = (x, y, angle)
+        if self.quantum is not None and key in self._memo:
+            self._memo.move_to_end(key)
+            return self._memo[key]
+        observation = np.empty(len(self.angles))
+        for column, offset in enumerate(self.angles):
+            intersection_point = track.get_ray_intersection_with_track_boundary((x, y), angle + offset, self.ray_length)
+            if intersection_point:
+                dx = x - intersection_point[0]
+                dy = y - intersection_point[1]
+                observation[column] = math.sqrt(dx * dx + dy * dy)
+            else:
+                observation[column] = self.ray_length
+        if self.quantum is not None:
+            self._remember(key, observation)
+        return observation
+
+    def cast_batch(self, track, x, y, angle):
+        # (n, rays) observations for arrays of poses. Identical poses are cast once.
+        unique, inverse = _unique_poses(x, y, angle)
+        x, y, angle = x[unique], y[unique], angle[unique]
+        observations = np.empty((len(unique), len(self.angles)))
+        missing = np.arange(len(unique))
+        if self.quantum is not None:
+            keys = list(zip(x.tolist(), y.tolist(), angle.tolist()))
+            found = [key in self._memo for key in keys]
+            for row in np.flatnonzero(found).tolist():
+                self._memo.move_to_end(keys[row])
+                observations[row] = self._memo[keys[row]]
+            missing = np.flatnonzero(np.logical_not(found))
+        if len(missing):
+            origins = np.column_stack([x[missing], y[missing]])
+            angles = angle[missing][:, None] + self.offsets
+            distances = track.cast_rays(np.repeat(origins, len(self.angles), axis=0), angles.ravel(), self.ray_length)
+            observations[missing] = distances.reshape(len(missing), len(self.angles))
+            if self.quantum is not None:
+                for row in missing.tolist():
+                    self._remember(keys[row], observations[row].copy())
+        return observations[inverse]
+
+    def _remember(self, key, observation):
+        self._memo[key] = observation
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+
+def _unique_poses(x, y, angle):
+    # Indices of one car per distinct pose, and for every car the position of its pose in that list.
+    # A lexsort and neighbour comparison; np.unique(axis=0) does the same far more slowly.
+    order = np.lexsort((angle, y, x))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = ((x[order[1:]] != x[order[:-1]]) | (y[order[1:]] != y[order[:-1]]) |
+                 (angle[order[1:]] != angle[order[:-1]]))
+    inverse = np.empty(len(order), dtype=np.int64)
+    inverse[order] = np.cumsum(first) - 1
+    return order[first], inverse
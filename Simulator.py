@@ -0,0 +1,98 @@
+from Population import Population
+from Evolution import Evolution
+from Metrics import NULL_PROFILER
+from Physics import PhysicsConfig
+
+class Simulator:
+    def __init__(self, track, num_cars=10, seed=None, evolution=None, evaluator=None, pruning=None, sensor=None):
+        self.track = track
+        self.evolution = evolution if evolution is not None else Evolution(num_cars, seed=seed)
+        self.evaluator = evaluator # Optional ProcessPoolEvaluator; generations then run in worker processes without observers
+        self.pruning = pruning # Optional PruningPolicy for stalled and hopeless rollouts
+        self.sensor = sensor # Optional Sensors.RaySensor; the default three-ray fan otherwise
+        self.physics = PhysicsConfig() # Time step, substeps, action repeat and collision mode
+        self.prefix_cache = None # Optional PrefixCache.PrefixCache; serial runs then resume cars from cached gene prefixes
+        self.profiler = NULL_PROFILER # Replace with a Metrics.Profiler to record per-generation timings
+        self.population = None
+        self.car_width = 40
+        self.car_height = 20
+        self.observers = [] # Objects with an on_step(simulator) and/or on_generation(simulator, genes) method
+        self.simulation_steps = 0
+        self.max_simulation_steps = 999999999 # Effectively no limit
+        self.running = True # Cleared by an observer to stop the simulation
+        self.skip_requested = False # Set by an observer to end the current generation early
+
+        # Calculate starting position and angle
+        self.start_x, self.start_y, self.start_angle = track.get_start_pose()
+
+    @property
+    def generation_number(self):
+        return self.evolution.generation_number
+
+    def best_score(self):
+        # Adjusted score a car has to reach to count as an improvement, None before the first generation
+        if self.evolution.last_best_score < 0:
+            return None
+        return self.evolution.last_best_score
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def spawn(self, genes):
+        self.population = Population(self.track, genes, self.start_x, self.start_y, self.start_angle, self.car_width, self.car_height,
+                                     self.pruning, self.best_score(), self.sensor, self.evolution.policy,
+                                     self.physics, self.prefix_cache)
+        self.population.profiler = self.profiler
+        self.simulation_steps = 0
+        self.skip_requested = False
+
+    def step(self):
+        self.population.step() # Every active car in one batched call
+        self.simulation_steps += 1
+        if self.profiler.enabled:
+            self.profiler.record_active(int(self.population.active.sum()))
+
+    def is_generation_over(self):
+        return self.population.is_done() or self.simulation_steps >= self.max_simulation_steps
+
+    def fitness(self):
+        return self.population.fitness()
+
+    def run_generation(self, genes):
+        self.profiler.begin_generation(self.generation_number)
+        if self.evaluator is not None:
+            fitness = self.evaluator.evaluate(genes, self.max_simulation_steps, self.pruning, self.best_score(),
+                                             self.evolution.policy, self.physics)
+            self.profiler.end_generation(fitness, max((car[2] for car in fitness), default=0))
+            return fitness
+
+        self.spawn(genes)
+        while self.running and not self.skip_requested:
+            self.step()
+            for observer in self.observers:
+                if hasattr(observer, "on_step"):
+                    observer.on_step(self)
+            if self.is_generation_over():
+                break
+        fitness = self.fitness()
+        self.profiler.end_generation(fitness, self.simulation_steps)
+        return fitness
+
+    def run(self, generations=None, genes=None):
+        # Runs generations until the requested count is reached or an observer stops the simulation.
+        # Starts from the given genes (e.g. a resumed checkpoint) or a random first generation, and
+        # returns the genes of the generation that would run next.
+        if genes is None:
+            genes = self.evolution.initial_genes()
+        completed = 0
+        while self.running and (generations is None or completed < generations):
+            fitness = self.run_generation(genes)
+            completed += 1
+            if not self.running:
+                break
+            with self.profiler.time("offspring"):
+                genes = self.evolution.next_generation(genes, fitness)
+            for observer in self.observers:
+                if hasattr(observer, "on_generation"):
+                    observer.on_generation(self, genes)
+        return genes
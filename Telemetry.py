@@ -0,0 +1,300 @@
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+from urllib.parse import urlsplit
+import numpy as np
+
+COMMANDS = ("skip", "pause", "resume", "checkpoint")
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11" # RFC 6455 handshake constant
+MAX_FRAME = 1 << 16 # Largest WebSocket frame accepted from a client; commands are tiny
+
+class TelemetryServer:
+    # Simulator observer that serves live training progress on a local HTTP port, from an asyncio loop
+    # on its own thread:
+    #   GET  /status            latest message of every type, as JSON
+    #   GET  /stream            WebSocket that pushes every message as a JSON text frame; clients may send
+    #                           a command name (or {"command": name}) back
+    #   POST /control/<command> skip the current generation (or the next one, between generations), pause or
+    #                           resume the simulation, or save a checkpoint when the current generation
+    #                           ends (with a Checkpointer)
+    # Messages are "step" (at most every `interval` seconds: steps/sec, active cars and the elite's and
+    # the leading car's positions) and "generation" (after each generation: best adjusted score, mutation
+    # rates, gene length, steps/sec). The simulation thread only hands messages to the loop and never
+    # waits for clients: each client has a queue of queue_size messages, and a client that falls behind
+    # loses its oldest ones.
+    def __init__(self, host="127.0.0.1", port=8765, checkpointer=None, interval=0.1, queue_size=64):
+        self.host = host
+        self.port = port # 0 picks a free port; the bound one is stored here once started
+        self.checkpointer = checkpointer
+        self.interval = interval
+        self.queue_size = queue_size
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.clients = set() # One message queue per WebSocket client, used on the loop thread only
+        self.latest = {} # Message type -> (message, JSON text), used on the loop thread only
+        self.dropped = 0 # Messages discarded because a client was too slow
+        self.simulator = None
+        self.checkpoint_requested = False
+        self.skip_pending = False # Handed to the simulator on its next step; spawn() clears skip_requested
+        self.running = threading.Event() # Cleared while paused
+        self.running.set()
+        self.steps = 0
+        self.last_publish = time.perf_counter()
+        self.last_publish_steps = 0
+        self.generation_start = time.perf_counter()
+
+    def start(self):
+        # Binds the port and starts serving; raises OSError if the port is taken
+        ready = threading.Event()
+        errors = []
+
+        def serve():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+            except OSError as error:
+                errors.append(error)
+                self.loop.close()
+                ready.set()
+                return
+            self.port = self.server.sockets[0].getsockname()[1]
+            ready.set()
+            self.loop.run_forever()
+            self.server.close()
+            tasks = asyncio.all_tasks(self.loop)
+            for task in tasks:
+                task.cancel()
+            if tasks: # gather() with nothing to wait for looks for a current loop, which this thread has none of
+                self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.close()
+
+        self.thread = threading.Thread(target=serve, name="telemetry", daemon=True)
+        self.thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def close(self):
+        self.running.set() # Never leave the simulation paused
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def publish(self, message):
+        # Hands a message to the server loop without waiting for it; called on the simulation thread
+        text = json.dumps(message)
+        try:
+            self.loop.call_soon_threadsafe(self._broadcast, message, text)
+        except (AttributeError, RuntimeError): # Not started, or already closed
+            pass
+
+    def on_step(self, simulator):
+        self.simulator = simulator
+        self.steps += 1
+        now = time.perf_counter()
+        if now - self.last_publish >= self.interval:
+            self.publish(self.step_message(simulator, now))
+        self.wait_while_paused(simulator)
+        if self.skip_pending:
+            self.skip_pending = False
+            simulator.skip_requested = True # What SPACE does in the viewer
+
+    def on_generation(self, simulator, genes):
+        self.simulator = simulator
+        now = time.perf_counter()
+        self.publish(self.generation_message(simulator, now))
+        self.generation_start = now
+        if self.checkpoint_requested and self.checkpointer is not None:
+            self.checkpoint_requested = False
+            self.checkpointer.submit(simulator.evolution, genes, simulator.track, simulator.physics, simulator.sensor,
+                                     simulator.pruning)
+            self.publish({"type": "checkpoint", "generation": simulator.generation_number, "path": self.checkpointer.path})
+        self.wait_while_paused(simulator)
+
+    def wait_while_paused(self, simulator):
+        if not self.running.is_set():
+            self.publish({"type": "paused", "generation": simulator.generation_number, "step": simulator.simulation_steps})
+            self.running.wait()
+            self.last_publish = time.perf_counter() # The pause does not count against steps/sec
+            self.last_publish_steps = self.steps
+
+    def step_message(self, simulator, now):
+        population = simulator.population
+        elapsed = now - self.last_publish
+        rate = (self.steps - self.last_publish_steps) / elapsed if elapsed else 0.0
+        self.last_publish = now
+        self.last_publish_steps = self.steps
+        # The elite is carried over as the first car; the leader is the car ahead right now
+        leader = int(np.lexsort((population.distance_traveled, population.score))[-1])
+        return {
+            "type": "step",
+            "generation": simulator.generation_number,
+            "step": simulator.simulation_steps,
+            "steps_per_sec": rate,
+            "active": int(population.active.sum()),
+            "elite": _car(population, 0),
+            "leader": dict(_car(population, leader), index=leader),
+        }
+
+    def generation_message(self, simulator, now):
+        evolution = simulator.evolution
+        elapsed = now - self.generation_start
+        message = {
+            "type": "generation",
+            "generation": simulator.generation_number - 1, # The one that just finished
+            "best_adjusted_score": evolution.last_best_score,
+            "generations_since_improvement": evolution.generations_since_last_improvement,
+            "mutation_rate": evolution.dynamic_mutation_rate,
+            "preserved_mutation_rate": evolution.mutation_rate_preserved,
+            "max_mutation_rate": evolution.max_mutation_rate,
+            "gene_length": evolution.gene_length,
+            "seconds": elapsed,
+            "steps_per_sec": simulator.simulation_steps / elapsed if elapsed else 0.0,
+        }
+        population = simulator.population # None when a worker pool ran the generation
+        if population is not None:
+            message["best_score"] = int(population.score.max())
+            message["best_distance"] = float(population.distance_traveled.max())
+        return message
+
+    def command(self, name):
+        # Applies a control command; runs on the server loop
+        if name not in COMMANDS:
+            return {"type": "control", "command": name, "ok": False, "error": f"unknown command, expected one of {', '.join(COMMANDS)}"}
+        if name == "skip":
+            if self.simulator is not None and self.simulator.evaluator is not None:
+                return {"type": "control", "command": name, "ok": False, "error": "generations run in worker processes and cannot be skipped"}
+            self.skip_pending = True
+        elif name == "pause":
+            self.running.clear()
+        elif name == "resume":
+            self.running.set()
+        elif name == "checkpoint":
+            if self.checkpointer is None:
+                return {"type": "control", "command": name, "ok": False, "error": "training was started without --checkpoint"}
+            self.checkpoint_requested = True # Saved when the current generation ends
+        return {"type": "control", "command": name, "ok": True}
+
+    def status(self):
+        return {"latest": {kind: message for kind, (message, _) in self.latest.items()}, "paused": not self.running.is_set(),
+                "clients": len(self.clients), "dropped": self.dropped}
+
+    def _broadcast(self, message, text):
+        self.latest[message["type"]] = (message, text)
+        for queue in self.clients:
+            self._enqueue(queue, text)
+
+    def _enqueue(self, queue, text):
+        if _offer(queue, text):
+            self.dropped += 1
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            path = urlsplit(target).path
+            if path == "/stream" and headers.get("upgrade", "").lower() == "websocket":
+                await self._websocket(reader, writer, headers)
+            elif method == "GET" and path == "/status":
+                await _respond(writer, 200, self.status())
+            elif method == "POST" and path.startswith("/control/"):
+                result = self.command(path[len("/control/"):])
+                await _respond(writer, 200 if result["ok"] else 400, result)
+            else:
+                await _respond(writer, 404, {"error": f"no such endpoint: {method} {path}"})
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass # A client that hangs up or speaks nonsense only loses its own connection
+        except asyncio.CancelledError:
+            pass # The server is shutting down
+        finally:
+            writer.close()
+
+    async def _websocket(self, reader, writer, headers):
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode("ascii")).digest()).decode("ascii")
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("ascii"))
+        queue = asyncio.Queue(self.queue_size)
+        for _, text in self.latest.values(): # A new client starts from the latest state
+            self._enqueue(queue, text)
+        self.clients.add(queue)
+        sender = asyncio.ensure_future(_send_frames(writer, queue))
+        try:
+            while True:
+                opcode, payload = await _read_frame(reader)
+                if opcode == 0x8: # Close
+                    break
+                if opcode == 0x9: # Ping
+                    writer.write(_frame(0xA, payload))
+                elif opcode == 0x1: # Text: a command
+                    text = payload.decode("utf-8").strip()
+                    name = json.loads(text).get("command") if text.startswith("{") else text
+                    self._enqueue(queue, json.dumps(self.command(name)))
+        finally:
+            self.clients.discard(queue)
+            sender.cancel()
+
+def _car(population, index):
+    return {"x": float(population.x[index]), "y": float(population.y[index]), "angle": float(population.angle[index]),
+            "speed": float(population.speed[index]), "score": int(population.score[index]), "active": bool(population.active[index])}
+
+def _offer(queue, text):
+    # Queues text for a client, discarding its oldest message if the queue is full; returns whether one was dropped
+    dropped = queue.full()
+    if dropped:
+        queue.get_nowait()
+    queue.put_nowait(text)
+    return dropped
+
+async def _respond(writer, status, body):
+    payload = json.dumps(body).encode("utf-8")
+    reason = {200: "OK", 400: "Bad Request", 404: "Not Found"}[status]
+    writer.write((f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                  "Connection: close\r\n\r\n").encode("ascii") + payload)
+    await writer.drain()
+
+async def _send_frames(writer, queue):
+    while True:
+        text = await queue.get()
+        writer.write(_frame(0x1, text.encode("utf-8")))
+        await writer.drain()
+
+def _frame(opcode, payload):
+    # A final, unmasked server frame
+    length = len(payload)
+    if length < 126:
+        header = struct.pack(">BB", 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack(">BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+async def _read_frame(reader):
+    # One client frame as (opcode, unmasked payload); fragmented messages are not supported
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", await reader.readexactly(8))[0]
+    if length > MAX_FRAME:
+        raise ValueError("WebSocket frame too large")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask is not None:
+        payload = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return first & 0x0F, payload
@@ -1,16 +1,74 @@
-import pygame
 import math
+import numpy as np
+from TrackGeometry import cached_geometry
+from TrackDefinitions import build_track
 
 class Track:
-    def __init__(self, width, height, car_width):
+    def __init__(self, width, height, car_width, grid_cell_size=20.0, cache_dir=None, definition=None):
+        # definition: optional TrackDefinitions dict (a track file, spline or random track); without one
+        # the default ellipse is generated
         self.width = width
         self.height = height
+        self.car_width = car_width
+        self.grid_cell_size = grid_cell_size
+        self.definition = definition
+        self.cache_dir = cache_dir
         self.track_width = car_width * 2.5  # Ensure ample space for the car
+        if definition is not None:
+            self.track_width = definition.get("track_width", self.track_width)
         self.outer_points = []
         self.inner_points = []
         self.center_points = []
         self.gates = [] # List to store gate coordinates
+        self.occupancy = None # Optional OccupancyRaster, see build_occupancy
+
+        # Read-only arrays shared by every query path; identical parameters reuse the cached geometry
+        # from memory or cache_dir instead of generating the track again
+        self.geometry = cached_geometry(self.geometry_params(), self._generate_geometry, cache_dir)
+        geometry = self.geometry
+        self.outer_points = [tuple(point) for point in geometry.outer_points.tolist()]
+        self.inner_points = [tuple(point) for point in geometry.inner_points.tolist()]
+        self.center_points = [tuple(point) for point in geometry.center_points.tolist()]
+        self.gates = [(tuple(p1), tuple(p2)) for p1, p2 in zip(geometry.gate_p1.tolist(), geometry.gate_p2.tolist())]
+
+        # Edge arrays for the batched polygon test, in the order point_in_polygon visits them, and banded
+        # indexes over them so exact on-track tests only look at the edges level with the point
+        self.outer_edges = geometry.outer_edges
+        self.inner_edges = geometry.inner_edges
+        self.outer_bands, self.inner_bands = geometry.edge_bands(grid_cell_size)
+
+        # Spatial index of every boundary segment (outer first, then inner) for ray casting
+        self.segment_grid = geometry.segment_grid(grid_cell_size)
+
+    def __getstate__(self):
+        # Only the parameters and the geometry's source arrays are sent to other processes. The point
+        # lists, indexes and occupancy raster are rebuilt on arrival, from the in-memory or disk caches.
+        occupancy = None
+        if self.occupancy is not None:
+            occupancy = (self.occupancy.resolution, self.occupancy.exact, self.occupancy.cache_dir)
+        return {"width": self.width, "height": self.height, "car_width": self.car_width, "grid_cell_size": self.grid_cell_size,
+                "cache_dir": self.cache_dir, "definition": self.definition, "geometry": self.geometry, "occupancy": occupancy}
+
+    def __setstate__(self, state):
+        # Unpickling the geometry put it in the memory cache, so it is not generated again
+        self.__init__(state["width"], state["height"], state["car_width"], state["grid_cell_size"], state["cache_dir"],
+                      state["definition"])
+        if state["occupancy"] is not None:
+            self.build_occupancy(*state["occupancy"])
+
+    def geometry_params(self):
+        # Everything the geometry depends on
+        if self.definition is not None:
+            return {"kind": "definition", "definition": self.definition, "width": self.width, "height": self.height,
+                    "car_width": self.car_width}
+        return {"kind": "ellipse", "width": self.width, "height": self.height, "car_width": self.car_width}
+
+    def _generate_geometry(self):
+        if self.definition is not None:
+            return build_track(self.definition, self.width, self.height, self.track_width)
         self.generate_track()
+        return (self.outer_points, self.inner_points, self.center_points,
+                [gate[0] for gate in self.gates], [gate[1] for gate in self.gates])
 
     def generate_track(self):
         center_x, center_y = self.width / 2, self.height / 2
@@ -69,6 +127,14 @@ class Track:
             
             self.gates.append(((gate_p1_x, gate_p1_y), (gate_p2_x, gate_p2_y)))
 
+    def get_start_pose(self):
+        # Cars start on the center line at the first point, facing along the track
+        p1 = self.center_points[0]
+        p2 = self.center_points[1]
+        dx = p2[0] - p1[0]
+        dy = p2[1] - p1[1]
+        return p1[0], p1[1], math.degrees(math.atan2(-dy, dx))
+
     def point_in_polygon(self, point, polygon):
         x, y = point
         n = len(polygon)
@@ -86,9 +152,33 @@ class Track:
             p1x, p1y = p2x, p2y
         return inside
 
+    def build_occupancy(self, resolution=1.0, exact=True, cache_dir=None):
+        # Precompute an on-track bitmap so is_on_track and is_on_track_batch become constant time lookups.
+        # With exact=False, points near the boundary use the bitmap too instead of the polygon test.
+        from OccupancyRaster import OccupancyRaster
+        self.occupancy = OccupancyRaster(self, resolution, exact, cache_dir)
+        return self.occupancy
+
     def is_on_track(self, point):
+        if self.occupancy is not None:
+            return self.occupancy.contains(point)
+        return self.polygon_is_on_track(point)
+
+    def polygon_is_on_track(self, point):
         # A point is on the track if it's inside the outer boundary but outside the inner one.
-        return self.point_in_polygon(point, self.outer_points) and not self.point_in_polygon(point, self.inner_points)
+        # Same result as point_in_polygon on both boundaries, testing only the edges level with the point.
+        return self.outer_bands.contains(point) and not self.inner_bands.contains(point)
+
+    def is_on_track_batch(self, xs, ys):
+        # Vectorized is_on_track for arrays of x and y coordinates
+        if self.occupancy is not None:
+            return self.occupancy.contains_batch(xs, ys)
+        return self.polygon_is_on_track_batch(xs, ys)
+
+    def polygon_is_on_track_batch(self, xs, ys):
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        return self.outer_bands.contains_batch(xs, ys) & ~self.inner_bands.contains_batch(xs, ys)
 
     def get_ray_intersection_with_track_boundary(self, start_point, angle_degrees, ray_length):
         # Calculate the end point of the ray
@@ -99,59 +189,38 @@ class Track:
         p1 = start_point
         p2 = (end_point_x, end_point_y)
 
-        # Check intersection with outer boundary
-        intersection = self._get_line_segment_polygon_intersection(p1, p2, self.outer_points)
-        if intersection:
-            return intersection
-        
-        # Check intersection with inner boundary
-        intersection = self._get_line_segment_polygon_intersection(p1, p2, self.inner_points)
-        if intersection:
-            return intersection
-        
-        return None
-
-    def _get_line_segment_polygon_intersection(self, p1, p2, polygon):
-        # Helper to find the closest intersection point of a line segment with a polygon
-        closest_intersection = None
-        min_dist_sq = float('inf')
-
-        for i in range(len(polygon)):
-            p3 = polygon[i]
-            p4 = polygon[(i + 1) % len(polygon)]
-            
-            intersection = self._get_line_segment_intersection(p1, p2, p3, p4)
-            if intersection:
-                dist_sq = (p1[0] - intersection[0])**2 + (p1[1] - intersection[1])**2
-                if dist_sq < min_dist_sq:
-                    min_dist_sq = dist_sq
-                    closest_intersection = intersection
-        return closest_intersection
-
-    def _get_line_segment_intersection(self, p1, p2, p3, p4):
-        # Helper to find the intersection point of two line segments
-        # p1, p2: segment 1
-        # p3, p4: segment 2
-
+        # Closest intersection with either boundary, visiting only the grid cells the ray passes through
+        return self.segment_grid.ray_intersection(p1, p2)
+
+    def cast_rays(self, origins, angles, max_len):
+        # Batched get_ray_intersection_with_track_boundary: distance from each origin to the closest
+        # boundary along its ray (angles in degrees), or max_len when no wall is within reach
+        origins = np.asarray(origins, dtype=float)
+        x, y = origins[:, 0], origins[:, 1]
+        rad_angle = np.radians(angles)
+        end_point_x = x + max_len * np.cos(rad_angle)
+        end_point_y = y - max_len * np.sin(rad_angle) # Pygame y-axis is inverted
+        dist_sq = self.segment_grid.cast_rays(x, y, end_point_x - x, end_point_y - y)
+        return np.where(np.isfinite(dist_sq), np.sqrt(dist_sq), float(max_len))
+
+    def get_time_of_impact(self, p1, p2):
+        # Fraction of the way from p1 to p2 at which the path first touches a boundary, or inf if it never does
         s1_x, s1_y = p2[0] - p1[0], p2[1] - p1[1]
-        s2_x, s2_y = p4[0] - p3[0], p4[1] - p3[1]
-
-        denominator = (-s2_x * s1_y + s1_x * s2_y)
-        if denominator == 0: # Parallel lines
-            return None
-
-        s = (-s1_y * (p1[0] - p3[0]) + s1_x * (p1[1] - p3[1])) / denominator
-        t = ( s2_x * (p1[1] - p3[1]) - s2_y * (p1[0] - p3[0])) / denominator
-
-        if 0 <= s <= 1 and 0 <= t <= 1:
-            # Intersection detected
-            intersection_x = p1[0] + (t * s1_x)
-            intersection_y = p1[1] + (t * s1_y)
-            return (intersection_x, intersection_y)
-
-        return None
+        dist_sq = self.segment_grid._closest_hit(p1[0], p1[1], s1_x, s1_y)[1]
+        if dist_sq == math.inf:
+            return math.inf
+        return math.sqrt(dist_sq / (s1_x * s1_x + s1_y * s1_y))
+
+    def times_of_impact(self, x1, y1, x2, y2):
+        # Batched get_time_of_impact for paths from (x1, y1) to (x2, y2)
+        s1_x, s1_y = x2 - x1, y2 - y1
+        dist_sq = self.segment_grid.cast_rays(x1, y1, s1_x, s1_y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(np.isfinite(dist_sq), np.sqrt(dist_sq / (s1_x * s1_x + s1_y * s1_y)), np.inf)
 
     def draw(self, screen):
+        import pygame # Only renderers draw; the simulation itself never needs pygame
+
         # Draw the track surface
         pygame.draw.polygon(screen, (128, 128, 128), self.outer_points) # Gray for the track
         pygame.draw.polygon(screen, (30, 30, 30), self.inner_points)   # Dark gray for the infield
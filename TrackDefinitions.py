@@ -0,0 +1,153 @@
+import json
+import math
+import numpy as np
+
+# Track definitions are plain JSON-compatible dicts, so they can be hashed for the geometry cache and
+# stored in checkpoints. Every kind describes a closed center line; the boundaries are offset from it
+# by half the track width on either side and gates are placed along it at a fixed spacing.
+#   {"kind": "polyline", "points": [[x, y], ...]}
+#   {"kind": "spline", "points": [[x, y], ...], "samples_per_span": 16}   (closed Catmull-Rom curve)
+#   {"kind": "random", "vertices": 4000, "seed": 1, "harmonics": 5, "roughness": 0.25}
+# Optional keys for every kind: "track_width" (pixels) and "gate_spacing" (pixels along the center line).
+DEFAULT_GATE_SPACING = 50.0
+DEFAULT_SAMPLES_PER_SPAN = 16
+KINDS = ("polyline", "spline", "random")
+
+def load_track_file(path):
+    # Reads a track file: a JSON object with "points" (the center line, or spline control points if
+    # "spline" is true) and the optional keys above
+    with open(path) as f:
+        data = json.load(f)
+    if "points" not in data:
+        raise ValueError(f"{path}: a track file needs a list of center line \"points\"")
+    definition = {"kind": "spline" if data.get("spline") else "polyline",
+                  "points": [[float(x), float(y)] for x, y in data["points"]]}
+    if definition["kind"] == "spline":
+        definition["samples_per_span"] = int(data.get("samples_per_span", DEFAULT_SAMPLES_PER_SPAN))
+    for key in ("track_width", "gate_spacing"):
+        if key in data:
+            definition[key] = float(data[key])
+    validate_definition(definition)
+    return definition
+
+def random_track(vertices, seed=None, harmonics=5, roughness=0.25, gate_spacing=DEFAULT_GATE_SPACING):
+    # Definition of a procedural track with the given number of center line vertices. The seed is fixed
+    # here so the definition always describes the same track (and caches and checkpoints stay valid).
+    if seed is None:
+        seed = int(np.random.SeedSequence().entropy % 2**63)
+    return {"kind": "random", "vertices": int(vertices), "seed": seed, "harmonics": int(harmonics),
+            "roughness": float(roughness), "gate_spacing": float(gate_spacing)}
+
+def validate_definition(definition):
+    kind = definition.get("kind")
+    if kind not in KINDS:
+        raise ValueError(f"Unknown track kind {kind!r} (expected one of {', '.join(KINDS)})")
+    if kind == "random":
+        if definition["vertices"] < 16:
+            raise ValueError("A random track needs at least 16 vertices")
+    elif len(definition["points"]) < 3:
+        raise ValueError("A track needs at least 3 center line points")
+    if definition.get("gate_spacing", DEFAULT_GATE_SPACING) <= 0:
+        raise ValueError("gate_spacing must be positive")
+
+def catmull_rom(points, samples_per_span):
+    # Closed uniform Catmull-Rom curve through points, samples_per_span samples between each pair
+    p0 = np.roll(points, 1, axis=0)
+    p1 = points
+    p2 = np.roll(points, -1, axis=0)
+    p3 = np.roll(points, -2, axis=0)
+    t = (np.arange(samples_per_span) / samples_per_span)[None, :, None]
+    curve = 0.5 * ((2 * p1[:, None]) + (p2 - p0)[:, None] * t + (2 * p0 - 5 * p1 + 4 * p2 - p3)[:, None] * t**2 +
+                   (3 * p1 - p0 - 3 * p2 + p3)[:, None] * t**3)
+    return curve.reshape(-1, 2)
+
+def random_center_line(definition, width, height, track_width):
+    # A star-shaped loop: an ellipse fitted to the window, with its radius modulated by a few random
+    # low harmonics. Candidates whose curves are too tight for the track width are drawn again.
+    rng = np.random.default_rng(definition["seed"])
+    vertices = definition["vertices"]
+    center_x, center_y = width / 2, height / 2
+    radius_x = width / 2 - 60 - track_width / 2 # Same margin from the screen edge as the default track
+    radius_y = height / 2 - 60 - track_width / 2
+    check = np.linspace(0, 2 * math.pi, 4096, endpoint=False) # Dense sampling for the curvature check
+    theta = np.linspace(0, 2 * math.pi, vertices, endpoint=False)
+    for _ in range(100):
+        orders = np.arange(2, definition["harmonics"] + 2)
+        amplitudes = rng.uniform(0, definition["roughness"], len(orders)) / orders
+        phases = rng.uniform(0, 2 * math.pi, len(orders))
+
+        def loop(angles):
+            radius = 1 + (amplitudes[:, None] * np.cos(orders[:, None] * angles + phases[:, None])).sum(axis=0)
+            return np.column_stack([radius * np.cos(angles), radius * np.sin(angles)])
+
+        scale = np.abs(loop(check)).max(axis=0)
+        def fitted(angles):
+            unit = loop(angles) / scale
+            return np.column_stack([center_x + radius_x * unit[:, 0], center_y + radius_y * unit[:, 1]])
+
+        if min_turn_radius(fitted(check)) > track_width * 0.6:
+            return fitted(theta)
+    raise ValueError("Could not generate a random track whose curves fit the track width; try a lower roughness")
+
+def min_turn_radius(points):
+    # Smallest radius of curvature along a closed polyline, from the circle through each vertex and its neighbours
+    a = np.roll(points, 1, axis=0) - points
+    b = np.roll(points, -1, axis=0) - points
+    c = a - b
+    cross = np.abs(a[:, 0] * b[:, 1] - a[:, 1] * b[:, 0])
+    with np.errstate(divide='ignore'):
+        radius = np.hypot(*a.T) * np.hypot(*b.T) * np.hypot(*c.T) / (2 * cross)
+    return radius.min()
+
+def center_line(definition, width, height, track_width):
+    kind = definition["kind"]
+    if kind == "random":
+        return random_center_line(definition, width, height, track_width)
+    points = np.array(definition["points"], dtype=float)
+    if np.array_equal(points[0], points[-1]):
+        points = points[:-1] # The loop closes itself
+    if kind == "spline":
+        return catmull_rom(points, definition.get("samples_per_span", DEFAULT_SAMPLES_PER_SPAN))
+    return points
+
+def signed_area(points):
+    x, y = points[:, 0], points[:, 1]
+    return 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+
+def build_track(definition, width, height, track_width):
+    # Returns (outer_points, inner_points, center_points, gate_p1, gate_p2) for a definition.
+    # Boundary point i is the center line point i moved half the track width along its normal, so
+    # outer_points[0], inner_points[0] and center_points[0] line up across the start line.
+    validate_definition(definition)
+    track_width = definition.get("track_width", track_width)
+    center = center_line(definition, width, height, track_width)
+    if min_turn_radius(center) < track_width / 2:
+        raise ValueError("The center line bends tighter than half the track width, so its inner boundary would cross itself")
+
+    # Vertex normals from the central difference of the neighbouring points
+    tangent = np.roll(center, -1, axis=0) - np.roll(center, 1, axis=0)
+    tangent /= np.hypot(*tangent.T)[:, None]
+    normal = np.column_stack([-tangent[:, 1], tangent[:, 0]])
+    left = center + normal * track_width / 2
+    right = center - normal * track_width / 2
+    outer, inner = (left, right) if abs(signed_area(left)) > abs(signed_area(right)) else (right, left)
+
+    gate_p1, gate_p2 = place_gates(center, track_width, definition.get("gate_spacing", DEFAULT_GATE_SPACING))
+    return outer, inner, center, gate_p1, gate_p2
+
+def place_gates(center, track_width, spacing):
+    # Gates perpendicular to the center line, evenly spread by arc length with the first one at the start.
+    # The spacing is rounded so the last gate is as far from the first as from the one before it.
+    following = np.roll(center, -1, axis=0)
+    lengths = np.hypot(*(following - center).T)
+    cumulative = np.concatenate([[0], np.cumsum(lengths)])
+    count = max(int(round(cumulative[-1] / spacing)), 2)
+    positions = np.arange(count) * (cumulative[-1] / count)
+
+    segment = np.clip(np.searchsorted(cumulative, positions, side='right') - 1, 0, len(center) - 1)
+    t = ((positions - cumulative[segment]) / np.where(lengths[segment] > 0, lengths[segment], 1))[:, None]
+    direction = following[segment] - center[segment]
+    gate_center = center[segment] + t * direction
+    gate_angle = np.arctan2(direction[:, 1], direction[:, 0]) + math.pi / 2
+    offset = np.column_stack([np.cos(gate_angle), np.sin(gate_angle)]) * track_width / 2
+    return gate_center + offset, gate_center - offset
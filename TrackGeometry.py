@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+from SegmentGrid import SegmentGrid
+from EdgeBands import EdgeBands
+
+# Bump when the generated geometry or the stored layout changes, so stale disk caches are ignored
+FORMAT_VERSION = 1
+
+# Segment grid cells are sized to hold about this many segment lengths, between MIN_CELL_SIZE and the
+# track's grid_cell_size, so dense tracks get finer cells instead of more segments per cell
+SEGMENTS_PER_CELL = 8
+MIN_CELL_SIZE = 1.0
+
+# Geometry already built in this process, by content key
+_memory_cache = {}
+
+def _frozen(values):
+    array = np.ascontiguousarray(values, dtype=float)
+    array.flags.writeable = False
+    return array
+
+class TrackGeometry:
+    # Read-only arrays describing a track, computed once and shared by every query path.
+    # Boundary segments are the outer polygon's edges followed by the inner polygon's, each running from
+    # a point to the next one. Bounds are (min_x, min_y, max_x, max_y) per segment.
+    SOURCE_ARRAYS = ("outer_points", "inner_points", "center_points", "gate_p1", "gate_p2")
+
+    def __init__(self, key, outer_points, inner_points, center_points, gate_p1, gate_p2):
+        self.key = key
+        self.outer_points = _frozen(outer_points)
+        self.inner_points = _frozen(inner_points)
+        self.center_points = _frozen(center_points)
+        self.gate_p1 = _frozen(gate_p1)
+        self.gate_p2 = _frozen(gate_p2)
+        self._derive()
+
+    def _derive(self):
+        self.gate_centers = _frozen((self.gate_p1 + self.gate_p2) / 2)
+
+        starts = np.vstack([self.outer_points, self.inner_points])
+        ends = np.vstack([np.roll(self.outer_points, -1, axis=0), np.roll(self.inner_points, -1, axis=0)])
+        self.segment_starts = _frozen(starts)
+        self.segment_ends = _frozen(ends)
+        self.segment_directions = _frozen(ends - starts)
+        self.segment_bounds = _frozen(np.hstack([np.minimum(starts, ends), np.maximum(starts, ends)]))
+
+        # (p1x, p1y, p2x, p2y) edge arrays in the order Track.point_in_polygon visits them
+        self.outer_edges = self._polygon_edges(self.outer_points)
+        self.inner_edges = self._polygon_edges(self.inner_points)
+        self._segment_grids = {} # Cell size -> SegmentGrid
+        self._edge_bands = {} # Band height -> (outer, inner) EdgeBands
+
+    def _polygon_edges(self, points):
+        p1 = np.roll(points, 1, axis=0)
+        return _frozen(p1[:, 0]), _frozen(p1[:, 1]), _frozen(points[:, 0]), _frozen(points[:, 1])
+
+    def __getstate__(self):
+        # Only the source arrays travel to worker processes; everything else is derived again on arrival
+        state = {name: np.asarray(getattr(self, name)) for name in self.SOURCE_ARRAYS}
+        state["key"] = self.key
+        return state
+
+    def __setstate__(self, state):
+        self.key = state["key"]
+        for name in self.SOURCE_ARRAYS:
+            setattr(self, name, _frozen(state[name]))
+        self._derive()
+        _memory_cache.setdefault(self.key, self)
+
+    def grid_cell_size(self, max_cell_size):
+        median_length = float(np.median(np.hypot(*self.segment_directions.T)))
+        return min(float(max_cell_size), max(MIN_CELL_SIZE, SEGMENTS_PER_CELL * median_length))
+
+    def segment_grid(self, max_cell_size):
+        # Ray casting index over the boundary segments, built once per cell size. Grids made finer than
+        # max_cell_size for a dense track let rays jump across empty cells.
+        cell_size = self.grid_cell_size(max_cell_size)
+        if cell_size not in self._segment_grids:
+            self._segment_grids[cell_size] = SegmentGrid(self.segment_starts, self.segment_ends, cell_size,
+                                                         self.segment_directions, self.segment_bounds,
+                                                         skip_empty=cell_size < max_cell_size)
+        return self._segment_grids[cell_size]
+
+    def edge_bands(self, max_band_height):
+        # (outer, inner) banded edge indexes for exact point in polygon tests, built once per band height
+        band_height = self.grid_cell_size(max_band_height)
+        if band_height not in self._edge_bands:
+            self._edge_bands[band_height] = (EdgeBands(self.outer_edges, band_height), EdgeBands(self.inner_edges, band_height))
+        return self._edge_bands[band_height]
+
+    def save(self, path):
+        # Written to a temporary file of its own first, so a half-written cache is never picked up, even
+        # when several processes build the same track at once
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **{name: getattr(self, name) for name in self.SOURCE_ARRAYS})
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, key, path):
+        with np.load(path) as data:
+            return cls(key, *(data[name] for name in cls.SOURCE_ARRAYS))
+
+def geometry_key(params):
+    # Content hash of the parameters that fully determine a track's geometry
+    text = json.dumps(dict(params, format_version=FORMAT_VERSION), sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+def cached_geometry(params, generate, cache_dir=None):
+    # Returns the TrackGeometry for params, from memory, then from cache_dir, and only calls
+    # generate() -> (outer_points, inner_points, center_points, gate_p1, gate_p2) when neither has it
+    key = geometry_key(params)
+    geometry = _memory_cache.get(key)
+    if geometry is not None:
+        return geometry
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = os.path.join(cache_dir, f"track_{key}.npz")
+    if cache_path is not None and os.path.exists(cache_path):
+        geometry = TrackGeometry.load(key, cache_path)
+    else:
+        geometry = TrackGeometry(key, *generate())
+        if cache_path is not None:
+            geometry.save(cache_path)
+    _memory_cache[key] = geometry
+    return geometry
@@ -0,0 +1,156 @@
+import time
+import pygame
+
+# Colors
+BLACK = (0, 0, 0)
+
+# Colors for cars
+CAR_COLORS = [
+    (255, 0, 0),    # Red
+    (0, 255, 0),    # Green
+    (0, 0, 255),    # Blue
+    (255, 255, 0),  # Yellow
+    (255, 0, 255),  # Magenta
+    (0, 255, 255),  # Cyan
+    (255, 128, 0),  # Orange
+    (128, 0, 255),  # Purple
+    (0, 128, 255),  # Light Blue
+    (139, 69, 19)   # Brown
+]
+
+# Cars turn in 5 degree steps, so sprites are pre-rotated in 5 degree buckets
+ANGLE_BUCKETS = 72
+
+# Frame cap when every tick is rendered
+MAX_FPS = 1000
+
+# Events are still handled at least this often (seconds) while frames are being skipped
+EVENT_INTERVAL = 0.1
+
+class Viewer:
+    # Pygame observer that draws the simulation. Either renders one frame every ticks_per_frame simulation
+    # steps, or, with render_fps set, at most render_fps frames per wall-clock second whatever the step rate.
+    # + and - double and halve the current ratio at runtime.
+    def __init__(self, screen, track, ticks_per_frame=1, render_fps=None):
+        self.screen = screen
+        self.track = track
+        self.ticks_per_frame = max(int(ticks_per_frame), 1)
+        self.render_fps = render_fps
+        self.clock = pygame.time.Clock()
+        self.score_font = pygame.font.Font(None, 24) # Smaller font for multiple scores
+        self.generation_font = pygame.font.Font(None, 30)
+        self.background = None # Track drawn once, see get_background
+        self.car_images = {} # One sprite per car color
+        self.rotated_images = {} # (color, angle bucket) -> rotated sprite
+        self.text_images = {} # (font size, text) -> rendered text
+        self.ticks_since_frame = 0
+        self.last_frame_time = 0.0
+        self.last_event_time = 0.0
+
+    def get_background(self):
+        if self.background is None:
+            self.background = pygame.Surface(self.screen.get_size()).convert()
+            self.background.fill(BLACK)
+            self.track.draw(self.background)
+        return self.background
+
+    def get_car_image(self, index, width, height):
+        color = CAR_COLORS[index % len(CAR_COLORS)]
+        if color not in self.car_images:
+            image = pygame.Surface((width, height), pygame.SRCALPHA)
+            pygame.draw.rect(image, color, (0, 0, width, height))
+            self.car_images[color] = image
+        return self.car_images[color]
+
+    def get_rotated_car_image(self, index, width, height, angle):
+        color = CAR_COLORS[index % len(CAR_COLORS)]
+        bucket = int(round(angle * ANGLE_BUCKETS / 360)) % ANGLE_BUCKETS
+        key = (color, width, height, bucket)
+        if key not in self.rotated_images:
+            self.rotated_images[key] = pygame.transform.rotate(self.get_car_image(index, width, height), bucket * 360 / ANGLE_BUCKETS)
+        return self.rotated_images[key]
+
+    def render_text(self, font, text):
+        key = (id(font), text)
+        if key not in self.text_images:
+            if len(self.text_images) > 1000: # Scores keep changing; drop stale text now and then
+                self.text_images.clear()
+            self.text_images[key] = font.render(text, True, (255, 255, 255))
+        return self.text_images[key]
+
+    def handle_events(self, simulator):
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                simulator.running = False
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    simulator.skip_requested = True # End the current generation and start the next one
+                elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                    self.change_ratio(2)
+                elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                    self.change_ratio(0.5)
+
+    def change_ratio(self, factor):
+        # More ticks per frame, or fewer frames per second, when factor > 1
+        if self.render_fps is not None:
+            self.render_fps = min(max(self.render_fps / factor, 1), MAX_FPS)
+        else:
+            self.ticks_per_frame = max(int(self.ticks_per_frame * factor), 1)
+
+    def frame_due(self, now):
+        if self.render_fps is not None:
+            return now - self.last_frame_time >= 1 / self.render_fps
+        return self.ticks_since_frame >= self.ticks_per_frame
+
+    def on_step(self, simulator):
+        self.ticks_since_frame += 1
+        now = time.perf_counter()
+        if not self.frame_due(now):
+            if now - self.last_event_time >= EVENT_INTERVAL:
+                self.last_event_time = now
+                self.handle_events(simulator)
+            return
+        with simulator.profiler.time("rendering"):
+            self.draw(simulator)
+        self.ticks_since_frame = 0
+        self.last_frame_time = self.last_event_time = time.perf_counter()
+
+    def draw(self, simulator):
+        self.handle_events(simulator)
+
+        self.screen.blit(self.get_background(), (0, 0)) # Clear the screen and draw the track in one blit
+
+        population = simulator.population
+        for i in range(population.size):
+            rotated_car = self.get_rotated_car_image(i, population.width, population.height, population.angle[i])
+            rotated_rect = rotated_car.get_rect(center=(int(population.x[i]), int(population.y[i])))
+            self.screen.blit(rotated_car, rotated_rect.topleft)
+
+            # Display score for each car (for debugging/visualization), as far down as the screen goes
+            if 10 + i * 20 > self.screen.get_height():
+                continue
+            text = self.render_text(self.score_font, f"Score: {population.score[i]}")
+            text_rect = text.get_rect(topleft=(30, 10 + i * 20))
+            self.screen.blit(text, text_rect)
+
+            # Draw color box next to score
+            color_box_size = 15
+            color_box_rect = pygame.Rect(10, text_rect.centery - color_box_size // 2, color_box_size, color_box_size)
+            pygame.draw.rect(self.screen, CAR_COLORS[i % len(CAR_COLORS)], color_box_rect)
+
+        # Display generation number and the render ratio
+        gen_text = self.render_text(self.generation_font, f"Generation: {simulator.generation_number}")
+        self.screen.blit(gen_text, (self.screen.get_width() - gen_text.get_width() - 10, 10))
+        if self.render_fps is not None:
+            ratio = f"{self.render_fps:g} frames/s"
+        else:
+            ratio = f"{self.ticks_per_frame} ticks/frame"
+        ratio_text = self.render_text(self.score_font, ratio)
+        self.screen.blit(ratio_text, (self.screen.get_width() - ratio_text.get_width() - 10, 40))
+
+        # Update the display
+        pygame.display.flip()
+
+        # Cap the frame rate; the clock persists between frames so the cap actually holds
+        if self.render_fps is None:
+            self.clock.tick(MAX_FPS)
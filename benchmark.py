@@ -0,0 +1,314 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import platform
+import statistics
+import sys
+import time
+import numpy as np
+from Track import Track
+from Car import Car
+from Policy import MLPPolicy
+from Physics import PhysicsConfig
+from PrefixCache import PrefixCache
+from Evolution import Evolution
+from Simulator import Simulator
+from Evaluator import MultiTrackEvaluator
+from Gene import Gene
+from TrackDefinitions import random_track
+
+# Fixed track and seeds so runs on the same machine are comparable
+TRACK_PARAMS = {"width": 800, "height": 600, "car_width": 40}
+SEED = 1234
+
+def make_track(occupancy=True):
+    track = Track(**TRACK_PARAMS)
+    if occupancy:
+        track.build_occupancy(1.0)
+    return track
+
+def sample_points(track, count, rng):
+    # Points spread over the whole track bounding box, on and off the track
+    xs = rng.uniform(0, track.width, count)
+    ys = rng.uniform(0, track.height, count)
+    return xs, ys
+
+def sample_car_poses(track, count, rng):
+    # Poses along the center line with some jitter, where cars actually drive
+    centers = np.array(track.center_points, dtype=float)
+    picks = centers[rng.integers(0, len(centers), count)]
+    xs = picks[:, 0] + rng.uniform(-10, 10, count)
+    ys = picks[:, 1] + rng.uniform(-10, 10, count)
+    angles = rng.uniform(-180, 180, count)
+    return xs, ys, angles
+
+def bench_is_on_track(track, quick):
+    rng = np.random.default_rng(SEED)
+    xs, ys = sample_points(track, 2000, rng)
+    points = list(zip(xs.tolist(), ys.tolist()))
+    def run():
+        for point in points:
+            track.is_on_track(point)
+    return run, len(points)
+
+def bench_is_on_track_batch(track, quick):
+    rng = np.random.default_rng(SEED)
+    xs, ys = sample_points(track, 40000, rng)
+    return (lambda: track.is_on_track_batch(xs, ys)), len(xs)
+
+def bench_ray_intersection(track, quick):
+    rng = np.random.default_rng(SEED)
+    xs, ys, angles = sample_car_poses(track, 2000, rng)
+    rays = list(zip(xs.tolist(), ys.tolist(), angles.tolist()))
+    def run():
+        for x, y, angle in rays:
+            track.get_ray_intersection_with_track_boundary((x, y), angle, 500)
+    return run, len(rays)
+
+def bench_cast_rays(track, quick):
+    rng = np.random.default_rng(SEED)
+    xs, ys, angles = sample_car_poses(track, 30000, rng)
+    origins = np.column_stack([xs, ys])
+    return (lambda: track.cast_rays(origins, angles, 500)), len(xs)
+
+def bench_cast_rays_on(definition):
+    # cast_rays on a track built from the definition instead of the default one
+    def factory(track, quick):
+        track = Track(**TRACK_PARAMS, definition=definition)
+        return bench_cast_rays(track, quick)
+    return factory
+
+def _cars(track, count, rng):
+    x, y, angle = track.get_start_pose()
+    gene = Gene.random(100000, rng)
+    return [Car(x, y, angle, gene=gene) for _ in range(count)]
+
+def bench_car_update(track, quick):
+    rng = np.random.default_rng(SEED)
+    cars = _cars(track, 200, rng)
+    x, y, angle = track.get_start_pose()
+    steps = 20
+    def run():
+        # Every call replays the same trajectories from the start pose, so the work per call is fixed
+        for car in cars:
+            car.reset(x, y, angle)
+            for _ in range(steps):
+                car.update(track.width, track.height, track, True, False, False, False)
+    return run, len(cars) * steps
+
+def bench_car_decide_actions(track, quick):
+    rng = np.random.default_rng(SEED)
+    cars = _cars(track, 200, rng)
+    def run():
+        for car in cars:
+            car.current_gene_index = 0
+            car.observed_pose = None # Cast the rays every call, as for a moving car
+            car.decide_actions(track)
+    return run, len(cars)
+
+def bench_offspring(num_cars, gene_length):
+    def factory(track, quick):
+        evolution = Evolution(num_cars, gene_length=gene_length, seed=SEED)
+        genes = [Gene.random(gene_length, evolution.rng) for _ in range(num_cars)]
+        fitness = [(1, 1.0, 1, gene_length // 2, True, False)] * num_cars
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()): # next_generation prints the best score
+                evolution.next_generation(genes, fitness)
+        return run, num_cars
+    return factory
+
+def bench_generation(num_cars, gene_length, definition=None, hidden=None, physics=None):
+    # With hidden layer sizes, cars are driven by MLP policies whose episodes last gene_length steps
+    def factory(track, quick):
+        if definition is not None:
+            track = Track(**TRACK_PARAMS, definition=definition)
+            track.build_occupancy(1.0)
+        policy = MLPPolicy(4, hidden, episode_steps=gene_length) if hidden is not None else None
+        evolution = Evolution(num_cars, initial_gene_length=gene_length, seed=SEED, policy=policy)
+        genes = evolution.initial_genes()
+        simulator = Simulator(track, evolution=evolution)
+        if physics is not None:
+            simulator.physics = physics
+        def run():
+            fitness = simulator.run_generation(genes)
+            return sum(car[2] for car in fitness)
+        return run, None # Measured in car-steps, counted after the run
+    return factory
+
+def bench_evolution(num_cars, gene_length, generations, prefix_cache=False):
+    # A short seeded run of several generations, where children share prefixes with their elite as in
+    # training. Measured in car-steps, including those resumed from the prefix cache.
+    def factory(track, quick):
+        def run():
+            evolution = Evolution(num_cars, initial_gene_length=gene_length, gene_length=gene_length, seed=SEED)
+            evolution.gene_length_step = 0 # Genes never grow, so every call does the same work
+            simulator = Simulator(track, evolution=evolution)
+            if prefix_cache:
+                simulator.prefix_cache = PrefixCache()
+            genes = evolution.initial_genes()
+            steps = 0
+            with contextlib.redirect_stdout(io.StringIO()): # next_generation prints the best score
+                for _ in range(generations):
+                    fitness = simulator.run_generation(genes)
+                    steps += sum(car[2] for car in fitness)
+                    genes = evolution.next_generation(genes, fitness)
+            return steps
+        return run, None
+    return factory
+
+def bench_multi_track(num_cars, gene_length, definitions):
+    # One generation scored on the default track and the given ones, in this process. Measured in
+    # car-steps summed over every track.
+    def factory(track, quick):
+        tracks = [track]
+        for definition in definitions:
+            tracks.append(Track(**TRACK_PARAMS, definition=definition))
+            tracks[-1].build_occupancy(1.0)
+        evaluator = MultiTrackEvaluator(tracks, "mean", workers=0)
+        genes = Evolution(num_cars, initial_gene_length=gene_length, seed=SEED).initial_genes()
+        def run():
+            evaluator.evaluate(genes)
+            return sum(evaluator.costs)
+        return run, None
+    return factory
+
+def benchmarks(quick):
+    cases = [
+        ("track.is_on_track", bench_is_on_track),
+        ("track.is_on_track_batch", bench_is_on_track_batch),
+        ("track.get_ray_intersection_with_track_boundary", bench_ray_intersection),
+        ("track.cast_rays", bench_cast_rays),
+        ("car.update", bench_car_update),
+        ("car.decide_actions", bench_car_decide_actions),
+    ]
+    offspring_sizes = [(10, 1000), (10, 100000), (1000, 10000)] if not quick else [(10, 1000), (100, 10000)]
+    for num_cars, gene_length in offspring_sizes:
+        cases.append((f"offspring.cars={num_cars}.gene={gene_length}", bench_offspring(num_cars, gene_length)))
+    # Population size and gene length: longer genes keep the surviving cars driving for more steps
+    generation_sizes = [(10, 300), (100, 300), (1000, 300), (100, 1000), (100, 3000)] if not quick else [(10, 100), (100, 100), (100, 1000)]
+    for num_cars, gene_length in generation_sizes:
+        cases.append((f"generation.cars={num_cars}.gene={gene_length}", bench_generation(num_cars, gene_length)))
+    cases.append(("generation.cars=100.gene=300.continuous", bench_generation(100, 300, physics=PhysicsConfig(continuous=True))))
+    for num_cars in ([100, 1000] if not quick else [100]):
+        cases.append((f"generation.mlp.cars={num_cars}.hidden=16.steps=300", bench_generation(num_cars, 300, hidden=(16,))))
+    for cached in (False, True):
+        suffix = ".prefix_cache" if cached else ""
+        cases.append((f"evolution.cars=10.gene=300.generations=5{suffix}", bench_evolution(10, 300, 5, cached)))
+    cases.append(("multi_track.cars=100.gene=300.tracks=3", bench_multi_track(100, 300, [random_track(50, seed=SEED), random_track(200, seed=SEED + 1)])))
+    # How ray and per car-step cost grow as the track gets more detailed
+    track_vertices = [500, 2000, 10000] if not quick else [500, 5000]
+    for vertices in track_vertices:
+        definition = random_track(vertices, seed=SEED)
+        cases.append((f"track.cast_rays.track_vertices={vertices}", bench_cast_rays_on(definition)))
+        cases.append((f"generation.cars=100.gene=300.track_vertices={vertices}", bench_generation(100, 300, definition)))
+    return cases
+
+def measure(run, units, min_time):
+    # Calls run until min_time has passed and returns the time per unit of work
+    counted = 0
+    start = time.perf_counter()
+    while True:
+        result = run()
+        counted += units if units is not None else result
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / counted
+
+def summarize(timings):
+    # The best repeat is kept: other processes only ever make a repeat slower, so the fastest one varies
+    # least between runs of the same code. The median is reported alongside.
+    seconds = min(timings)
+    return {"seconds_per_op": seconds, "ops_per_sec": 1.0 / seconds if seconds else math.inf,
+            "median_seconds_per_op": statistics.median(timings), "repeats": len(timings), "timings": timings}
+
+def run_benchmarks(selected=None, repeats=5, min_time=1.0, quick=False, names=None):
+    # Repeats go round every benchmark in turn rather than back to back, so a slow spell on a busy
+    # machine costs each benchmark one repeat instead of all of them
+    track = make_track()
+    cases = []
+    for name, factory in benchmarks(quick):
+        if selected and not any(pattern in name for pattern in selected):
+            continue
+        if names is not None and name not in names: # Exact names, when re-measuring
+            continue
+        run, units = factory(track, quick)
+        cases.append((name, run, units, []))
+    for _ in range(repeats):
+        for name, run, units, timings in cases:
+            timings.append(measure(run, units, min_time))
+    results = {}
+    for name, _, _, timings in cases:
+        results[name] = summarize(timings)
+        print(f"{name:<56}{results[name]['ops_per_sec']:>16.1f} ops/sec", file=sys.stderr)
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "platform": platform.platform(),
+            "seed": SEED,
+            "quick": quick,
+        },
+        "results": results,
+    }
+
+def compare(report, baseline, threshold):
+    # Returns the benchmarks that got slower than the baseline by more than threshold (a fraction)
+    regressions = []
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["seconds_per_op"]
+        after = result["seconds_per_op"]
+        change = after / before - 1.0
+        status = "REGRESSION" if change > threshold else "ok"
+        print(f"{name:<56}{change:>+9.1%}  {status}", file=sys.stderr)
+        if change > threshold:
+            regressions.append((name, change))
+    return regressions
+
+def main(argv=None):
+    # Also run as `python main.py benchmark`, which passes its own arguments on
+    parser = argparse.ArgumentParser(description="Benchmark the simulation hot paths.")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file (default: stdout)")
+    parser.add_argument("--baseline", default=None, help="compare against a previous results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown against the baseline, as a fraction")
+    parser.add_argument("--repeats", type=int, default=5, help="timed repeats per benchmark; the fastest is kept")
+    parser.add_argument("--min-time", type=float, default=1.0, help="minimum seconds per timed repeat")
+    parser.add_argument("--retries", type=int, default=2, help="measure benchmarks slower than the baseline again up to this many times before failing")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a fast smoke run")
+    parser.add_argument("--only", nargs="*", default=None, help="run only benchmarks whose name contains one of these strings")
+    args = parser.parse_args(argv)
+
+    report = run_benchmarks(args.only, args.repeats, args.min_time, args.quick)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        # A busy machine can slow everything down for minutes at a time, so a slowdown only counts if the
+        # benchmark is still slower when measured again later; the new repeats join the earlier ones
+        for _ in range(args.retries):
+            if not regressions:
+                break
+            names = [name for name, _ in regressions]
+            print(f"Measuring {len(names)} benchmark(s) again", file=sys.stderr)
+            again = run_benchmarks(None, args.repeats, args.min_time, args.quick, names)
+            for name in names:
+                report["results"][name] = summarize(report["results"][name]["timings"] + again["results"][name]["timings"])
+            regressions = compare({"results": {name: report["results"][name] for name in names}}, baseline, args.threshold)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,223 +1,352 @@
-import pygame
-import math
-import random
-from Car import Car
+import argparse
+import sys
 from Track import Track
-
-# Initialize Pygame
-pygame.init()
+from TrackDefinitions import load_track_file, random_track
+from Simulator import Simulator
+from Pruning import PruningPolicy
+from Sensors import RaySensor
+from Policy import MLPPolicy
+from Evolution import Evolution
+from Physics import PhysicsConfig
+from PrefixCache import PrefixCache
+from Metrics import Profiler
+from Checkpoint import Checkpointer, load_checkpoint, restore_evolution
 
 # Screen dimensions
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 
-# Create the screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-pygame.display.set_caption("Racer")
-
-# Colors
-BLACK = (0, 0, 0)
+NUM_CARS = 10
 
-# Create a track
 # We need to know the car's width to create the track with appropriate spacing
-# Let's define a temporary car_width for now
-temp_car_width = 40 # Assuming car width is 40
-track = Track(SCREEN_WIDTH, SCREEN_HEIGHT, temp_car_width)
+CAR_WIDTH = 40
+
+# Precomputed track data is cached here between runs
+CACHE_DIR = ".cache"
+
+COMMANDS = ("train", "view", "replay", "benchmark")
+
+def finish(checkpointer, profiler, simulator, genes, profile_summary, recorder=None, telemetry=None):
+    # The generation that would run next is saved, so resuming picks up exactly where this run stopped
+    if telemetry is not None:
+        telemetry.close()
+    if recorder is not None:
+        recorder.close()
+    if checkpointer is not None:
+        checkpointer.close()
+        checkpointer.save_now(simulator.evolution, genes, simulator.track, simulator.physics, simulator.sensor, simulator.pruning)
+    if profiler is not None:
+        if profile_summary:
+            print(profiler.summary_table())
+        profiler.close()
+
+def run_islands(args, track, evolution, pruning, sensor, physics, prefix_cache):
+    # Trains one population per process, with the best genomes migrating between them
+    from Islands import IslandModel
+    with IslandModel(track, evolution, args.islands, args.migration_topology, args.migrate_every, args.migrants,
+                     pruning, sensor, physics, args.seed, prefix_cache) as model:
+        first_lap = model.run(args.generations)
+    if first_lap is None:
+        print(f"No island completed a full lap of {len(track.gates)} gates")
+    else:
+        generation, island, seconds = first_lap
+        print(f"First full lap: generation {generation} on island {island}, after {seconds:.1f} s")
+    score, distance = model.best[1][:2]
+    print(f"Best car: {score} gates, {distance:.2f} distance")
+
+def eval_track_params(spec, gate_spacing):
+    # Track parameters for an --eval-tracks entry: "ellipse", "random:VERTICES[:SEED]" or a track file
+    params = {"width": SCREEN_WIDTH, "height": SCREEN_HEIGHT, "car_width": CAR_WIDTH}
+    if spec == "ellipse":
+        return params
+    if spec.startswith("random:"):
+        fields = spec.split(":")[1:]
+        if not 1 <= len(fields) <= 2:
+            raise ValueError(f"bad random track {spec!r}, expected random:VERTICES[:SEED]")
+        params["definition"] = random_track(int(fields[0]), int(fields[1]) if len(fields) > 1 else None)
+    else:
+        params["definition"] = load_track_file(spec)
+    if gate_spacing is not None:
+        params["definition"]["gate_spacing"] = gate_spacing
+    return params
+
+def replay(args):
+    # Plays a recorded run back in the viewer, on the track it was recorded on
+    import pygame
+    from Replay import ReplayReader, ReplayPlayer
+    from Viewer import Viewer
+
+    reader = ReplayReader(args.replay)
+    generations = [args.replay_generation] if args.replay_generation is not None else None
+    if generations and generations[0] not in reader.generations():
+        raise SystemExit(f"Generation {args.replay_generation} is not in {args.replay} (recorded: {reader.generations()})")
+    track = Track(**reader.run["track"], cache_dir=CACHE_DIR)
+    player = ReplayPlayer(reader, generations, args.replay_elite)
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Racer replay")
+    player.add_observer(Viewer(screen, track, args.ticks_per_frame, args.render_fps))
+    player.run()
+    pygame.quit()
+
+def add_training_arguments(parser):
+    parser.add_argument("--generations", type=int, default=None, help="number of generations to run (default: until closed)")
+    parser.add_argument("--seed", type=int, default=None, help="random seed for the genetic algorithm")
+    parser.add_argument("--workers", type=int, default=0, help="evaluate generations in this many worker processes (headless only)")
+    parser.add_argument("--islands", type=int, default=0, help="evolve this many populations in separate processes, exchanging their best genomes (headless only)")
+    parser.add_argument("--migration-topology", choices=("ring", "full"), default="ring", help="which islands receive each island's migrants")
+    parser.add_argument("--migrate-every", type=int, default=5, help="generations between migrations")
+    parser.add_argument("--migrants", type=int, default=1, help="top genomes each island sends per migration")
+    parser.add_argument("--eval-tracks", nargs="+", default=None, metavar="TRACK", help="also score every genome on these tracks: track files, random:VERTICES[:SEED] or ellipse (headless only)")
+    parser.add_argument("--track-reducer", default="mean", help="how scores on several tracks are combined: mean, min, max, median or pN for the Nth percentile")
+    parser.add_argument("--checkpoint", default=None, help="save the evolution state to this file periodically and on exit")
+    parser.add_argument("--checkpoint-every", type=int, default=10, help="generations between checkpoints")
+    parser.add_argument("--resume", default=None, help="continue training from this checkpoint file")
+    parser.add_argument("--gate-patience", type=int, default=None, help="prune cars that pass no gate within this many steps")
+    parser.add_argument("--stall-window", type=int, default=None, help="prune cars that move less than --stall-distance within this many steps")
+    parser.add_argument("--stall-distance", type=float, default=1.0, help="minimum distance in pixels per stall window")
+    parser.add_argument("--elite-bound", action="store_true", help="prune cars that can no longer reach the best score so far")
+    parser.add_argument("--metrics", default=None, help="write per-generation timings and statistics to this .jsonl or .csv file")
+    parser.add_argument("--profile-summary", action="store_true", help="print a table of where the time went when the run ends")
+    parser.add_argument("--track", default=None, help="load the track from this JSON file (see tracks/)")
+    parser.add_argument("--random-track", type=int, default=None, metavar="VERTICES", help="generate a random track with this many center line vertices")
+    parser.add_argument("--track-seed", type=int, default=None, help="seed for --random-track")
+    parser.add_argument("--gate-spacing", type=float, default=None, help="distance in pixels between gates along the center line of a file or random track")
+    parser.add_argument("--occupancy-resolution", type=float, default=1.0, help="cell size in pixels of the on-track bitmap (0 disables it)")
+    parser.add_argument("--rays", default="0,45,-45", help="comma separated sensor ray angles in degrees relative to the heading (must include 0, 45 and -45 for the tape controller)")
+    parser.add_argument("--ray-length", type=float, default=500, help="how far in pixels the sensor rays reach")
+    parser.add_argument("--sensor-quantum", type=float, default=None, help="snap sensor poses to this many pixels and memoize the readings (approximate, default: exact)")
+    parser.add_argument("--controller", choices=("tape", "mlp"), default="tape", help="evolve action tapes steered by the built-in rules, or neural network policies")
+    parser.add_argument("--hidden", default="16", help="comma separated hidden layer sizes of the mlp controller")
+    parser.add_argument("--episode-steps", type=int, default=5000, help="steps each mlp controlled car may drive per generation")
+    parser.add_argument("--continuous-collision", action="store_true", help="sweep the cars' corners along each step so fast cars cannot pass through walls")
+    parser.add_argument("--dt", type=float, default=1.0, help="frames of simulated time per physics tick")
+    parser.add_argument("--substeps", type=int, default=1, help="integration substeps per physics tick")
+    parser.add_argument("--action-repeat", type=int, default=1, help="physics ticks each gene action is held for; genes get proportionally shorter")
+    parser.add_argument("--prefix-cache", type=float, default=0, metavar="MB", help="resume cars from cached states of gene prefixes seen before, using up to this much memory")
+    parser.add_argument("--prefix-interval", type=int, default=10, help="gene steps between the prefix cache's snapshots")
+    parser.add_argument("--telemetry-port", type=int, default=None, help="serve live progress and accept control commands on this local port (HTTP and WebSocket)")
+    parser.add_argument("--telemetry-host", default="127.0.0.1", help="address the telemetry server listens on")
+    parser.add_argument("--record", default=None, help="record every car's trajectory to this replay file")
+    parser.add_argument("--record-every", type=int, default=1, help="record only every Nth generation")
+
+def add_viewer_arguments(parser):
+    parser.add_argument("--ticks-per-frame", type=int, default=1, help="simulation steps per rendered frame (+ and - change it at runtime)")
+    parser.add_argument("--render-fps", type=float, default=None, help="render at this many frames per second instead, however fast the simulation runs")
+
+def build_parser():
+    # The train, view, replay and benchmark commands; run `python main.py COMMAND --help` for their options
+    parser = argparse.ArgumentParser(description="Train cars to drive around the track with a genetic algorithm.")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND", required=True)
+    train_parser = commands.add_parser("train", help="train without a window, at full CPU speed")
+    add_training_arguments(train_parser)
+    train_parser.set_defaults(headless=True)
+    view_parser = commands.add_parser("view", help="train in a window")
+    add_training_arguments(view_parser)
+    add_viewer_arguments(view_parser)
+    view_parser.set_defaults(headless=False)
+    replay_parser = commands.add_parser("replay", help="play back a replay file")
+    replay_parser.add_argument("replay", metavar="FILE", help="replay file written by --record")
+    replay_parser.add_argument("--generation", dest="replay_generation", type=int, default=None, help="play back only this generation")
+    replay_parser.add_argument("--elite", dest="replay_elite", action="store_true", help="show only each generation's best car")
+    add_viewer_arguments(replay_parser)
+    commands.add_parser("benchmark", help="time the simulation hot paths (options as for benchmark.py)", add_help=False)
+    return parser, commands
+
+def build_flag_parser():
+    # The flags-only form from before the commands: --replay plays back, --headless trains without a
+    # window, and anything else trains in one
+    parser = argparse.ArgumentParser(description="Train cars to drive around the track with a genetic algorithm.",
+                                     epilog=f"Commands: {', '.join(COMMANDS)} (python main.py COMMAND --help).")
+    parser.add_argument("--headless", action="store_true", help="run without a window, at full CPU speed")
+    add_training_arguments(parser)
+    add_viewer_arguments(parser)
+    parser.add_argument("--replay", default=None, help="play back a replay file instead of training")
+    parser.add_argument("--replay-generation", type=int, default=None, help="play back only this generation")
+    parser.add_argument("--replay-elite", action="store_true", help="show only each generation's best car")
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] == "benchmark":
+        import benchmark
+        benchmark.main(argv[1:])
+        return
+    if argv and argv[0] in COMMANDS + ("-h", "--help"):
+        parser, commands = build_parser()
+        args = parser.parse_args(argv)
+        parser = commands.choices[args.command] # Errors are reported against the command's own options
+    else:
+        parser = build_flag_parser()
+        args = parser.parse_args(argv)
+        args.command = "replay" if args.replay else "train" if args.headless else "view"
+    if args.command == "replay":
+        replay(args)
+    else:
+        train(args, parser)
+
+def train(args, parser):
+    # Trains with the command's options, in a window unless args.headless; parser reports bad combinations
+    if args.record and args.workers:
+        parser.error("--record cannot be combined with --workers")
+    if args.workers and not args.headless:
+        parser.error("--workers requires the train command (or --headless)")
+    if args.islands:
+        if not args.headless:
+            parser.error("--islands requires the train command (or --headless)")
+        if args.workers or args.record or args.checkpoint or args.resume or args.metrics or args.profile_summary or args.telemetry_port is not None:
+            parser.error("--islands cannot be combined with --workers, --record, --checkpoint, --resume, --metrics, --profile-summary or --telemetry-port")
+        if args.migrate_every < 1 or args.migrants < 0:
+            parser.error("--migrate-every must be at least 1 and --migrants at least 0")
+    if args.prefix_cache:
+        if args.workers or args.record or args.elite_bound or args.controller == "mlp":
+            parser.error("--prefix-cache cannot be combined with --workers, --record, --elite-bound or --controller mlp")
+        if args.prefix_interval < 1:
+            parser.error("--prefix-interval must be at least 1")
+    if args.eval_tracks:
+        if not args.headless:
+            parser.error("--eval-tracks requires the train command (or --headless)")
+        if args.islands or args.record or args.prefix_cache or args.elite_bound:
+            parser.error("--eval-tracks cannot be combined with --islands, --record, --prefix-cache or --elite-bound")
+        from Evaluator import make_reducer
+        try:
+            make_reducer(args.track_reducer)
+        except ValueError as error:
+            parser.error(f"--track-reducer: {error}")
+    if args.track and args.random_track:
+        parser.error("--track and --random-track cannot be combined")
+
+    # Create a track, with the resumed run's parameters if there is one
+    genes = None
+    header = None
+    track_params = {"width": SCREEN_WIDTH, "height": SCREEN_HEIGHT, "car_width": CAR_WIDTH}
+    if args.track:
+        track_params["definition"] = load_track_file(args.track)
+    elif args.random_track:
+        track_params["definition"] = random_track(args.random_track, args.track_seed)
+    if args.gate_spacing is not None and "definition" in track_params:
+        track_params["definition"]["gate_spacing"] = args.gate_spacing
+    if args.resume:
+        header, genes = load_checkpoint(args.resume)
+        track_params = header["track"]
+    track = Track(**track_params, cache_dir=CACHE_DIR)
+    if args.occupancy_resolution > 0:
+        track.build_occupancy(args.occupancy_resolution, cache_dir=CACHE_DIR)
+    try:
+        sensor = RaySensor([float(angle) for angle in args.rays.split(",")], args.ray_length, args.sensor_quantum)
+    except ValueError as error:
+        parser.error(f"--rays: {error}")
+    policy = None
+    if args.controller == "mlp":
+        policy = MLPPolicy(len(sensor) + 1, [int(units) for units in args.hidden.split(",") if units], args.episode_steps)
+    try:
+        physics = PhysicsConfig(args.dt, args.substeps, args.action_repeat, args.continuous_collision)
+    except ValueError as error:
+        parser.error(str(error))
+    if header is not None and "physics" in header:
+        physics = PhysicsConfig.from_config(header["physics"]) # Genes only mean the same with the physics they were trained with
+    pruning = None
+    if args.gate_patience is not None or args.stall_window is not None or args.elite_bound:
+        pruning = PruningPolicy(args.gate_patience, args.stall_window, args.stall_distance, args.elite_bound)
+    if header is not None:
+        # Unlike the physics, these come from the command line, so a resume has to repeat them
+        if "sensor" in header and header["sensor"] != sensor.config():
+            parser.error(f"--resume: the checkpoint was trained with the sensor {header['sensor']}, not {sensor.config()}; "
+                         "pass the same --rays, --ray-length and --sensor-quantum")
+        if "pruning" in header and header["pruning"] != (pruning.config() if pruning is not None else None):
+            parser.error(f"--resume: the checkpoint was trained with pruning {header['pruning']}, not "
+                         f"{pruning.config() if pruning is not None else None}; pass the same --gate-patience, "
+                         "--stall-window, --stall-distance and --elite-bound")
+    evolution = Evolution(NUM_CARS, seed=args.seed, policy=policy)
+    evolution.scale_gene_lengths(physics.step_time)
+    if header is not None:
+        restore_evolution(evolution, header["evolution"]) # The checkpoint's controller wins over --controller
+    if evolution.policy is None:
+        try:
+            for angle in (0, 45, -45):
+                sensor.column(angle)
+        except ValueError as error:
+            parser.error(f"--rays: {error}")
+    elif evolution.policy.inputs != len(sensor) + 1:
+        parser.error(f"--rays: the network takes {evolution.policy.inputs - 1} rays, but {len(sensor)} were given")
+    simulator = Simulator(track, evolution=evolution, pruning=pruning, sensor=sensor)
+    simulator.physics = physics
+    prefix_cache = None
+    if args.prefix_cache:
+        prefix_cache = PrefixCache(args.prefix_interval, int(args.prefix_cache * (1 << 20)))
+        simulator.prefix_cache = prefix_cache
+    if args.islands:
+        run_islands(args, track, evolution, pruning, sensor, physics, prefix_cache)
+        return
+
+    profiler = None
+    if args.metrics or args.profile_summary:
+        profiler = Profiler(args.metrics)
+        simulator.profiler = profiler
+
+    recorder = None
+    if args.record:
+        from Replay import ReplayRecorder
+        recorder = ReplayRecorder(args.record, track, (simulator.car_width, simulator.car_height), args.record_every)
+        simulator.add_observer(recorder)
+
+    checkpointer = None
+    if args.checkpoint:
+        checkpointer = Checkpointer(args.checkpoint, args.checkpoint_every)
+        simulator.add_observer(checkpointer)
+
+    telemetry = None
+    if args.telemetry_port is not None:
+        from Telemetry import TelemetryServer
+        try:
+            telemetry = TelemetryServer(args.telemetry_host, args.telemetry_port, checkpointer).start()
+        except OSError as error:
+            parser.error(f"--telemetry-port: {error}")
+        print(f"Telemetry on http://{telemetry.host}:{telemetry.port}/status and ws://{telemetry.host}:{telemetry.port}/stream")
+        simulator.add_observer(telemetry)
+
+    if args.headless:
+        if args.eval_tracks:
+            from Evaluator import MultiTrackEvaluator
+            tracks = [track]
+            for spec in args.eval_tracks:
+                try:
+                    tracks.append(Track(**eval_track_params(spec, args.gate_spacing), cache_dir=CACHE_DIR))
+                except (OSError, ValueError) as error:
+                    parser.error(f"--eval-tracks: {error}")
+                if args.occupancy_resolution > 0:
+                    tracks[-1].build_occupancy(args.occupancy_resolution, cache_dir=CACHE_DIR)
+            with MultiTrackEvaluator(tracks, args.track_reducer, args.workers, sensor=sensor,
+                                     occupancy_resolution=args.occupancy_resolution, cache_dir=CACHE_DIR) as evaluator:
+                simulator.evaluator = evaluator
+                genes = simulator.run(args.generations, genes)
+        elif args.workers:
+            from Evaluator import ProcessPoolEvaluator
+            with ProcessPoolEvaluator(track, args.workers, sensor=sensor) as evaluator:
+                simulator.evaluator = evaluator
+                genes = simulator.run(args.generations, genes)
+        else:
+            genes = simulator.run(args.generations, genes)
+        finish(checkpointer, profiler, simulator, genes, args.profile_summary, recorder, telemetry)
+        return
 
-# Calculate starting angle
-p1 = track.center_points[0]
-p2 = track.center_points[1]
-dx = p2[0] - p1[0]
-dy = p2[1] - p1[1]
-start_angle = math.degrees(math.atan2(-dy, dx))
+    import pygame
+    from Viewer import Viewer
 
+    # Initialize Pygame
+    pygame.init()
 
+    # Create the screen
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Racer")
 
-NUM_CARS = 10
+    simulator.add_observer(Viewer(screen, track, args.ticks_per_frame, args.render_fps))
+    genes = simulator.run(args.generations, genes)
+    finish(checkpointer, profiler, simulator, genes, args.profile_summary, recorder, telemetry)
 
-# Colors for cars
-CAR_COLORS = [
-    (255, 0, 0),    # Red
-    (0, 255, 0),    # Green
-    (0, 0, 255),    # Blue
-    (255, 255, 0),  # Yellow
-    (255, 0, 255),  # Magenta
-    (0, 255, 255),  # Cyan
-    (255, 128, 0),  # Orange
-    (128, 0, 255),  # Purple
-    (0, 128, 255),  # Light Blue
-    (139, 69, 19)   # Brown
-]
-
-# Function to initialize/reset cars for a new generation
-def reset_cars(current_cars=None):
-    new_cars = []
-    global last_best_score, generations_since_last_improvement, gene_length
-
-    if current_cars:
-        # Sort cars by score to select the best
-        current_cars.sort(key=lambda car: (car.score, car.distance_traveled), reverse=True)
-        best_car = current_cars[0]
-        print(f"Best car score: {best_car.score} gates, {best_car.distance_traveled:.2f} distance")
-
-        # Adjust score to heavily penalize not passing gates and reward faster completion
-        adjusted_score = best_car.score * 1000000 - best_car.time_taken # Gates are worth much more, time taken is subtracted
-
-        if adjusted_score > last_best_score:
-            last_best_score = adjusted_score
-            generations_since_last_improvement = 0
-        else:
-            generations_since_last_improvement += 1
-
-        # Adjust mutation rate based on improvement
-        base_mutation_rate = 0.05
-        max_mutation_rate = 0.7 # Increased max mutation rate
-        mutation_increase_factor = 0.05 # Increased how much mutation increases per stuck generation
-
-        dynamic_mutation_rate = base_mutation_rate + (generations_since_last_improvement * mutation_increase_factor)
-        if generations_since_last_improvement >= 1: # Trigger earlier
-            dynamic_mutation_rate += 0.1 # Additional jump for sustained lack of improvement
-        if dynamic_mutation_rate > max_mutation_rate:
-            dynamic_mutation_rate = max_mutation_rate
-
-        # If stuck for too long, increase preserved mutation rate slightly
-        mutation_rate_preserved = 0.02 # Increased preserved mutation rate
-        if generations_since_last_improvement > 1: # Trigger earlier
-            mutation_rate_preserved = 0.05 # Increase preserved mutation slightly
-
-        # Determine the point up to which the best car successfully navigated
-        # This is the length of its gene that was actually executed before it became inactive
-        # If the best car completed its gene, then the collision_point is the full gene length
-        collision_point = best_car.current_gene_index
-        if not best_car.is_active and best_car.has_collided_with_wall: # If car collided with wall
-            pass # collision_point is already set to current_gene_index
-        elif not best_car.is_active and not best_car.has_collided_with_wall: # If car became inactive due to gene running out
-            collision_point = len(best_car.gene)
-            # If the best car ran out of gene, increase gene_length for next generation
-            gene_length = min(gene_length + 1000, 100000) # Increase gene length, with a cap
-        elif best_car.is_active: # If car is still active (shouldn't happen if simulation ended)
-            collision_point = len(best_car.gene)
-
-        # Elitism: Carry over the best car without mutation
-        # Truncate the best car's gene to its effective length
-        effective_gene = list(best_car.gene[:collision_point])
-        new_cars.append(Car(track.center_points[0][0], track.center_points[0][1], angle=start_angle, color=CAR_COLORS[0], gene=effective_gene))
-        new_cars[0].reset(track.center_points[0][0], track.center_points[0][1], start_angle) # Reset car state
-
-        # Mutation rate step for later cars
-        mutation_rate_step = (max_mutation_rate - dynamic_mutation_rate) / (NUM_CARS - 1) # Distribute remaining mutation range
-
-        for i in range(1, NUM_CARS): # Start from 1 for the rest of the cars
-            new_gene = list(effective_gene) # Copy the effective gene
-            
-            # Calculate car-specific mutation rate
-            car_specific_mutation_rate = dynamic_mutation_rate + (i * mutation_rate_step)
-            if car_specific_mutation_rate > max_mutation_rate:
-                car_specific_mutation_rate = max_mutation_rate
-
-            # Extend the gene with random actions if it's shorter than the initial gene length
-            # This ensures new cars have enough actions to potentially go further
-            while len(new_gene) < gene_length:
-                new_gene.append((random.choice([True, False]),
-                                 random.choice([True, False]),
-                                 random.choice([True, False]),
-                                 random.choice([True, False])))
-
-            for j in range(len(new_gene)):
-                current_mutation_rate = car_specific_mutation_rate
-                if j < collision_point: # Protect the successful part of the gene
-                    current_mutation_rate = mutation_rate_preserved
-
-                if random.random() < current_mutation_rate:
-                    new_gene[j] = (random.choice([True, False]),
-                                   random.choice([True, False]),
-                                   random.choice([True, False]),
-                                   random.choice([True, False]))
-            new_cars.append(Car(track.center_points[0][0], track.center_points[0][1], angle=start_angle, color=CAR_COLORS[i % len(CAR_COLORS)], gene=new_gene))
-            new_cars[i].reset(track.center_points[0][0], track.center_points[0][1], start_angle) # Reset car state
-    else:
-        # Initial generation: create cars with random genes
-        gene_length = 1000 # Define gene_length for initial generation
-        for i in range(NUM_CARS):
-            new_cars.append(Car(track.center_points[0][0], track.center_points[0][1], angle=start_angle, color=CAR_COLORS[i % len(CAR_COLORS)]))
-            new_cars[i].gene = [] # Clear existing gene if any
-            for _ in range(gene_length):
-                accelerate = random.choice([True, False])
-                decelerate = random.choice([True, False])
-                turn_left = random.choice([True, False])
-                turn_right = random.choice([True, False])
-                new_cars[i].gene.append((accelerate, decelerate, turn_left, turn_right))
-            
-            # Ensure initial forward movement for the first action
-            new_cars[i].gene[0] = (True, False, False, False)
-    return new_cars
-
-cars = reset_cars() # Initialize the first generation
-gene_length = 5000 # Define gene_length globally
-simulation_steps = 0
-MAX_SIMULATION_STEPS = 999999999 # Effectively no limit
-generation_number = 1 # Initialize generation number
-last_best_score = -1 # Track the best score from previous generations
-generations_since_last_improvement = 0 # Track generations without score improvement
-
-# Game loop
-running = True
-while running:
-    # Event handling (only for quitting the game)
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-        if event.type == pygame.KEYDOWN:
-            if event.key == pygame.K_SPACE:
-                cars = reset_cars(cars)
-                simulation_steps = 0 # Reset simulation steps for new generation
-                generation_number += 1 # Increment generation number
-
-    # Update all cars
-    screen.fill(BLACK) # Clear screen once per frame
-    track.draw(screen) # Draw track once per frame
-
-    all_cars_finished = True
-    for i, car in enumerate(cars):
-        if car.is_active: # Only update active cars
-            # print(f"Main: Updating Car {i+1}") # Removed for performance
-            if car.current_gene_index < len(car.gene): # Only update if car still has actions in its gene
-                accelerate, decelerate, turn_left, turn_right = car.decide_actions(track)
-                # print(f"Main: Car {i+1} actions: Accel={accelerate}, Decel={decelerate}, TurnL={turn_left}, TurnR={turn_right}") # Removed for performance
-                car.update(SCREEN_WIDTH, SCREEN_HEIGHT, track, accelerate, decelerate, turn_left, turn_right)
-            else:
-                car.is_active = False # Car becomes inactive if gene runs out
-            all_cars_finished = False
-        car.draw(screen)
-
-        # Display score for each car (for debugging/visualization)
-        font = pygame.font.Font(None, 24) # Smaller font for multiple scores
-        text = font.render(f"Score: {car.score}", True, (255, 255, 255))
-        text_rect = text.get_rect(topleft=(30, 10 + i * 20))
-        screen.blit(text, text_rect)
-
-        # Draw color box next to score
-        color_box_size = 15
-        color_box_rect = pygame.Rect(10, text_rect.centery - color_box_size // 2, color_box_size, color_box_size)
-        pygame.draw.rect(screen, car.image.get_at((0,0)), color_box_rect)
-
-    # Display generation number
-    gen_font = pygame.font.Font(None, 30)
-    gen_text = gen_font.render(f"Generation: {generation_number}", True, (255, 255, 255))
-    screen.blit(gen_text, (SCREEN_WIDTH - gen_text.get_width() - 10, 10))
-    
-    if all(not car.is_active or car.has_collided_with_wall for car in cars) or simulation_steps >= MAX_SIMULATION_STEPS:
-        cars = reset_cars(cars)
-        simulation_steps = 0
-        generation_number += 1 # Increment generation number
-
-    simulation_steps += 1
-
-    # Update the display
-    pygame.display.flip()
-
-    # Cap the frame rate
-    pygame.time.Clock().tick(1000) # Increased frame rate for faster simulation
-
-# Quit Pygame
-pygame.quit()
\ No newline at end of file
+    # Quit Pygame
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import numpy as np
+from Gene import Gene, NUM_CODES
+from Policy import GENOME_DTYPE
+
+# Upper bound on the number of gene steps drawn per block, so large generations never allocate
+# num_children * gene_length random numbers at once
+BLOCK_STEPS = 1 << 22
+
+def mutation_schedule(num_cars, dynamic_mutation_rate, max_mutation_rate):
+    # Car-specific mutation rates for children 1..num_cars-1: spread from the dynamic rate up to the max rate
+    mutation_rate_step = (max_mutation_rate - dynamic_mutation_rate) / (num_cars - 1) # Distribute remaining mutation range
+    rates = dynamic_mutation_rate + np.arange(1, num_cars) * mutation_rate_step
+    return np.minimum(rates, max_mutation_rate)
+
+def make_offspring(elite, collision_point, gene_length, rates, mutation_rate_preserved, rng):
+    # Returns the next generation: the elite unchanged, followed by one child per entry in rates.
+    # Each child is the elite padded with random actions up to gene_length, then every step is
+    # replaced by a random action with probability mutation_rate_preserved before collision_point
+    # and with the child's own rate from there on.
+    length = max(len(elite), gene_length)
+    children = np.empty((len(rates), length), dtype=np.uint8)
+    children[:, :len(elite)] = elite.codes
+
+    rates = np.asarray(rates, dtype=float)[:, None]
+    protected = np.arange(length) < collision_point # Protect the successful part of the gene
+
+    block_rows = max(1, BLOCK_STEPS // max(length, 1))
+    for start in range(0, len(rates), block_rows):
+        block = children[start:start + block_rows]
+        block[:, len(elite):] = rng.integers(0, NUM_CODES, (len(block), length - len(elite)), dtype=np.uint8)
+        # Same per-step probabilities as mutating each child one step at a time
+        step_rates = np.where(protected, mutation_rate_preserved, rates[start:start + block_rows])
+        mutated = rng.random(block.shape) < step_rates
+        block[mutated] = rng.integers(0, NUM_CODES, np.count_nonzero(mutated), dtype=np.uint8)
+
+    return [elite] + [Gene(child) for child in children]
+
+def make_policy_offspring(policy, parents, rates, rng):
+    # Returns the next generation of network genomes: the elite (parents[0]) unchanged, followed by one
+    # child per entry in rates. Each child crosses the elite with a parent drawn from parents, taking
+    # every neuron's incoming weights and bias from one or the other, then adds Gaussian noise of
+    # policy.mutation_scale to each weight with probability equal to the child's rate.
+    elite = np.asarray(parents[0], dtype=GENOME_DTYPE)
+    partners = np.stack(parents).astype(GENOME_DTYPE)[rng.integers(0, len(parents), len(rates))]
+    from_partner = rng.random((len(rates), policy.num_units)) < 0.5
+    children = np.where(from_partner[:, policy.unit_ids], partners, elite)
+
+    mutated = rng.random(children.shape) < np.asarray(rates, dtype=float)[:, None]
+    noise = rng.normal(0, policy.mutation_scale, np.count_nonzero(mutated)).astype(GENOME_DTYPE)
+    children[mutated] += noise
+    return [elite] + list(children)
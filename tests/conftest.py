@@ -0,0 +1,33 @@
+import os
+import sys
+
+# The modules live at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from Evolution import Evolution
+
+def short_evolution(seed, num_cars=10):
+    # Short genes that grow slowly, so a few generations take seconds
+    evolution = Evolution(num_cars, initial_gene_length=200, gene_length=300, seed=seed)
+    evolution.gene_length_step = 100
+    return evolution
+
+def run_generations(simulator, generations, genes=None):
+    # Fitness of each generation and the genes that follow it, the way Simulator.run steps through them
+    if genes is None:
+        genes = simulator.evolution.initial_genes()
+    history = []
+    for _ in range(generations):
+        fitness = simulator.run_generation(genes)
+        genes = simulator.evolution.next_generation(genes, fitness)
+        history.append((fitness, genes))
+    return history
+
+@pytest.fixture
+def evolve():
+    return run_generations
+
+@pytest.fixture
+def new_evolution():
+    return short_evolution
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import main
+from Track import Track
+from Simulator import Simulator
+from Pruning import PruningPolicy
+from Sensors import RaySensor
+from Physics import PhysicsConfig
+from Checkpoint import Checkpointer, load_checkpoint, restore_evolution, DATA_ALIGNMENT
+
+def make_simulator(evolution):
+    track = Track(800, 600, 40)
+    track.build_occupancy(1.0)
+    simulator = Simulator(track, evolution=evolution, pruning=PruningPolicy(gate_patience=15), sensor=RaySensor())
+    simulator.physics = PhysicsConfig(action_repeat=2)
+    return simulator
+
+def test_resumed_run_matches_uninterrupted_run(evolve, new_evolution, tmp_path):
+    # Saving after two generations, loading into a fresh evolution and carrying on must breed the same genes
+    expected = evolve(make_simulator(new_evolution(11)), 4)
+
+    simulator = make_simulator(new_evolution(11))
+    genes = evolve(simulator, 2)[-1][1]
+    checkpointer = Checkpointer(str(tmp_path / "run.ckpt"), every=0)
+    checkpointer.close()
+    checkpointer.save_now(simulator.evolution, genes, simulator.track, simulator.physics, simulator.sensor, simulator.pruning)
+
+    header, loaded = load_checkpoint(str(tmp_path / "run.ckpt"))
+    assert loaded == genes
+    assert isinstance(loaded[0].codes.base, np.memmap) # A view of the file, not a copy
+    assert loaded[0].codes.ctypes.data % DATA_ALIGNMENT == 0
+    assert header["sensor"] == simulator.sensor.config() and header["pruning"] == simulator.pruning.config()
+    assert PhysicsConfig.from_config(header["physics"]).config() == simulator.physics.config()
+
+    evolution = new_evolution(None) # Its random state has to come from the checkpoint
+    restore_evolution(evolution, header["evolution"])
+    resumed = make_simulator(evolution)
+    actual = evolve(resumed, 2, loaded)
+    for (expected_fitness, expected_genes), (fitness, genes) in zip(expected[2:], actual):
+        assert fitness == expected_fitness
+        assert genes == expected_genes
+
+TRAINED = ["--stall-window", "50"]
+
+def train(*flags):
+    main.main(["train", "--generations", "1", "--seed", "1", "--action-repeat", "4", "--checkpoint", "run.ckpt"] + list(flags))
+
+@pytest.mark.parametrize("flags", [["--rays", "0,45,-45,90"] + TRAINED, ["--ray-length", "400"] + TRAINED,
+                                   ["--stall-window", "60"], []], ids=["rays", "ray-length", "pruning", "no-pruning"])
+def test_resume_rejects_different_settings(tmp_path, monkeypatch, capsys, flags):
+    monkeypatch.chdir(tmp_path) # The track caches go to the working directory
+    train(*TRAINED)
+    with pytest.raises(SystemExit) as error:
+        train("--resume", "run.ckpt", *flags)
+    assert error.value.code == 2
+    assert "--resume: the checkpoint was trained with" in capsys.readouterr().err
+    train("--resume", "run.ckpt", *TRAINED) # The same settings resume fine
+    assert load_checkpoint("run.ckpt")[0]["evolution"]["generation_number"] == 3
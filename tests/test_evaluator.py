@@ -0,0 +1,38 @@
+import pytest
+from Track import Track
+from TrackDefinitions import random_track
+from Simulator import Simulator
+from Pruning import PruningPolicy
+from Evaluator import ProcessPoolEvaluator, MultiTrackEvaluator
+
+def make_track(definition=None, cache_dir=None):
+    track = Track(800, 600, 40, definition=definition, cache_dir=cache_dir)
+    track.build_occupancy(1.0, cache_dir=cache_dir)
+    return track
+
+def assert_same_history(expected, actual):
+    for (expected_fitness, expected_genes), (fitness, genes) in zip(expected, actual):
+        assert fitness == expected_fitness
+        assert genes == expected_genes
+
+@pytest.mark.parametrize("pruning", [None, PruningPolicy(gate_patience=15, stall_window=40, elite_bound=True)], ids=["plain", "pruned"])
+def test_process_pool_matches_serial_run(evolve, new_evolution, pruning):
+    # Splitting a generation across workers must not change its fitness or the genes bred from it
+    track = make_track()
+    expected = evolve(Simulator(track, evolution=new_evolution(3), pruning=pruning), 3)
+    simulator = Simulator(track, evolution=new_evolution(3), pruning=pruning)
+    with ProcessPoolEvaluator(track, workers=2) as evaluator:
+        simulator.evaluator = evaluator
+        actual = evolve(simulator, 3)
+    assert_same_history(expected, actual)
+
+def test_multi_track_workers_match_in_process(evolve, new_evolution, tmp_path):
+    # Per-track chunks finish in any order across workers; the combined fitness must not depend on it
+    tracks = [make_track(cache_dir=tmp_path), make_track(random_track(64, seed=5), cache_dir=tmp_path)]
+    history = []
+    for workers in (0, 2):
+        simulator = Simulator(tracks[0], evolution=new_evolution(4))
+        with MultiTrackEvaluator(tracks, "min", workers, occupancy_resolution=1.0, cache_dir=tmp_path) as evaluator:
+            simulator.evaluator = evaluator
+            history.append(evolve(simulator, 3))
+    assert_same_history(*history)
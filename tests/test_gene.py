@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+from Gene import Gene, NUM_CODES
+
+def test_from_actions_round_trips_tuples():
+    actions = [(bool(code & 1), bool(code & 2), bool(code & 4), bool(code & 8)) for code in range(NUM_CODES)]
+    gene = Gene.from_actions(actions)
+    assert len(gene) == NUM_CODES
+    np.testing.assert_array_equal(gene.codes, np.arange(NUM_CODES))
+    assert [gene[i] for i in range(len(gene))] == actions
+
+@pytest.mark.parametrize("actions", [[1, 2, 3, 4], [[1, 0, 1]], np.zeros((2, 4, 1))])
+def test_from_actions_rejects_other_shapes(actions):
+    # Flat action codes must not be regrouped into bool quads
+    with pytest.raises(ValueError):
+        Gene.from_actions(actions)
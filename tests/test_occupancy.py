@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from Track import Track
+from TrackDefinitions import random_track
+
+TRACKS = {
+    "ellipse": None,
+    "random": random_track(64, seed=5),
+}
+
+@pytest.fixture(scope="module", params=sorted(TRACKS))
+def track(request):
+    return Track(800, 600, 40, definition=TRACKS[request.param])
+
+def grid_points(track, step):
+    # A dense grid over the whole screen, offset so points land at every position within a raster cell,
+    # plus every boundary vertex, where the crossing test has its ties
+    xs, ys = np.meshgrid(np.arange(-5, track.width + 5, step), np.arange(-5, track.height + 5, step))
+    vertices = np.array(track.outer_points + track.inner_points)
+    return np.concatenate([xs.ravel(), vertices[:, 0]]), np.concatenate([ys.ravel(), vertices[:, 1]])
+
+@pytest.mark.parametrize("resolution", [1.0, 2.5])
+def test_exact_raster_matches_polygon_test(track, resolution):
+    xs, ys = grid_points(track, 0.7)
+    expected = track.polygon_is_on_track_batch(xs, ys)
+    raster = track.build_occupancy(resolution)
+    try:
+        np.testing.assert_array_equal(raster.contains_batch(xs, ys), expected)
+        picks = np.random.default_rng(2).integers(0, len(xs), 2000)
+        assert [raster.contains((xs[i], ys[i])) for i in picks] == expected[picks].tolist()
+    finally:
+        track.occupancy = None
+    assert expected.any() and not expected.all()
+
+def test_edge_bands_match_point_in_polygon(track):
+    # The banded crossing test must agree with the full polygon scan, vertices and all
+    xs, ys = grid_points(track, 9.3)
+    for bands, polygon in ((track.outer_bands, track.outer_points), (track.inner_bands, track.inner_points)):
+        expected = [track.point_in_polygon(point, polygon) for point in zip(xs, ys)]
+        assert [bands.contains(point) for point in zip(xs, ys)] == expected
+        np.testing.assert_array_equal(bands.contains_batch(xs, ys), expected)
+        assert any(expected) and not all(expected)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from Track import Track
+from TrackDefinitions import random_track
+from Car import Car
+from Population import Population
+from Physics import PhysicsConfig
+from Gene import Gene, NUM_CODES
+
+TRACKS = {
+    "ellipse": None,
+    "random": random_track(64, seed=5),
+}
+
+PHYSICS = {
+    "default": PhysicsConfig(),
+    "coarse": PhysicsConfig(dt=2, substeps=2, action_repeat=2, continuous=True),
+}
+
+@pytest.fixture(scope="module", params=[(name, resolution) for name in sorted(TRACKS) for resolution in (1.0, 0)],
+                ids=lambda param: f"{param[0]}-{'raster' if param[1] else 'polygon'}")
+def track(request):
+    name, resolution = request.param
+    track = Track(800, 600, 40, definition=TRACKS[name])
+    if resolution:
+        track.build_occupancy(resolution)
+    return track
+
+def make_genes(count, length, seed):
+    # Every action code is drawn, so all turn and brake combinations get driven
+    rng = np.random.default_rng(seed)
+    return [Gene(rng.integers(0, NUM_CODES, length, dtype=np.uint8)) for _ in range(count)]
+
+@pytest.mark.parametrize("physics", sorted(PHYSICS))
+def test_population_matches_car_every_step(track, physics):
+    # The batched stepper has to drive every car exactly like the Car class, step for step
+    physics = PHYSICS[physics]
+    x, y, angle = track.get_start_pose()
+    genes = make_genes(20, 300, seed=1)
+    assert all(len(gene) == 300 for gene in genes)
+    population = Population(track, genes, x, y, angle, physics=physics)
+    cars = [Car(x, y, angle, gene=gene, physics=physics) for gene in genes]
+    steps = 0
+    while not population.is_done():
+        population.step()
+        for car in cars:
+            if not car.is_active:
+                continue
+            if car.current_gene_index >= len(car.gene):
+                car.is_active = False
+                continue
+            car.update(track.width, track.height, track, *car.decide_actions(track))
+        for i, car in enumerate(cars):
+            assert (population.x[i], population.y[i], population.angle[i]) == (car.x, car.y, car.angle), (steps, i)
+            assert (population.score[i], population.time_taken[i]) == (car.score, car.time_taken), (steps, i)
+            assert bool(population.active[i]) == car.is_active, (steps, i)
+        steps += 1
+    assert not any(car.is_active for car in cars)
+    assert steps > 10
+
+def brute_force_ray(track, origin, angle, max_len):
+    # Closest hit of the ray against every boundary segment, without the grid
+    x, y = origin
+    dx = max_len * np.cos(np.radians(angle))
+    dy = -max_len * np.sin(np.radians(angle))
+    starts = track.geometry.segment_starts
+    directions = track.geometry.segment_ends - starts
+    best = max_len
+    for (sx, sy), (ex, ey) in zip(starts, directions):
+        denominator = dx * ey - dy * ex
+        if denominator == 0:
+            continue
+        t = ((sx - x) * ey - (sy - y) * ex) / denominator # Along the ray
+        u = ((sx - x) * dy - (sy - y) * dx) / denominator # Along the segment
+        if 0 <= t <= 1 and 0 <= u <= 1:
+            best = min(best, t * max_len)
+    return best
+
+def test_cast_rays_finds_nearest_hit(track):
+    rng = np.random.default_rng(3)
+    centers = np.array(track.center_points)
+    picks = centers[rng.integers(0, len(centers), 200)] + rng.uniform(-15, 15, (200, 2))
+    angles = rng.uniform(-180, 180, 200)
+    distances = track.cast_rays(picks, angles, 500)
+    expected = [brute_force_ray(track, origin, angle, 500) for origin, angle in zip(picks, angles)]
+    np.testing.assert_allclose(distances, expected, rtol=1e-9, atol=1e-9)
+    assert (distances < 500).any()
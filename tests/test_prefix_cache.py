@@ -0,0 +1,24 @@
+import pytest
+from Track import Track
+from Simulator import Simulator
+from Pruning import PruningPolicy
+from PrefixCache import PrefixCache
+
+def make_simulator(evolution, pruning, prefix_cache):
+    track = Track(800, 600, 40)
+    track.build_occupancy(1.0)
+    simulator = Simulator(track, evolution=evolution, pruning=pruning)
+    simulator.prefix_cache = prefix_cache
+    return simulator
+
+@pytest.mark.parametrize("pruning", [None, PruningPolicy(gate_patience=15, stall_window=40)], ids=["plain", "pruned"])
+def test_prefix_cache_reproduces_uncached_run(evolve, new_evolution, pruning):
+    # Resuming cars from cached prefix states must not change a single score or gene
+    expected = evolve(make_simulator(new_evolution(7), pruning, None), 4)
+    cache = PrefixCache(interval=10)
+    actual = evolve(make_simulator(new_evolution(7), pruning, cache), 4)
+    assert cache.hits > 0 and cache.steps_skipped > 0
+    assert pruning is None or any(car[5] for fitness, _ in expected for car in fitness)
+    for (expected_fitness, expected_genes), (fitness, genes) in zip(expected, actual):
+        assert fitness == expected_fitness
+        assert genes == expected_genes
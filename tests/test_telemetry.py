@@ -0,0 +1,123 @@
+import base64
+import http.client
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import pytest
+from Track import Track
+from Evolution import Evolution
+from Simulator import Simulator
+from Telemetry import TelemetryServer
+
+@pytest.fixture
+def simulator():
+    track = Track(800, 600, 40)
+    track.build_occupancy(1.0)
+    return Simulator(track, evolution=Evolution(4, initial_gene_length=50, seed=1))
+
+@pytest.fixture
+def server():
+    telemetry = TelemetryServer(port=0, interval=0.0).start()
+    yield telemetry
+    telemetry.close()
+
+def request(server, method, path):
+    connection = http.client.HTTPConnection(server.host, server.port, timeout=5)
+    connection.request(method, path)
+    response = connection.getresponse()
+    body = json.loads(response.read())
+    connection.close()
+    return response.status, body
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+def test_status_and_control_endpoints(server, simulator):
+    simulator.add_observer(server)
+    worker = threading.Thread(target=simulator.run, daemon=True)
+    worker.start()
+    wait_for(lambda: server.steps > 0)
+
+    status, body = request(server, "GET", "/status")
+    assert status == 200
+    assert body["paused"] is False
+    wait_for(lambda: "step" in request(server, "GET", "/status")[1]["latest"])
+
+    assert request(server, "POST", "/control/pause") == (200, {"type": "control", "command": "pause", "ok": True})
+    wait_for(lambda: request(server, "GET", "/status")[1]["latest"].get("paused") is not None)
+    steps = server.steps
+    time.sleep(0.2)
+    assert server.steps == steps # Blocked in on_step
+    assert request(server, "GET", "/status")[1]["paused"] is True
+
+    assert request(server, "POST", "/control/skip")[0] == 200
+    assert request(server, "POST", "/control/resume")[0] == 200
+    wait_for(lambda: server.steps > steps)
+
+    status, body = request(server, "POST", "/control/nonsense")
+    assert status == 400
+    assert body["ok"] is False
+    assert request(server, "GET", "/nowhere")[0] == 404
+
+    simulator.running = False
+    worker.join(5)
+    assert not worker.is_alive()
+
+def test_skip_between_generations_applies_to_the_next_one(server, simulator):
+    simulator.add_observer(server)
+    genes = simulator.evolution.initial_genes()
+    simulator.run_generation(genes)
+    full = simulator.simulation_steps
+    assert full > 1
+    assert server.command("skip")["ok"]
+    simulator.run_generation(genes)
+    assert simulator.simulation_steps == 1 # Survived spawn() and ended the generation after its first step
+    simulator.run_generation(genes)
+    assert simulator.simulation_steps == full # Used up
+
+def websocket_frame(text):
+    # A masked client text frame
+    payload = text.encode("utf-8")
+    mask = os.urandom(4)
+    masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    return struct.pack(">BB", 0x81, 0x80 | len(payload)) + mask + masked
+
+def read_frame(sock):
+    header = sock.recv(2, socket.MSG_WAITALL)
+    length = header[1] & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", sock.recv(2, socket.MSG_WAITALL))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", sock.recv(8, socket.MSG_WAITALL))[0]
+    return header[0] & 0x0F, sock.recv(length, socket.MSG_WAITALL)
+
+def test_websocket_command_round_trip(server):
+    server.publish({"type": "generation", "generation": 0})
+    wait_for(lambda: "generation" in request(server, "GET", "/status")[1]["latest"])
+    with socket.create_connection((server.host, server.port), timeout=5) as sock:
+        key = base64.b64encode(os.urandom(16)).decode("ascii")
+        sock.sendall((f"GET /stream HTTP/1.1\r\nHost: localhost\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode("ascii"))
+        response = b""
+        while not response.endswith(b"\r\n\r\n"):
+            response += sock.recv(1)
+        assert response.startswith(b"HTTP/1.1 101")
+
+        opcode, payload = read_frame(sock) # The latest state comes first
+        assert opcode == 0x1
+        assert json.loads(payload)["type"] == "generation"
+
+        sock.sendall(websocket_frame(json.dumps({"command": "pause"})))
+        opcode, payload = read_frame(sock)
+        assert json.loads(payload) == {"type": "control", "command": "pause", "ok": True}
+        assert not server.running.is_set()
+
+        sock.sendall(websocket_frame("resume"))
+        assert json.loads(read_frame(sock)[1])["ok"] is True
+        assert server.running.is_set()
@@ -0,0 +1,144 @@
+import argparse
+import json
+import math
+import sys
+import time
+import numpy as np
+from Track import Track
+from Population import Population
+from Physics import PhysicsConfig
+from Gene import Gene
+from TrackDefinitions import load_track_file, random_track
+
+# Same track as benchmark.py unless one is given
+TRACK_PARAMS = {"width": 800, "height": 600, "car_width": 40}
+DEFAULT_CONFIGS = "2:1:1,2:2:1,1:1:2,3:3:1,1:1:3"
+
+def parse_config(text, continuous):
+    # "dt:substeps:action_repeat", trailing fields optional
+    fields = text.split(":")
+    if not 1 <= len(fields) <= 3:
+        raise ValueError(f"Bad physics config {text!r}, expected dt[:substeps[:action_repeat]]")
+    dt = float(fields[0])
+    substeps = int(fields[1]) if len(fields) > 1 else 1
+    action_repeat = int(fields[2]) if len(fields) > 2 else 1
+    return PhysicsConfig(dt, substeps, action_repeat, continuous)
+
+def drive(track, physics, frames):
+    # Drives one car with the rule-based controller alone (a gene of no-op actions) for the given number
+    # of frames of simulated time, and returns its path sampled after every step along with the results
+    steps = math.ceil(frames / physics.step_time)
+    x, y, angle = track.get_start_pose()
+    population = Population(track, [Gene(np.zeros(steps, dtype=np.uint8))], x, y, angle, physics=physics)
+    times, xs, ys = [0.0], [float(x)], [float(y)]
+    first_lap = None
+    start = time.perf_counter()
+    while not population.is_done():
+        population.step()
+        times.append(float(population.time_taken[0]) * physics.step_time)
+        xs.append(float(population.x[0]))
+        ys.append(float(population.y[0]))
+        if first_lap is None and population.score[0] >= len(track.gates):
+            first_lap = times[-1]
+    elapsed = time.perf_counter() - start
+    result = {
+        "physics": physics.config(),
+        "steps": int(population.time_taken[0]),
+        "frames": times[-1],
+        "laps": int(population.score[0]) // len(track.gates),
+        "gates": int(population.score[0]),
+        "first_lap_frames": first_lap,
+        "crashed": bool(population.collided[0]),
+        "distance": float(population.distance_traveled[0]),
+        "seconds": elapsed,
+    }
+    return result, (np.array(times), np.array(xs), np.array(ys))
+
+def deviation(path, reference, until=None):
+    # Largest distance between the car and the reference car at the same simulated time, over the time
+    # both were still driving (and up to until, if given); the reference is interpolated between its frames
+    times, xs, ys = path
+    ref_times, ref_xs, ref_ys = reference
+    shared = times <= min(times[-1], ref_times[-1], math.inf if until is None else until)
+    ref_x = np.interp(times[shared], ref_times, ref_xs)
+    ref_y = np.interp(times[shared], ref_times, ref_ys)
+    return float(np.max(np.hypot(xs[shared] - ref_x, ys[shared] - ref_y)))
+
+def lap_time_error(result, reference):
+    # First-lap time difference as a fraction of the reference's; 0 when neither finished a lap
+    if result["first_lap_frames"] is None or reference["first_lap_frames"] is None:
+        return 0.0 if result["first_lap_frames"] == reference["first_lap_frames"] else math.inf
+    return abs(result["first_lap_frames"] - reference["first_lap_frames"]) / reference["first_lap_frames"]
+
+def validate(track, configs, frames, tolerance, continuous, max_deviation):
+    # Every config is compared with dt=1, substeps=1, action_repeat=1. It passes when it crashes exactly when
+    # the reference does and completes as many laps, its distance and first-lap time are within tolerance
+    # (a fraction) of the reference's, and it stays within max_deviation pixels of the reference car over the
+    # reference's first lap. Later on, a few frames of lag put the cars far apart on the same line.
+    reference, reference_path = drive(track, PhysicsConfig(continuous=continuous), frames)
+    reference.update(deviation=0.0, distance_error=0.0, lap_time_error=0.0, speedup=1.0, ok=True)
+    results = [reference]
+    for physics in configs:
+        result, path = drive(track, physics, frames)
+        result["deviation"] = deviation(path, reference_path, reference["first_lap_frames"])
+        result["distance_error"] = abs(result["distance"] - reference["distance"]) / reference["distance"]
+        result["lap_time_error"] = lap_time_error(result, reference)
+        result["speedup"] = reference["seconds"] / result["seconds"] if result["seconds"] else math.inf
+        result["ok"] = (result["crashed"] == reference["crashed"] and result["laps"] == reference["laps"]
+                        and result["distance_error"] <= tolerance and result["lap_time_error"] <= tolerance
+                        and result["deviation"] <= max_deviation)
+        results.append(result)
+    return results
+
+def print_table(results):
+    print(f"{'dt:sub:rep':<12}{'laps':>6}{'1st lap':>10}{'crash':>7}{'distance':>11}{'dist err':>10}{'lap dev':>10}{'speedup':>9}  status", file=sys.stderr)
+    for result in results:
+        physics = result["physics"]
+        name = f"{physics['dt']:g}:{physics['substeps']}:{physics['action_repeat']}"
+        first_lap = f"{result['first_lap_frames']:g}" if result["first_lap_frames"] is not None else "-"
+        print(f"{name:<12}{result['laps']:>6}{first_lap:>10}{'yes' if result['crashed'] else 'no':>7}{result['distance']:>11.1f}"
+              f"{result['distance_error']:>10.2%}{result['deviation']:>10.1f}{result['speedup']:>8.2f}x  {'ok' if result['ok'] else 'FAIL'}",
+              file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="Check coarser physics settings against the frame-by-frame reference.")
+    parser.add_argument("--configs", default=DEFAULT_CONFIGS, help="comma-separated dt:substeps:action_repeat settings to check")
+    parser.add_argument("--frames", type=float, default=3000, help="simulated time to drive, in frames")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="allowed distance and first-lap time difference from the reference, as a fraction")
+    parser.add_argument("--max-deviation", type=float, default=None, help="allowed distance in pixels from the reference car during its first lap (default: the track width)")
+    parser.add_argument("--continuous-collision", action="store_true", help="sweep the cars' corners, in the reference too")
+    parser.add_argument("--track", default=None, help="JSON track definition file (default: the built-in ellipse)")
+    parser.add_argument("--random-track", type=int, default=None, metavar="VERTICES", help="generate a random track with this many control points")
+    parser.add_argument("--track-seed", type=int, default=None, help="seed for --random-track")
+    parser.add_argument("--output", default=None, help="write the results as JSON to this file (default: stdout)")
+    args = parser.parse_args()
+
+    try:
+        configs = [parse_config(text, args.continuous_collision) for text in args.configs.split(",") if text]
+    except ValueError as error:
+        parser.error(f"--configs: {error}")
+    track_params = dict(TRACK_PARAMS)
+    if args.track:
+        track_params["definition"] = load_track_file(args.track)
+    elif args.random_track:
+        track_params["definition"] = random_track(args.random_track, args.track_seed)
+    track = Track(**track_params)
+    track.build_occupancy(1.0)
+
+    max_deviation = track.track_width if args.max_deviation is None else args.max_deviation
+    results = validate(track, configs, args.frames, args.tolerance, args.continuous_collision, max_deviation)
+    print_table(results)
+    text = json.dumps({"frames": args.frames, "tolerance": args.tolerance, "max_deviation": max_deviation, "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    failures = [result for result in results if not result["ok"]]
+    if failures:
+        print(f"{len(failures)} setting(s) outside the {args.tolerance:.0%} tolerance or {max_deviation:g} px deviation", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()